@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compare batched and per-record DNS writes against a local mock Cloudflare API.
+
+For each domain count the zone is seeded with records at an old IP, half of
+the domains already exist (updates) and half are new (creates), and one
+sync is run with the batch endpoint enabled, with it unavailable (fallback)
+and with batching turned off.
+
+    python benchmarks/bench_batch_writes.py --domains 10 100 1000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_cloudflare import MockCloudflare, start_server
+
+MODES = [
+    # (label, CF_BATCH, batch endpoint available)
+    ("batch", "true", True),
+    ("batch unavailable", "true", False),
+    ("per-record", "false", True),
+]
+
+def run(domains, latency, batch_size):
+    import main
+
+    print(f"{'domains':>8} {'mode':<18} {'requests':>9} {'wall (s)':>9} {'created':>8} {'updated':>8}")
+    for count in domains:
+        for label, cf_batch, available in MODES:
+            api = MockCloudflare(latency=latency, batch=available)
+            names = {f"host{i}.{api.domain}" for i in range(count)}
+            api.seed(count // 2, ip="192.0.2.1")
+            server, base_url = start_server(api)
+            os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain,
+                              CF_BATCH=cf_batch, CF_BATCH_SIZE=str(batch_size))
+            # Each mode is a fresh deployment: a new client, and no remembered batch probe
+            main._client = None
+            main._batch_unsupported_at = None
+            try:
+                api.reset_counters()
+                start = time.perf_counter()
+                summary = main.sync_to_cloudflare(names, "198.51.100.7")
+                elapsed = time.perf_counter() - start
+            finally:
+                server.shutdown()
+            print(f"{count:>8} {label:<18} {api.request_count:>9} {elapsed:>9.3f} "
+                  f"{summary['created']:>8} {summary['updated']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated API round trip (s)")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.update(CF_API_TOKEN="mock", STATE_FILE="", RECORD_CACHE_FILE="", LOG_LEVEL="WARNING")
+    logging.disable(logging.INFO)
+    run(args.domains, args.latency, args.batch_size)
+
+if __name__ == "__main__":
+    main()
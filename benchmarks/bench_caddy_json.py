@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark reading domains from a large Caddy JSON config.
+
+Serves a generated multi-MB config from the stub admin API and times
+get_caddy_json_domains against it, reporting peak Python memory
+(tracemalloc) for the streaming ijson walk and the decoded fallback.
+
+    python benchmarks/bench_caddy_json.py --sites 20000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_caddy_admin import generate_config, start_server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sites", type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    import main as updater
+    import caddyjson
+
+    server, url = start_server(generate_config(args.sites))
+    print(f"{args.sites} routes, {len(server.config_body) / 1e6:.1f} MB config")
+    print(f"{'walk':>10} {'domains':>8} {'time (s)':>9} {'peak MB':>8}")
+    modes = [("decoded", None)]
+    if caddyjson.ijson is not None:
+        modes.insert(0, ("streaming", caddyjson.ijson))
+    else:
+        print("(ijson not installed, streaming walk skipped)")
+    try:
+        for name, backend in modes:
+            caddyjson.ijson = backend
+            tracemalloc.start()
+            start = time.perf_counter()
+            domains = updater.get_caddy_json_domains(url)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:>10} {len(domains):>8} {elapsed:>9.3f} {peak / 1e6:>8.1f}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark Caddyfile parsing on a large generated config.
+
+Generates a Caddyfile of roughly --lines lines with snippets, imports,
+nested blocks, matchers, multi-address and scheme/port site addresses,
+then times parse_caddyfile over several runs and checks the median
+throughput against --target lines/s (exit status 1 when it falls short).
+
+    python benchmarks/bench_caddyfile_parse.py --lines 50000 --target 200000
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SITE_TEMPLATES = (
+    """site{i}.example.net {{
+    import common
+    reverse_proxy localhost:{port}
+}}
+""",
+    """https://app{i}.example.net:443, http://www{i}.example.net {{
+    # Matchers and nested handlers
+    @api path /api/*
+    handle @api {{
+        reverse_proxy localhost:{port} {{
+            header_up Host {{upstream_hostport}}
+            lb_policy round_robin
+        }}
+    }}
+    handle {{
+        root * /srv/site{i}
+        file_server
+    }}
+}}
+""",
+    """*.tenant{i}.example.net {{
+    tls {{
+        dns cloudflare {{env.CF_API_TOKEN}}
+    }}
+    respond "tenant {i} {{" 200
+}}
+""",
+    """import proxied api{i}.example.net localhost:{port}
+""",
+)
+
+# Domains each template contributes to the parsed result
+SITE_DOMAINS = (1, 2, 1, 1)
+
+HEADER = """{
+    email admin@example.net
+}
+
+(common) {
+    encode zstd gzip
+    header {
+        Strict-Transport-Security "max-age=31536000"
+        -Server
+    }
+    log {
+        output file /var/log/caddy/access.log
+    }
+}
+
+(proxied) {
+    {args[0]} {
+        import common
+        reverse_proxy {args[1]}
+    }
+}
+
+"""
+
+def generate_caddyfile(lines=0, domains=0):
+    """Return (content, site count) for a Caddyfile of about ``lines`` lines, or ``domains`` domains"""
+    parts = [HEADER]
+    total = HEADER.count("\n")
+    found = 0
+    i = 0
+    while total < lines or found < domains:
+        template = i % len(SITE_TEMPLATES)
+        if domains and found + SITE_DOMAINS[template] > domains:
+            template = 0
+        block = SITE_TEMPLATES[template].format(i=i, port=8000 + i % 1000)
+        parts.append(block)
+        parts.append("\n")
+        total += block.count("\n") + 1
+        found += SITE_DOMAINS[template]
+        i += 1
+    return "".join(parts), i
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target", type=float, default=200000, help="minimum median throughput (lines/s)")
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    import main as updater
+
+    content, sites = generate_caddyfile(args.lines)
+    line_count = content.count("\n")
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        domains = updater.parse_caddyfile(content)
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    throughput = line_count / median
+    print(f"{line_count} lines, {sites} site blocks, {len(domains)} domains found")
+    print(f"median {median * 1000:.1f} ms over {args.runs} runs (best {min(timings) * 1000:.1f} ms), "
+          f"{throughput:,.0f} lines/s (target {args.target:,.0f})")
+    if throughput < args.target:
+        print("FAIL: below throughput target")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark the wall time of a steady-state cron run, process start included.
+
+Syncs a generated Caddyfile once against the local mock Cloudflare API,
+then times --runs fresh interpreters of main.py and fastpath.py while
+nothing changes, next to a bare ``python -c pass`` for the interpreter's
+own startup cost. The public IP comes from a pre-seeded IP cache, so no
+run leaves the machine.
+
+    python benchmarks/bench_cold_start.py --domains 1000 --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import ipdetect
+
+from bench_caddyfile_parse import generate_caddyfile
+from mock_cloudflare import MockCloudflare, start_server
+
+IP = "198.51.100.7"
+
+def time_runs(command, env, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    api = MockCloudflare()
+    server, base_url = start_server(api)
+    with tempfile.TemporaryDirectory() as directory:
+        caddyfile_path = os.path.join(directory, "Caddyfile")
+        content, _ = generate_caddyfile(domains=args.domains)
+        with open(caddyfile_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        ip_cache = os.path.join(directory, "ip.json")
+        ipdetect.save_cached_ip(ip_cache, IP, time.time())
+        env = dict(os.environ, CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain, CF_API_TOKEN="mock",
+                   CADDYFILE_PATH=caddyfile_path, STATE_FILE=os.path.join(directory, "state.json"),
+                   RECORD_CACHE_FILE=os.path.join(directory, "records.json"),
+                   IP_CACHE_FILE=ip_cache, IP_CACHE_TTL="86400", ZONE_CACHE_FILE="", METRICS_TEXTFILE="",
+                   LOG_LEVEL="WARNING")
+        env.pop("STARTUP_TIMINGS", None)
+        try:
+            subprocess.run([sys.executable, os.path.join(ROOT, "main.py")], env=env, check=True, capture_output=True)
+            api.reset_counters()
+            modes = [
+                ("python -c pass", [sys.executable, "-c", "pass"]),
+                ("main.py", [sys.executable, os.path.join(ROOT, "main.py")]),
+                ("fastpath.py", [sys.executable, os.path.join(ROOT, "fastpath.py")]),
+            ]
+            print(f"{args.runs} steady-state runs, {args.domains} domains")
+            print(f"{'entry point':<16} {'p50 (ms)':>9} {'min (ms)':>9} {'max (ms)':>9}")
+            for label, command in modes:
+                timings = time_runs(command, env, args.runs)
+                print(f"{label:<16} {statistics.median(timings) * 1000:>9.1f} {min(timings) * 1000:>9.1f} "
+                      f"{max(timings) * 1000:>9.1f}")
+            print(f"Cloudflare API requests during the timed runs: {api.request_count}")
+        finally:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Compare independent per-host syncs with the fleet aggregator.
+
+--hosts Caddy hosts serve the same --domains names against the local mock
+Cloudflare API, in a zone that also holds --other unrelated records. They
+run twice: once with each host on its own public IP, and once with all of
+them behind one shared IP.
+
+First every host runs main.run_sync on its own, with its own snapshot and
+record cache as separate containers would have. There are two rounds: a
+cold one, and one after every host's IP changed. Then the same hosts
+report to a fleet aggregator, which reconciles the zone once per round.
+The output lists the Cloudflare requests for each round and the A records
+each approach leaves behind. Independent hosts overwrite each other's
+records, so the last writer wins. The aggregator keeps one round-robin
+record per host. Behind a shared IP both approaches end up with the same
+records, but the aggregator lists the zone once per round where
+independent hosts list it once each.
+
+    python benchmarks/bench_fleet.py --hosts 5 --domains 1000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ipdetect
+
+from mock_cloudflare import MockCloudflare, start_server
+
+def host_ip(host, round_number, shared):
+    return f"198.51.{100 + round_number}.{1 if shared else host + 1}"
+
+def record_sets(api, names):
+    """Number of names holding each count of A records"""
+    counts = {}
+    for record in list(api.records.values()):
+        if record["type"] == "A" and record["name"] in names:
+            counts[record["name"]] = counts.get(record["name"], 0) + 1
+    histogram = {}
+    for count in counts.values():
+        histogram[count] = histogram.get(count, 0) + 1
+    return ", ".join(f"{names_with} names x {count} A" for count, names_with in sorted(histogram.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=5)
+    parser.add_argument("--domains", type=int, default=1000)
+    parser.add_argument("--other", type=int, default=20000, help="unrelated records already in the zone")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock Cloudflare API latency (s)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="caddy-fleet-")
+    caddyfile_path = os.path.join(directory, "Caddyfile")
+    with open(caddyfile_path, 'w', encoding='utf-8') as f:
+        for i in range(args.domains):
+            f.write(f"site{i}.example.net {{\n    reverse_proxy localhost:8080\n}}\n\n")
+    os.environ.update(CF_API_TOKEN="mock", CADDYFILE_PATH=caddyfile_path, IP_CACHE_TTL="86400", IP_VERSIONS="4",
+                      ZONE_CACHE_FILE="", METRICS_TEXTFILE="", FLEET_STATE_FILE="", CF_RATE_LIMIT="1000000",
+                      CF_RATE_BURST="1000000", LOG_LEVEL="WARNING")
+    logging.disable(logging.WARNING)
+    import main as updater
+    import fleet
+
+    names = {f"site{i}.example.net" for i in range(args.domains)}
+    domains = sorted(names)
+    print(f"{args.hosts} hosts, {args.domains} shared domains, {args.other} other records, "
+          f"{args.latency * 1000:.0f} ms API latency")
+    print(f"{'approach':<22} {'host IPs':<9} {'round':<10} {'reqs':>6} {'time (s)':>9}  records")
+
+    for shared in (False, True):
+        ips = "shared" if shared else "per host"
+        api = MockCloudflare(latency=args.latency)
+        api.seed(args.other, ip="203.0.113.9")
+        server, base_url = start_server(api)
+        os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain)
+        updater._client = None
+        for round_number, label in enumerate(("cold", "IP change")):
+            api.reset_counters()
+            start = time.perf_counter()
+            for host in range(args.hosts):
+                ip_cache = os.path.join(directory, f"ip-{host}.json")
+                ipdetect.save_cached_ip(ip_cache, host_ip(host, round_number, shared), time.time())
+                os.environ.update(IP_CACHE_FILE=ip_cache,
+                                  STATE_FILE=os.path.join(directory, f"state-{shared}-{host}.json"),
+                                  RECORD_CACHE_FILE=os.path.join(directory, f"records-{shared}-{host}.json"))
+                updater._domain_cache.clear()
+                updater.run_sync()
+            print(f"{'independent hosts':<22} {ips:<9} {label:<10} {api.request_count:>6} "
+                  f"{time.perf_counter() - start:>9.3f}  {record_sets(api, names)}")
+        server.shutdown()
+
+        api = MockCloudflare(latency=args.latency)
+        api.seed(args.other, ip="203.0.113.9")
+        server, base_url = start_server(api)
+        os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone)
+        updater._client = None
+        aggregator = fleet.Fleet(host_ttl=3600)
+        for round_number, label in enumerate(("cold", "IP change")):
+            for host in range(args.hosts):
+                aggregator.report(f"host{host}", domains, {"A": host_ip(host, round_number, shared)})
+            api.reset_counters()
+            start = time.perf_counter()
+            fleet.reconcile(aggregator)
+            print(f"{'fleet aggregator':<22} {ips:<9} {label:<10} {api.request_count:>6} "
+                  f"{time.perf_counter() - start:>9.3f}  {record_sets(api, names)}")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
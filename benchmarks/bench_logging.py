@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of logging on the sync path.
+
+Syncs --domains new domains against the local mock Cloudflare API with
+per-record writes, so every domain logs a line or two. Each logging setup
+runs in a fresh interpreter, because logging is configured once per
+process. The log stream is a file that sleeps --sink-latency seconds per
+write, standing in for a slow terminal or a container log pipe that is
+backed up. The output lists the wall time of the sync itself, the time
+until the last line was written and the number of lines written.
+
+    python benchmarks/bench_logging.py --domains 500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SETUPS = (
+    ("text, direct", {"LOG_FORMAT": "text"}, False),
+    ("text, queued", {"LOG_FORMAT": "text"}, True),
+    ("json, queued", {"LOG_FORMAT": "json"}, True),
+    ("summary, queued", {"LOG_FORMAT": "json", "LOG_SUMMARY": "true"}, True),
+)
+
+class SlowStream:
+    """A file whose every write takes at least ``latency`` seconds"""
+
+    def __init__(self, path, latency):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.latency = latency
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.latency)
+        self.lines += text.count("\n")
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+def child(queued, log_path, latency):
+    """Run one sync with logging configured as given, printing its timings as JSON"""
+    import logsetup
+    stream = SlowStream(log_path, latency)
+    logsetup.configure(stream=stream, queued=queued)
+    import main
+    start = time.perf_counter()
+    main.run_sync()
+    synced = time.perf_counter() - start
+    logsetup.shutdown()
+    print(json.dumps({"sync": synced, "drained": time.perf_counter() - start, "lines": stream.lines}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.005, help="mock Cloudflare API latency (s)")
+    parser.add_argument("--sink-latency", type=float, default=0.001, help="time each log write takes (s)")
+    parser.add_argument("--child", choices=("direct", "queued"), help=argparse.SUPPRESS)
+    parser.add_argument("--log", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child == "queued", args.log, args.sink_latency)
+        return
+
+    import ipdetect
+    from mock_cloudflare import MockCloudflare, start_server
+
+    directory = tempfile.mkdtemp(prefix="caddy-logging-")
+    caddyfile_path = os.path.join(directory, "Caddyfile")
+    with open(caddyfile_path, 'w', encoding='utf-8') as f:
+        for i in range(args.domains):
+            f.write(f"site{i}.example.net {{\n    reverse_proxy localhost:8080\n}}\n\n")
+    ip_cache = os.path.join(directory, "ip.json")
+    ipdetect.save_cached_ip(ip_cache, "198.51.100.7", time.time())
+
+    print(f"{args.domains} domains, per-record writes, {args.latency * 1000:.0f} ms API latency, "
+          f"{args.sink_latency * 1000:.1f} ms per log write")
+    print(f"{'logging':<18} {'sync (s)':>9} {'drained (s)':>12} {'lines':>6}")
+    for label, settings, queued in SETUPS:
+        api = MockCloudflare(latency=args.latency)
+        server, base_url = start_server(api)
+        env = dict(os.environ, CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain, CF_API_TOKEN="mock",
+                   CADDYFILE_PATH=caddyfile_path, STATE_FILE="", RECORD_CACHE_FILE="", IP_CACHE_FILE=ip_cache,
+                   IP_CACHE_TTL="86400", IP_VERSIONS="4", ZONE_CACHE_FILE="", METRICS_TEXTFILE="",
+                   DOMAIN_DENY_PATTERNS="", CF_BATCH="false", CF_RATE_LIMIT="1000000", CF_RATE_BURST="1000000",
+                   LOG_LEVEL="INFO", LOG_SUMMARY="false")
+        env.update(settings)
+        try:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "queued" if queued else "direct",
+                 "--log", os.path.join(directory, "sync.log"), "--sink-latency", str(args.sink_latency)],
+                env=env, check=True, capture_output=True, text=True).stdout
+        finally:
+            server.shutdown()
+        timings = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<18} {timings['sync']:>9.3f} {timings['drained']:>12.3f} {timings['lines']:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the asyncio pipeline against the sequential run_sync.
+
+Both run full syncs of a generated Caddyfile against the local mock
+Cloudflare API (with --latency per request), detecting the public IP from
+a local endpoint that answers after --ip-latency, so detection, parsing
+and the zone listing have something to overlap. Each implementation gets
+a fresh zone and state file and is timed for a cold sync (empty zone, no
+snapshot) and an IP change (every record rewritten).
+
+    python benchmarks/bench_pipeline.py --domains 10000 --latency 0.05 --ip-latency 0.2
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_caddyfile_parse import generate_caddyfile
+from mock_cloudflare import MockCloudflare, start_server
+
+def start_ip_server(latency):
+    """Serve the current ``server.ip`` as plain text after ``latency`` seconds"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            payload = self.server.ip.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.ip = "192.0.2.1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock Cloudflare API latency (s)")
+    parser.add_argument("--ip-latency", type=float, default=0.2, help="IP source latency (s)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="caddy-pipeline-")
+    caddyfile_path = os.path.join(directory, "Caddyfile")
+    content, _ = generate_caddyfile(domains=args.domains)
+    with open(caddyfile_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    ip_server = start_ip_server(args.ip_latency)
+    os.environ.update(CF_API_TOKEN="mock", CADDYFILE_PATH=caddyfile_path, IP_CACHE_FILE="", IP_QUORUM="1",
+                      IP_SOURCES=f"http://127.0.0.1:{ip_server.server_address[1]}/", ZONE_CACHE_FILE="",
+                      METRICS_TEXTFILE="", CF_RATE_LIMIT="1000000", CF_RATE_BURST="1000000", LOG_LEVEL="WARNING")
+    logging.disable(logging.WARNING)
+    import main as updater
+    import pipeline
+
+    implementations = [
+        ("sequential run_sync", updater.run_sync),
+        ("asyncio pipeline", lambda: asyncio.run(pipeline.run_sync())),
+    ]
+    print(f"{args.domains} domains, {args.latency * 1000:.0f} ms API latency, "
+          f"{args.ip_latency * 1000:.0f} ms IP detection")
+    print(f"{'implementation':<22} {'cold (s)':>9} {'reqs':>6} {'ip change (s)':>14} {'reqs':>6}")
+    for label, run in implementations:
+        api = MockCloudflare(latency=args.latency)
+        server, base_url = start_server(api)
+        os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain,
+                          STATE_FILE=os.path.join(directory, f"state-{len(label)}.json"),
+                          RECORD_CACHE_FILE=os.path.join(directory, f"records-{len(label)}.json"))
+        updater._client = None
+        updater._domain_cache.clear()
+        row = []
+        try:
+            for ip in ("192.0.2.1", "198.51.100.7"):
+                ip_server.ip = ip
+                api.reset_counters()
+                start = time.perf_counter()
+                run()
+                row.append((time.perf_counter() - start, api.request_count))
+        finally:
+            server.shutdown()
+        print(f"{label:<22} {row[0][0]:>9.3f} {row[0][1]:>6} {row[1][0]:>14.3f} {row[1][1]:>6}")
+    ip_server.shutdown()
+
+if __name__ == "__main__":
+    main()
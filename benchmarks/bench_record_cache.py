@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Verify the zone record cache against the local mock Cloudflare API.
+
+Runs a sequence of syncs of a generated Caddyfile into a zone that also
+holds --other unrelated records. It counts the requests each sync makes
+with the record cache enabled and disabled. With the cache, back-to-back
+syncs that add domains or follow an IP change make no listing call. Then
+three managed records are changed out of band in the mock: one content
+edit, one deletion and one stripped ownership comment. A sync within
+RECORD_CACHE_TTL does not see them. The first sync after the TTL lists the
+zone, reports all three as drift and repairs them. Exits with status 1 if
+any of this does not hold. --pipeline runs the syncs through the asyncio
+pipeline instead of main.run_sync.
+
+    python benchmarks/bench_record_cache.py --domains 1000 --other 20000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ipdetect
+
+from mock_cloudflare import MockCloudflare, start_server
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+OTHER_IP = "203.0.113.9"
+
+def write_caddyfile(path, domain, count):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(f"site{i}.{domain} {{\n    reverse_proxy localhost:{8000 + i % 1000}\n}}\n\n")
+    return {f"site{i}.{domain}" for i in range(count)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=1000)
+    parser.add_argument("--other", type=int, default=20000, help="unrelated records already in the zone")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock Cloudflare API latency (s)")
+    parser.add_argument("--pipeline", action="store_true", help="sync through pipeline.run_sync")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="caddy-record-cache-")
+    caddyfile_path = os.path.join(directory, "Caddyfile")
+    ip_cache = os.path.join(directory, "ip.json")
+    os.environ.update(CF_API_TOKEN="mock", CADDYFILE_PATH=caddyfile_path, IP_CACHE_FILE=ip_cache,
+                      IP_CACHE_TTL="86400", IP_VERSIONS="4", ZONE_CACHE_FILE="", METRICS_TEXTFILE="",
+                      CF_RATE_LIMIT="1000000", CF_RATE_BURST="1000000", LOG_LEVEL="WARNING")
+    logging.disable(logging.WARNING)
+    import main as updater
+    import metrics
+    import pipeline
+    run = (lambda: asyncio.run(pipeline.run_sync())) if args.pipeline else updater.run_sync
+
+    failures = []
+
+    def check(condition, message):
+        if not condition:
+            failures.append(message)
+
+    for cached in (False, True):
+        api = MockCloudflare(latency=args.latency)
+        api.seed(args.other, ip=OTHER_IP)
+        server, base_url = start_server(api)
+        os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain,
+                          STATE_FILE=os.path.join(directory, f"state-{cached}.json"),
+                          RECORD_CACHE_FILE=os.path.join(directory, "records.json") if cached else "",
+                          RECORD_CACHE_TTL="3600")
+        updater._client = None
+        updater._domain_cache.clear()
+        metrics.RECORD_DRIFT.values.clear()
+        comment = updater.get_owner_comment()
+
+        def sync(label, ip, count=args.domains):
+            names = write_caddyfile(caddyfile_path, api.domain, count)
+            ipdetect.save_cached_ip(ip_cache, ip, time.time())
+            api.reset_counters()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            drift = sum(metrics.RECORD_DRIFT.values.values())
+            metrics.RECORD_DRIFT.values.clear()
+            gets = api.requests_by_method.get("GET", 0)
+            print(f"{label:<34} {elapsed:>8.3f} {api.request_count:>6} {gets:>6} {drift:>6}")
+            return names, gets, drift
+
+        print(f"\nrecord cache {'enabled' if cached else 'disabled'}: {args.domains} domains, "
+              f"{args.other} other records, {args.latency * 1000:.0f} ms API latency")
+        print(f"{'sync':<34} {'time (s)':>8} {'reqs':>6} {'GETs':>6} {'drift':>6}")
+        sync("cold", OLD_IP)
+        _, gets, _ = sync(f"+{args.domains // 10} domains", OLD_IP, args.domains + args.domains // 10)
+        if cached:
+            check(gets == 0, f"adding domains listed the zone ({gets} GETs)")
+        _, gets, _ = sync("IP change", NEW_IP, args.domains + args.domains // 10)
+        if cached:
+            check(gets == 0, f"an IP change listed the zone ({gets} GETs)")
+        if not cached:
+            server.shutdown()
+            continue
+
+        api.edit_record(f"site1.{api.domain}", content=OTHER_IP)
+        api.remove_record(f"site2.{api.domain}")
+        api.edit_record(f"site3.{api.domain}", comment=None)
+        _, gets, drift = sync("out-of-band edits, within TTL", NEW_IP, args.domains + args.domains // 10)
+        check(gets == 0 and drift == 0, "a sync within RECORD_CACHE_TTL listed the zone")
+        os.environ["RECORD_CACHE_TTL"] = "0"
+        names, gets, drift = sync("after TTL", NEW_IP, args.domains + args.domains // 10)
+        os.environ["RECORD_CACHE_TTL"] = "3600"
+        check(gets > 0, "a sync after RECORD_CACHE_TTL did not list the zone")
+        check(drift == 3, f"expected 3 drifted records, found {drift}")
+        wrong = [name for name in names if (api.find_record(name) or {}).get("content") != NEW_IP
+                 or api.find_record(name).get("comment") != comment]
+        check(not wrong, f"{len(wrong)} records not repaired: {', '.join(sorted(wrong)[:5])}")
+        _, gets, _ = sync("after repair", NEW_IP, args.domains + args.domains // 10)
+        check(api.request_count == 0, f"the sync after the repair made {api.request_count} requests")
+        server.shutdown()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("\nrecord cache OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Compare an IP rotation with per-site A records and with CNAMEs to the apex.
+
+--domains sites are synced against the local mock Cloudflare API, in a
+zone that also holds --other unrelated records. This runs twice. First
+every site gets its own A record. Then RECORD_OPTIONS_FILE points every
+site at the zone apex with a proxied CNAME. Each setup is synced cold and
+then after the public IP changed. The output lists the Cloudflare requests
+and the records written for each round. With CNAMEs, the rotation rewrites
+only the apex A record.
+
+Finally a site's TTL and proxying are changed out of band. The next sync
+that lists the zone must report that drift and put the settings back.
+
+    python benchmarks/bench_record_options.py --domains 500
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ipdetect
+
+from mock_cloudflare import MockCloudflare, start_server
+
+SETUPS = (
+    ("A per site", {}),
+    ("CNAME to apex", {"site*.example.net": {"cname": "@", "proxied": True}}),
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=500)
+    parser.add_argument("--other", type=int, default=5000, help="unrelated records already in the zone")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock Cloudflare API latency (s)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="caddy-options-")
+    caddyfile_path = os.path.join(directory, "Caddyfile")
+    with open(caddyfile_path, 'w', encoding='utf-8') as f:
+        for i in range(args.domains):
+            f.write(f"site{i}.example.net {{\n    reverse_proxy localhost:8080\n}}\n\n")
+    options_path = os.path.join(directory, "record-options.json")
+    ip_cache = os.path.join(directory, "ip.json")
+    os.environ.update(CF_API_TOKEN="mock", CADDYFILE_PATH=caddyfile_path, IP_CACHE_FILE=ip_cache,
+                      IP_CACHE_TTL="86400", IP_VERSIONS="4", ZONE_CACHE_FILE="", METRICS_TEXTFILE="",
+                      DOMAIN_DENY_PATTERNS="", CF_RATE_LIMIT="1000000", CF_RATE_BURST="1000000",
+                      LOG_LEVEL="WARNING")
+    logging.disable(logging.WARNING)
+    import main as updater
+    import metrics
+
+    print(f"{args.domains} domains, {args.other} other records, {args.latency * 1000:.0f} ms API latency")
+    print(f"{'records':<20} {'round':<10} {'reqs':>5} {'written':>8} {'time (s)':>9}")
+    servers = []
+    for label, options in SETUPS:
+        with open(options_path, 'w', encoding='utf-8') as f:
+            json.dump(options, f)
+        api = MockCloudflare(latency=args.latency)
+        api.seed(args.other, ip="203.0.113.9")
+        server, base_url = start_server(api)
+        servers.append(server)
+        os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain,
+                          RECORD_OPTIONS_FILE=options_path,
+                          STATE_FILE=os.path.join(directory, f"state-{bool(options)}.json"),
+                          RECORD_CACHE_FILE=os.path.join(directory, f"records-{bool(options)}.json"))
+        updater._client = None
+        for round_number, round_label in enumerate(("cold", "IP change")):
+            ipdetect.save_cached_ip(ip_cache, f"198.51.100.{round_number + 1}", time.time())
+            api.reset_counters()
+            start = time.perf_counter()
+            summary = updater.sync_to_cloudflare(updater.get_domains(), updater.get_public_ips())
+            written = summary["created"] + summary["updated"] + summary["deleted"]
+            print(f"{label:<20} {round_label:<10} {api.request_count:>5} {written:>8} "
+                  f"{time.perf_counter() - start:>9.3f}")
+            assert summary["failed"] == 0, summary
+
+    # Out-of-band edits to the last setup's records surface as drift once the cached listing expires
+    api.edit_record("site0.example.net", "CNAME", ttl=600, proxied=False)
+    os.environ["RECORD_CACHE_TTL"] = "0"
+    metrics.RECORD_DRIFT.values.clear()
+    api.reset_counters()
+    updater.sync_to_cloudflare(updater.get_domains(), updater.get_public_ips())
+    drift = sum(metrics.RECORD_DRIFT.values.values())
+    record = api.find_record("site0.example.net", "CNAME")
+    repaired = record["proxied"] and record["ttl"] == 1
+    print(f"drift: {drift} record changed out of band reported, "
+          f"{'repaired' if repaired else 'NOT repaired'} with {api.request_count} requests")
+    for server in servers:
+        server.shutdown()
+    if drift != 1 or not repaired:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request cost over TLS with and without connection reuse.
+
+Serves the mock API over HTTPS with a throwaway self-signed certificate
+(generated with the openssl CLI) and times sequential record updates made
+with a fresh connection per call, as module-level requests.put() did,
+against the pooled CloudflareClient (and its HTTP/2 transport when httpx
+is installed). On loopback the gap is the handshake CPU cost alone; over
+a real network each new connection also pays two extra round trips.
+--rtt adds fixed server latency to every response for comparison.
+
+    python benchmarks/bench_tls_reuse.py --requests 200 --rtt 0.02
+"""
+
+import argparse
+import logging
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import requests
+
+from mock_cloudflare import MockCloudflare, start_server
+
+def self_signed_cert(directory):
+    """Create a localhost certificate and key, returning (cert_path, key_path)"""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+def time_calls(call, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        call(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rtt", type=float, default=0.0, help="latency added to every response (s)")
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    import cloudflare
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = self_signed_cert(directory)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        context.set_alpn_protocols(["http/1.1"])
+
+        api = MockCloudflare(latency=args.rtt)
+        api.seed(args.requests)
+        ids = list(api.records)
+        server, base_url = start_server(api, tls_context=context)
+        headers = {"Authorization": "Bearer mock", "Content-Type": "application/json"}
+        body = {"type": "A", "name": "host.example.net", "content": "198.51.100.7", "ttl": 300, "proxied": False}
+
+        def fresh_connection(i):
+            # What every call cost before the shared client: a new TCP + TLS handshake
+            response = requests.put(f"{base_url}/zones/{api.zone}/dns_records/{ids[i]}",
+                                    headers=headers, json=body, verify=cert, timeout=30)
+            response.raise_for_status()
+
+        modes = [("new connection per call", fresh_connection, None)]
+        transports = [("CloudflareClient keep-alive", False)]
+        if cloudflare.httpx is not None:
+            transports.append(("CloudflareClient HTTP/2", True))
+        for label, http2 in transports:
+            client = cloudflare.CloudflareClient("mock", base_url=base_url, http2=http2)
+            if http2:
+                # httpx verifies on its own client, configured at construction
+                client.session.get_adapter(base_url).client = cloudflare.httpx.Client(http2=True, verify=cert)
+
+            def pooled(i, client=client):
+                client.request("PUT", f"/zones/{api.zone}/dns_records/{ids[i]}", json=body,
+                               verify=cert).raise_for_status()
+            modes.append((label, pooled, client))
+
+        print(f"{args.requests} sequential PUTs over TLS, {args.rtt * 1000:.0f} ms server latency")
+        print(f"{'mode':<28} {'mean (ms)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'total (s)':>10}")
+        try:
+            for label, call, client in modes:
+                timings = time_calls(call, args.requests)
+                ordered = sorted(timings)
+                print(f"{label:<28} {statistics.mean(timings) * 1000:>10.2f} "
+                      f"{ordered[len(ordered) // 2] * 1000:>9.2f} {ordered[int(len(ordered) * 0.95)] * 1000:>9.2f} "
+                      f"{sum(timings):>10.3f}")
+                if client is not None:
+                    client.close()
+        finally:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
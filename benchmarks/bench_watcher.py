@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Replay common editor save patterns against the Caddyfile watcher.
+
+Each pattern rewrites a watched Caddyfile in a temporary directory while a
+CoalescingScheduler runs a fake sync (recording the content it read and
+taking --sync-time seconds). Reports how many syncs each pattern cost, the
+delay from the last write to the sync that saw it, and whether the final
+content was synced; exits nonzero if any pattern's final content was not.
+
+    python benchmarks/bench_watcher.py --settle 0.2 --sync-time 0.5
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def in_place(directory, path, content):
+    write(path, content)
+
+def atomic_rename(directory, path, content):
+    write(f"{path}.tmp", content)
+    os.replace(f"{path}.tmp", path)
+
+def vim_backup(directory, path, content):
+    # :set backup nowritebackup - move the original aside, write a new file, drop the backup
+    os.rename(path, f"{path}~")
+    write(path, content)
+    os.remove(f"{path}~")
+
+def delete_recreate(directory, path, content):
+    os.remove(path)
+    time.sleep(0.05)
+    write(path, content)
+
+def configmap_swap(directory, path, content):
+    # Kubernetes projects ConfigMaps as Caddyfile -> ..data/Caddyfile with ..data swapped atomically
+    version = os.path.join(directory, f"..{time.monotonic_ns()}")
+    os.mkdir(version)
+    write(os.path.join(version, "Caddyfile"), content)
+    os.symlink(os.path.basename(version), os.path.join(directory, "..data_tmp"))
+    os.replace(os.path.join(directory, "..data_tmp"), os.path.join(directory, "..data"))
+
+def burst(directory, path, content):
+    for i in range(20):
+        write(path, f"{content}# save {i}\n")
+        time.sleep(0.01)
+    write(path, content)
+
+PATTERNS = [in_place, atomic_rename, vim_backup, delete_recreate, configmap_swap, burst]
+
+def setup(directory, pattern):
+    path = os.path.join(directory, "Caddyfile")
+    if pattern is configmap_swap:
+        version = os.path.join(directory, "..initial")
+        os.mkdir(version)
+        write(os.path.join(version, "Caddyfile"), "initial.example.net {\n}\n")
+        os.symlink("..initial", os.path.join(directory, "..data"))
+        os.symlink(os.path.join("..data", "Caddyfile"), path)
+    else:
+        write(path, "initial.example.net {\n}\n")
+    return path
+
+def replay(pattern, settle, sync_time, edits):
+    """Save the Caddyfile ``edits`` times with ``pattern`` under a watched scheduler.
+
+    Returns the (start time, content read or None) of every fake sync, the
+    final content and the time of the last write.
+    """
+    from watchdog.observers import Observer
+    from watcher import CaddyfileChangeHandler, CoalescingScheduler
+
+    directory = tempfile.mkdtemp(prefix="caddy-watch-")
+    path = setup(directory, pattern)
+    synced = []
+    lock = threading.Lock()
+
+    def fake_sync():
+        started = time.monotonic()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            # Caught between a delete and the recreate; a real sync fails and the next event retries
+            content = None
+        with lock:
+            synced.append((started, content))
+        time.sleep(sync_time)
+        return True
+
+    scheduler = CoalescingScheduler(fake_sync, settle=settle, name=f"bench-{pattern.__name__}").start()
+    observer = Observer()
+    observer.schedule(CaddyfileChangeHandler(path, scheduler.submit), directory, recursive=False)
+    observer.start()
+    try:
+        time.sleep(0.2)
+        for i in range(edits):
+            final = f"site{i}.example.net {{\n    respond {i}\n}}\n"
+            pattern(directory, path, final)
+            last_write = time.monotonic()
+            time.sleep(sync_time / 2)
+        time.sleep(settle + 2 * sync_time + 1)
+    finally:
+        observer.stop()
+        observer.join()
+        scheduler.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+    with lock:
+        return list(synced), final, last_write
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--settle", type=float, default=0.2, help="WATCH_SETTLE_SECONDS")
+    parser.add_argument("--sync-time", type=float, default=0.5, help="duration of each fake sync (s)")
+    parser.add_argument("--edits", type=int, default=3, help="saves per pattern, spaced by half a sync")
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    print(f"settle {args.settle}s, sync {args.sync_time}s, {args.edits} saves per pattern")
+    print(f"{'pattern':>16} {'syncs':>6} {'last write -> sync (s)':>23} {'final synced':>13}")
+    missed = []
+    for pattern in PATTERNS:
+        synced, final, last_write = replay(pattern, args.settle, args.sync_time, args.edits)
+        after = [started for started, content in synced if content == final and started >= last_write]
+        delay = f"{after[0] - last_write:.3f}" if after else "-"
+        print(f"{pattern.__name__:>16} {len(synced):>6} {delay:>23} {'yes' if after else 'NO':>13}")
+        if not after:
+            missed.append(pattern.__name__)
+    if missed:
+        sys.exit(f"Final content never synced: {', '.join(missed)}")
+
+if __name__ == "__main__":
+    main()
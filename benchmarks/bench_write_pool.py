@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-record writes through the rate-limited writer pool.
+
+Batching is disabled so every change is its own call. The mock API injects
+503s and enforces its own request rate, answering 429 with Retry-After, to
+show throughput and failure counts for different pool sizes.
+
+    python benchmarks/bench_write_pool.py --domains 200 --error-rate 0.05
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_cloudflare import MockCloudflare, start_server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.03, help="simulated API round trip (s)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fraction of requests answered with 503")
+    parser.add_argument("--server-limit", type=int, default=100, help="mock requests/s before it answers 429")
+    parser.add_argument("--client-limit", type=int, default=0,
+                        help="client CF_RATE_LIMIT per second (0 disables the token bucket)")
+    args = parser.parse_args()
+
+    os.environ.update(CF_API_TOKEN="mock", STATE_FILE="", RECORD_CACHE_FILE="", CF_BATCH="false", LOG_LEVEL="WARNING",
+                      CF_RATE_LIMIT=str(args.client_limit), CF_RATE_WINDOW="1", CF_RATE_BURST="10")
+    logging.disable(logging.ERROR)
+    import main
+
+    print(f"{args.domains} per-record writes, {args.latency * 1000:.0f} ms latency, "
+          f"{args.error_rate:.0%} 503s, mock limit {args.server_limit} req/s")
+    print(f"{'workers':>8} {'requests':>9} {'429s':>6} {'503s':>6} {'wall (s)':>9} {'writes/s':>9} {'failed':>7}")
+    for workers in args.workers:
+        api = MockCloudflare(latency=args.latency, error_rate=args.error_rate,
+                             rate_limit=args.server_limit, rate_window=1.0)
+        names = {f"host{i}.{api.domain}" for i in range(args.domains)}
+        api.seed(args.domains, ip="192.0.2.1")
+        server, base_url = start_server(api)
+        os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain,
+                          CF_WRITE_WORKERS=str(workers))
+        main._client = None
+        try:
+            start = time.perf_counter()
+            summary = main.sync_to_cloudflare(names, "198.51.100.7")
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+        print(f"{workers:>8} {api.request_count:>9} {api.responses_by_status.get(429, 0):>6} "
+              f"{api.responses_by_status.get(503, 0):>6} {elapsed:>9.3f} "
+              f"{summary['updated'] / elapsed:>9.1f} {summary['failed']:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the paginated zone listing against a local mock Cloudflare API.
+
+Each scenario runs in a fresh interpreter so its peak RSS is measured in
+isolation from the mock server and from the other scenarios.
+
+    python benchmarks/bench_zone_listing.py --records 10000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_cloudflare import MockCloudflare, start_server
+
+SCENARIOS = [
+    # (label, per_page, workers)
+    ("per_page=100, sequential", 100, 1),
+    ("per_page=100, 4 workers", 100, 4),
+    ("per_page=100, 8 workers", 100, 8),
+    ("per_page=1000, 4 workers", 1000, 4),
+    ("per_page=5000, sequential", 5000, 1),
+]
+
+def run_scenario(zone):
+    """Child process: build the existing-record index and report timings"""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import main
+
+    os.environ.setdefault("CF_API_TOKEN", "mock")
+    client = main.get_client()
+    start = time.perf_counter()
+    existing = {}
+    for record in main.iter_dns_records(zone, client, record_type="A"):
+        existing[record["name"]] = record
+    elapsed = time.perf_counter() - start
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"records": len(existing), "wall_s": elapsed, "peak_rss_mb": peak_kb / 1024}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated API round trip (s)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--zone", default="mockzone", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_scenario(args.zone)
+
+    api = MockCloudflare(latency=args.latency)
+    api.seed(args.records)
+    server, base_url = start_server(api)
+
+    print(f"Zone listing benchmark: {args.records} records, {args.latency * 1000:.0f} ms latency, {base_url}")
+    print(f"{'scenario':<28} {'records':>8} {'requests':>9} {'wall (s)':>9} {'peak RSS (MB)':>14}")
+    try:
+        for label, per_page, workers in SCENARIOS:
+            env = dict(os.environ, CF_API_URL=base_url, CF_PAGE_SIZE=str(per_page),
+                       CF_PAGE_WORKERS=str(workers), LOG_LEVEL="WARNING")
+            api.reset_counters()
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--zone", api.zone],
+                env=env, capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{label:<28} {result['records']:>8} {api.request_count:>9} "
+                  f"{result['wall_s']:>9.3f} {result['peak_rss_mb']:>14.1f}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
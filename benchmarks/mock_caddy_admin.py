@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Stub Caddy admin API serving a generated JSON config on ``GET /config/``.
+
+Used to exercise DOMAIN_SOURCE=json without a running Caddy:
+
+    python benchmarks/mock_caddy_admin.py --sites 5000 --port 2019
+    DOMAIN_SOURCE=json CADDY_JSON_CONFIG=http://127.0.0.1:2019/config/ python main.py
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def generate_config(sites, domain="example.net"):
+    """Caddy JSON config with ``sites`` host-matched routes, every fourth one inside a subroute"""
+    routes = []
+    for i in range(sites):
+        handler = {
+            "handler": "reverse_proxy",
+            "upstreams": [{"dial": f"localhost:{8000 + i % 1000}"}],
+            "headers": {"request": {"set": {"X-Site": [str(i)]}}},
+        }
+        if i % 4 == 3:
+            handler = {
+                "handler": "subroute",
+                "routes": [{"match": [{"path": ["/api/*"], "host": [f"api{i}.{domain}"]}], "handle": [handler]}],
+            }
+        routes.append({
+            "match": [{"host": [f"site{i}.{domain}", f"www.site{i}.{domain}"]}],
+            "handle": [handler],
+            "terminal": True,
+        })
+    return {
+        "admin": {"listen": "localhost:2019"},
+        "apps": {
+            "http": {"servers": {"srv0": {"listen": [":443"], "routes": routes}}},
+            "tls": {"automation": {"policies": [{"subjects": ["not-a-route.example.net"]}]}},
+        },
+    }
+
+class AdminHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip('/') != "/config":
+            self.send_error(404)
+            return
+        body = self.server.config_body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Serve ``config`` on a background thread, returning (server, config_url)"""
+    server = ThreadingHTTPServer((host, port), AdminHandler)
+    server.daemon_threads = True
+    server.config_body = json.dumps(config).encode()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/config/"
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Caddy admin API")
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--port", type=int, default=2019)
+    args = parser.parse_args()
+
+    server, url = start_server(generate_config(args.sites), port=args.port)
+    print(f"Serving {args.sites} sites at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
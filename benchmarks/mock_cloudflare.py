@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Cloudflare v4 DNS API used by the benchmarks.
+
+Only the endpoints the updater talks to are implemented, backed by an
+in-memory record store. Run it directly to serve a zone on a local port:
+
+    python benchmarks/mock_cloudflare.py --records 10000 --port 8787
+"""
+
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_ZONE = "mockzone"
+MAX_PER_PAGE = 5000
+
+def settle(record):
+    """Cloudflare serves proxied records with an automatic TTL (1), whatever was sent"""
+    if record.get("proxied"):
+        record["ttl"] = 1
+
+class MockCloudflare:
+    """In-memory DNS record store with request accounting"""
+
+    def __init__(self, zone=DEFAULT_ZONE, domain="example.net", latency=0.0, batch=True,
+                 error_rate=0.0, rate_limit=0, rate_window=1.0):
+        self.zone = zone
+        self.domain = domain
+        self.zones = {zone: domain}
+        self.latency = latency
+        self.batch = batch
+        # Fault injection: fraction of requests answered with a 503, and a
+        # sliding-window limit of requests per rate_window answered with 429
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.recent = []
+        self.records = {}
+        self.cnames = False
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.requests_by_method = {}
+        self.responses_by_status = {}
+
+    def add_zone(self, name, zone_id=None):
+        """Add another zone, returning its id"""
+        zone_id = zone_id or uuid.uuid4().hex
+        with self.lock:
+            self.zones[zone_id] = name
+        return zone_id
+
+    def seed(self, count, ip="192.0.2.1", record_type="A", zone=None, comment=None):
+        """Populate a zone (the default one unless given) with ``count`` generated records"""
+        zone = zone or self.zone
+        for i in range(count):
+            self.add_record(record_type, f"host{i}.{self.zones[zone]}", ip, zone=zone, comment=comment)
+
+    def add_record(self, record_type, name, content, zone=None, **extra):
+        record = {
+            "id": uuid.uuid4().hex,
+            "zone_id": zone or self.zone,
+            "type": record_type,
+            "name": name,
+            "content": content,
+            "ttl": extra.get("ttl", 300),
+            "proxied": extra.get("proxied", False),
+            "comment": extra.get("comment"),
+        }
+        settle(record)
+        with self.lock:
+            self.records[record["id"]] = record
+            self.cnames = self.cnames or record_type == "CNAME"
+        return record
+
+    def conflicts(self, zone, name, record_type, exclude=None):
+        """True when a record of ``record_type`` could not share ``name`` with the zone's other records.
+
+        Like Cloudflare, a CNAME must be the only A, AAAA or CNAME record of its name.
+        """
+        if record_type != "CNAME" and not self.cnames:
+            # No CNAME was ever written, so nothing can conflict
+            return False
+        with self.lock:
+            others = {record["type"] for record in self.records.values()
+                      if record["zone_id"] == zone and record["name"] == name and record["id"] != exclude}
+        others &= {"A", "AAAA", "CNAME"}
+        return bool(others) and (record_type == "CNAME" or "CNAME" in others)
+
+    def find_record(self, name, record_type="A"):
+        """The first record of ``record_type`` named ``name``, or None"""
+        with self.lock:
+            return next((record for record in self.records.values()
+                         if record["name"] == name and record["type"] == record_type), None)
+
+    def edit_record(self, name, record_type="A", **fields):
+        """Change a record out of band, as a dashboard edit would, without counting a request"""
+        record = self.find_record(name, record_type)
+        with self.lock:
+            record.update(fields)
+        return record
+
+    def remove_record(self, name, record_type="A"):
+        """Delete a record out of band, without counting a request"""
+        record = self.find_record(name, record_type)
+        with self.lock:
+            del self.records[record["id"]]
+        return record
+
+    def count(self, method):
+        """Record a request and return an injected (status, message) fault, if any"""
+        now = time.monotonic()
+        with self.lock:
+            self.request_count += 1
+            self.requests_by_method[method] = self.requests_by_method.get(method, 0) + 1
+            fault = None
+            if self.rate_limit:
+                self.recent = [t for t in self.recent if now - t < self.rate_window]
+                if len(self.recent) >= self.rate_limit:
+                    fault = (429, "Rate limited")
+                else:
+                    self.recent.append(now)
+            if fault is None and self.error_rate and random.random() < self.error_rate:
+                fault = (503, "Service temporarily unavailable")
+            if fault:
+                self.responses_by_status[fault[0]] = self.responses_by_status.get(fault[0], 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        return fault
+
+    def reset_counters(self):
+        with self.lock:
+            self.request_count = 0
+            self.requests_by_method = {}
+            self.responses_by_status = {}
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Routes Cloudflare-style requests onto the server's MockCloudflare"""
+
+    protocol_version = "HTTP/1.1"
+    zones_path = re.compile(r"^/client/v4/zones/?$")
+    zone_path = re.compile(r"^/client/v4/zones/([^/]+)$")
+    verify_path = re.compile(r"^/client/v4/user/tokens/verify$")
+    records_path = re.compile(r"^/client/v4/zones/([^/]+)/dns_records(?:/([^/]+))?$")
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; without this, Nagle's
+        # algorithm plus delayed ACKs adds ~40 ms to every response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def send_json(self, status, body, headers=None):
+        # Drain any unread request body so keep-alive connections stay in sync
+        self.read_body()
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_fault(self, fault):
+        if not fault:
+            return False
+        status, message = fault
+        headers = {"Retry-After": str(max(1, round(self.api.rate_window)))} if status == 429 else {}
+        self.send_error_json(status, message, headers)
+        return True
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {"success": False, "errors": [{"code": status, "message": message}], "result": None},
+                       headers)
+
+    def parse_request(self):
+        self._body = None
+        return super().parse_request()
+
+    def read_body(self):
+        if self._body is None:
+            length = int(self.headers.get("Content-Length") or 0)
+            self._body = self.rfile.read(length) if length else b""
+        return self._body
+
+    def read_json(self):
+        return json.loads(self.read_body() or b"{}")
+
+    def route(self):
+        url = urlparse(self.path)
+        match = self.records_path.match(url.path)
+        if not match or match.group(1) not in self.api.zones:
+            return None, None, parse_qs(url.query)
+        return match.group(1), match.group(2), parse_qs(url.query)
+
+    def do_GET(self):
+        if self.send_fault(self.api.count("GET")):
+            return
+        path = urlparse(self.path).path
+        if self.zones_path.match(path):
+            return self.do_list_zones()
+        if self.verify_path.match(path):
+            return self.send_json(200, {"success": True, "errors": [],
+                                        "result": {"id": "mock-token", "status": "active"}})
+        zone_match = self.zone_path.match(path)
+        if zone_match:
+            zone_id = zone_match.group(1)
+            if zone_id not in self.api.zones:
+                return self.send_error_json(404, "Not found")
+            return self.send_json(200, {"success": True, "errors": [],
+                                        "result": {"id": zone_id, "name": self.api.zones[zone_id], "status": "active"}})
+        zone, record_id, query = self.route()
+        if zone is None or record_id:
+            return self.send_error_json(404, "Not found")
+
+        record_type = query.get("type", [None])[0]
+        name = query.get("name", [None])[0]
+
+        with self.api.lock:
+            records = [
+                r for r in self.api.records.values()
+                if r["zone_id"] == zone
+                and (record_type is None or r["type"] == record_type)
+                and (name is None or r["name"] == name)
+            ]
+        self.send_page(records, query)
+
+    def do_list_zones(self):
+        query = parse_qs(urlparse(self.path).query)
+        with self.api.lock:
+            zones = [{"id": zone_id, "name": name, "status": "active"} for zone_id, name in self.api.zones.items()]
+        self.send_page(zones, query, max_per_page=50)
+
+    def send_page(self, items, query, max_per_page=MAX_PER_PAGE):
+        page = max(1, int(query.get("page", ["1"])[0]))
+        per_page = min(max_per_page, max(1, int(query.get("per_page", ["100"])[0])))
+        total = len(items)
+        total_pages = max(1, -(-total // per_page))
+        result = items[(page - 1) * per_page:page * per_page]
+        self.send_json(200, {
+            "success": True,
+            "errors": [],
+            "result": result,
+            "result_info": {
+                "page": page,
+                "per_page": per_page,
+                "count": len(result),
+                "total_count": total,
+                "total_pages": total_pages,
+            },
+        })
+
+    def do_POST(self):
+        if self.send_fault(self.api.count("POST")):
+            return
+        zone, record_id, _ = self.route()
+        if zone is not None and record_id == "batch" and self.api.batch:
+            return self.do_batch(zone)
+        if zone is None or record_id:
+            return self.send_error_json(404, "Not found")
+        data = self.read_json()
+        if self.api.conflicts(zone, data["name"], data["type"]):
+            return self.send_error_json(400, "An A, AAAA, or CNAME record with that host already exists")
+        record = self.api.add_record(data["type"], data["name"], data["content"], zone=zone,
+                                     ttl=data.get("ttl", 300), proxied=data.get("proxied", False),
+                                     comment=data.get("comment"))
+        self.send_json(200, {"success": True, "errors": [], "result": record})
+
+    def do_batch(self, zone):
+        """Apply deletes, puts and posts atomically, in Cloudflare's order"""
+        body = self.read_json()
+        with self.api.lock:
+            missing = [item["id"] for key in ("deletes", "puts") for item in body.get(key) or []
+                       if self.api.records.get(item["id"], {}).get("zone_id") != zone]
+            if missing:
+                return self.send_error_json(400, f"Record does not exist: {missing[0]}")
+            result = {"deletes": [], "puts": [], "posts": []}
+            for item in body.get("deletes") or []:
+                result["deletes"].append(self.api.records.pop(item["id"]))
+            for item in body.get("puts") or []:
+                record = self.api.records[item["id"]]
+                record.update({k: v for k, v in item.items() if k != "id"})
+                settle(record)
+                self.api.cnames = self.api.cnames or record["type"] == "CNAME"
+                result["puts"].append(dict(record))
+        for item in body.get("posts") or []:
+            result["posts"].append(self.api.add_record(item["type"], item["name"], item["content"], zone=zone,
+                                                       ttl=item.get("ttl", 300), proxied=item.get("proxied", False),
+                                                       comment=item.get("comment")))
+        self.send_json(200, {"success": True, "errors": [], "result": result})
+
+    def do_PUT(self):
+        if self.send_fault(self.api.count("PUT")):
+            return
+        zone, record_id, _ = self.route()
+        data = self.read_json()
+        if zone and self.api.conflicts(zone, data.get("name"), data.get("type"), exclude=record_id):
+            return self.send_error_json(400, "An A, AAAA, or CNAME record with that host already exists")
+        with self.api.lock:
+            record = self.api.records.get(record_id) if zone else None
+            if record is not None and record["zone_id"] != zone:
+                record = None
+            if record is not None:
+                record.update({k: v for k, v in data.items() if k != "id"})
+                settle(record)
+                self.api.cnames = self.api.cnames or record["type"] == "CNAME"
+        if record is None:
+            return self.send_error_json(404, "Record not found")
+        self.send_json(200, {"success": True, "errors": [], "result": record})
+
+    def do_DELETE(self):
+        if self.send_fault(self.api.count("DELETE")):
+            return
+        zone, record_id, _ = self.route()
+        with self.api.lock:
+            record = self.api.records.get(record_id) if zone else None
+            if record is not None and record["zone_id"] == zone:
+                del self.api.records[record_id]
+            else:
+                record = None
+        if record is None:
+            return self.send_error_json(404, "Record not found")
+        self.send_json(200, {"success": True, "errors": [], "result": {"id": record_id}})
+
+def start_server(api, host="127.0.0.1", port=0, tls_context=None):
+    """Serve ``api`` on a background thread, returning (server, base_url).
+
+    With an ``ssl.SSLContext`` the server speaks HTTPS; handshakes run on
+    the per-connection handler threads rather than the accept loop.
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.api = api
+    scheme = "http"
+    if tls_context is not None:
+        server.socket = tls_context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://{host}:{server.server_address[1]}/client/v4"
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Cloudflare DNS API")
+    parser.add_argument("--records", type=int, default=0, help="number of records to pre-seed")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--zone", default=DEFAULT_ZONE)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--no-batch", action="store_true", help="respond 404 to /dns_records/batch")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per --rate-window before 429s")
+    parser.add_argument("--rate-window", type=float, default=1.0)
+    args = parser.parse_args()
+
+    api = MockCloudflare(zone=args.zone, latency=args.latency, batch=not args.no_batch,
+                         error_rate=args.error_rate, rate_limit=args.rate_limit, rate_window=args.rate_window)
+    api.seed(args.records)
+    server, base_url = start_server(api, port=args.port)
+    print(f"Mock Cloudflare API serving zone '{args.zone}' with {args.records} records at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
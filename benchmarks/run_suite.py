@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Run the benchmark suite offline and save the results as JSON.
+
+For each domain count a Caddyfile is generated and measured end to end
+against the local mock Cloudflare API:
+
+  parse    parse_caddyfile throughput (median of --runs)
+  sync     sync_to_cloudflare wall time and request count for a cold sync
+           (empty zone), an IP change and a no-op re-run
+  watcher  latency from a Caddyfile write to the end of the sync it
+           triggers, through the real file observer and scheduler
+
+The public IP comes from a pre-seeded IP cache, so nothing leaves the
+machine. Pass --compare with an earlier results file to flag timings that
+regressed by more than --tolerance and any increase in request counts
+(exit status 1).
+
+    python benchmarks/run_suite.py --sizes 10 100 1000 10000
+    python benchmarks/run_suite.py --compare benchmarks/results/1.0.3.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from bench_caddyfile_parse import generate_caddyfile
+from mock_cloudflare import MockCloudflare, start_server
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+# Timings this much faster than the baseline are not worth flagging as regressions
+MIN_REGRESSION_SECONDS = 0.005
+
+def bench_parse(updater, content, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        domains = updater.parse_caddyfile(content)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    lines = content.count("\n")
+    return domains, {"lines": lines, "median_s": median, "lines_per_sec": lines / median}
+
+def timed_sync(updater, api, domains, ip):
+    api.reset_counters()
+    start = time.perf_counter()
+    summary = updater.sync_to_cloudflare(domains, ip)
+    return {
+        "wall_s": time.perf_counter() - start,
+        "requests": api.request_count,
+        "requests_by_method": dict(api.requests_by_method),
+        "summary": summary,
+    }
+
+def bench_watcher(updater, path, content, edits, settle):
+    """Median seconds from a Caddyfile write to the end of the sync it triggers"""
+    from watcher import CoalescingScheduler, start_observer
+
+    done = threading.Event()
+
+    class Scheduler(CoalescingScheduler):
+        def completed(self, event_time, ok):
+            done.set()
+
+    def sync():
+        updater.run_sync()
+        return True
+
+    scheduler = Scheduler(sync, settle=settle, name="suite-sync").start()
+    observer = start_observer(path, scheduler.submit)
+    latencies = []
+    try:
+        time.sleep(0.2)
+        for i in range(edits):
+            done.clear()
+            content += f"edit{i}.example.net {{\n    respond {i}\n}}\n"
+            start = time.perf_counter()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            if not done.wait(60):
+                raise RuntimeError("watcher did not trigger a sync within 60s")
+            latencies.append(time.perf_counter() - start)
+            # Let stray events from this write settle before the next one
+            time.sleep(settle + 0.2)
+    finally:
+        observer.stop()
+        observer.join()
+        scheduler.stop(10)
+    return {"edits": edits, "settle_s": settle, "median_s": statistics.median(latencies), "max_s": max(latencies)}
+
+def run_size(updater, count, args, workdir):
+    content, sites = generate_caddyfile(domains=count)
+    domains, parse = bench_parse(updater, content, args.runs)
+
+    api = MockCloudflare(latency=args.latency, error_rate=args.error_rate)
+    server, base_url = start_server(api)
+    path = os.path.join(workdir, f"Caddyfile.{count}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    state_file = os.path.join(workdir, f"state.{count}.json")
+    ip_cache = os.path.join(workdir, f"ip.{count}.json")
+    os.environ.update(CF_API_URL=base_url, CF_ZONE_ID=api.zone, CF_DOMAIN=api.domain, STATE_FILE=state_file,
+                      CADDYFILE_PATH=path, IP_CACHE_FILE=ip_cache, IP_CACHE_TTL="86400",
+                      RECORD_CACHE_FILE=os.path.join(workdir, f"records.{count}.json"))
+    updater._client = None
+    updater._domain_cache.clear()
+    try:
+        sync = {
+            "cold": timed_sync(updater, api, domains, OLD_IP),
+            "ip_change": timed_sync(updater, api, domains, NEW_IP),
+            "noop": timed_sync(updater, api, domains, NEW_IP),
+        }
+        import ipdetect
+        ipdetect.save_cached_ip(ip_cache, NEW_IP, time.time())
+        watcher = bench_watcher(updater, path, content, args.edits, args.settle)
+    finally:
+        server.shutdown()
+    return {"domains": len(domains), "sites": sites, "parse": parse, "sync": sync, "watcher": watcher}
+
+def flatten(results):
+    """{(domains, metric path): value} for every timing and request count"""
+    flat = {}
+    for entry in results["results"]:
+        def walk(node, path):
+            for key, value in node.items():
+                if isinstance(value, dict) and key not in ("summary", "requests_by_method"):
+                    walk(value, path + (key,))
+                elif key.endswith("_s") or key == "requests":
+                    flat[(entry["domains"], ".".join(path + (key,)))] = value
+        walk(entry, ())
+    return flat
+
+def compare(baseline, current, tolerance):
+    """Print metrics that regressed against ``baseline``, returning how many did"""
+    old, new = flatten(baseline), flatten(current)
+    regressions = 0
+    for key in sorted(new.keys() & old.keys()):
+        before, after = old[key], new[key]
+        if key[1].endswith("requests"):
+            regressed = after > before
+        elif key[1].endswith("settle_s"):
+            continue
+        else:
+            regressed = after > before * (1 + tolerance) and after - before > MIN_REGRESSION_SECONDS
+        if regressed:
+            regressions += 1
+            print(f"REGRESSION {key[0]:>6} domains {key[1]:<28} {before:.4g} -> {after:.4g}")
+    print(f"{regressions} regressions against {baseline.get('version')} ({baseline.get('timestamp')})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=5, help="parse runs per size")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated API round trip (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API requests answered with 503")
+    parser.add_argument("--edits", type=int, default=3, help="Caddyfile writes timed per size")
+    parser.add_argument("--settle", type=float, default=0.1, help="WATCH_SETTLE_SECONDS for the watcher run")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<version>.json)")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="caddy-suite-")
+    os.environ.update(CF_API_TOKEN="mock", LOG_LEVEL="WARNING", LOG_FILE=os.devnull, ZONE_CACHE_FILE="",
+                      METRICS_TEXTFILE="", DELETE_STALE_RECORDS="false")
+    logging.disable(logging.WARNING)
+    import main as updater
+
+    results = {
+        "version": updater.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: getattr(args, key) for key in ("runs", "latency", "error_rate", "edits", "settle")},
+        "results": [],
+    }
+    print(f"{'domains':>8} {'parse lines/s':>14} {'cold (s)':>9} {'reqs':>5} {'ip change (s)':>14} {'reqs':>5} "
+          f"{'noop reqs':>10} {'watcher (s)':>12}")
+    try:
+        for count in args.sizes:
+            entry = run_size(updater, count, args, workdir)
+            results["results"].append(entry)
+            sync = entry["sync"]
+            print(f"{entry['domains']:>8} {entry['parse']['lines_per_sec']:>14,.0f} {sync['cold']['wall_s']:>9.3f} "
+                  f"{sync['cold']['requests']:>5} {sync['ip_change']['wall_s']:>14.3f} "
+                  f"{sync['ip_change']['requests']:>5} {sync['noop']['requests']:>10} "
+                  f"{entry['watcher']['median_s']:>12.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                         f"{results['version']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
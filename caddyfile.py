@@ -0,0 +1,446 @@
+"""
+Caddyfile lexer and site address extraction.
+
+Follows Caddy's own rules closely enough to find every site a Caddyfile
+serves: tokens are whitespace separated (with "quoted" and `backtick`
+tokens and heredocs), ``#`` starts a comment only at the beginning of a
+token, and only top-level blocks are site blocks. Snippets and top-level
+``import`` of files or globs are expanded, ``{$ENV}`` placeholders are
+substituted, and a brace-less Caddyfile is treated as a single site.
+A ``# cloudflare: ...`` comment at the end of a site's address line, or
+on the lines directly above it, is kept as that site's record options
+(see recordoptions).
+
+A directory or glob of Caddyfiles (one site per file, as in ``sites.d/``)
+is handled by ``CaddyfileSet``, which parses each file on its own and
+re-parses only the files that changed.
+"""
+
+import os
+import re
+import glob
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# One token per match: a newline, a run of blanks, a comment, a quoted or
+# backtick token, or a bare word
+_TOKEN_RE = re.compile(r'''
+    (?P<nl>\n)
+  | (?P<blank>[ \t\r]+)
+  | (?P<comment>\#[^\n]*)
+  | "(?P<quoted>(?:[^"\\]|\\.)*)"
+  | `(?P<backtick>[^`]*)`
+  | (?P<word>[^\s"`#][^\s]*|\#)
+''', re.VERBOSE | re.DOTALL)
+_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+_ENV_RE = re.compile(r'\{\$([A-Za-z_][A-Za-z0-9_]*)(?::([^}]*))?\}')
+_ARGS_RE = re.compile(r'\{args(?:\[(\d+)\]|\.(\d+))\}')
+_HEREDOC_RE = re.compile(r'<<([A-Za-z0-9_-]+)$')
+# Lines the plain str.split() fast path cannot handle
+_SPECIAL_LINE_RE = re.compile(r'["`#]|<<|\S\{(?:\s|\Z)')
+_GLOB_CHARS = re.compile(r'[*?\[]')
+# A record options comment, alone on its line or after the tokens of one
+_DIRECTIVE_RE = re.compile(r'^([^\n#]*)\#[ \t]*cloudflare:([^\n]*)$', re.MULTILINE)
+
+def _substitute_env(text):
+    """Replace {$VAR} and {$VAR:default} with environment values, as Caddy does before lexing"""
+    if '{$' not in text:
+        return text
+    return _ENV_RE.sub(lambda m: os.getenv(m.group(1), m.group(2) or ""), text)
+
+def _lex_line(text, pos, line, source, append):
+    """Lex tokens from ``pos`` through the end of the line (including multi-line quoted
+    tokens and heredocs), returning the position and line number after it"""
+    match = _TOKEN_RE.match
+    end = len(text)
+    while pos < end:
+        m = match(text, pos)
+        if m is None:
+            raise ValueError(f"{source}:{line}: unterminated quoted token")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "word":
+            word = m.group("word")
+            heredoc = _HEREDOC_RE.match(word) if word.startswith("<<") else None
+            if heredoc:
+                marker = heredoc.group(1)
+                close = re.compile(rf'^[ \t]*{re.escape(marker)}(?=[ \t\r\n]|$)', re.MULTILINE).search(text, pos)
+                if close is None:
+                    raise ValueError(f"{source}:{line}: heredoc <<{marker} is never closed")
+                body = text[pos:close.start()]
+                append((body.strip("\n"), line, True))
+                line += body.count("\n")
+                pos = close.end()
+            elif len(word) > 1 and word[-1] == "{" and word.count("{") > word.count("}"):
+                # Be lenient with "example.com{", which Caddy itself rejects
+                append((word[:-1], line, False))
+                append(("{", line, False))
+            else:
+                append((word, line, False))
+        elif kind == "nl":
+            return pos, line + 1
+        elif kind == "quoted":
+            raw = m.group("quoted")
+            append((_ESCAPE_RE.sub(r'\1', raw) if '\\' in raw else raw, line, True))
+            line += raw.count("\n")
+        elif kind == "backtick":
+            raw = m.group("backtick")
+            append((raw, line, True))
+            line += raw.count("\n")
+    return pos, line
+
+def tokenize(text, source="Caddyfile"):
+    """Split Caddyfile text into (text, line, quoted) tokens.
+
+    Most lines are plain whitespace-separated words and are split directly;
+    only lines with quotes, comments, heredocs or an attached brace go
+    through the full regex lexer.
+    """
+    text = _substitute_env(text)
+    tokens = []
+    append = tokens.append
+    next_special = _SPECIAL_LINE_RE.search
+    line = 1
+    pos = 0
+    end = len(text)
+    while pos < end:
+        special = next_special(text, pos)
+        # Split every plain line up to the start of the next special one in bulk
+        stop = max(pos, text.rfind("\n", pos, special.start()) + 1) if special else end
+        if stop > pos:
+            lines = text[pos:stop].split("\n")
+            if special:
+                lines.pop()  # empty remainder after the region's final newline
+            for raw in lines:
+                for word in raw.split():
+                    append((word, line, False))
+                line += 1
+            pos = stop
+        if special:
+            pos, line = _lex_line(text, pos, line, source, append)
+    return tokens
+
+def _directive_lines(text):
+    """{line: (options text, whole-line comment)} for every ``# cloudflare:`` comment in ``text``"""
+    directives = {}
+    if "cloudflare:" not in text:
+        return directives
+    line = 1
+    pos = 0
+    for m in _DIRECTIVE_RE.finditer(text):
+        before = m.group(1)
+        if before and before[-1] not in " \t":
+            # "#" only starts a comment at the beginning of a token
+            continue
+        line += text.count("\n", pos, m.start())
+        pos = m.start()
+        directives[line] = (m.group(2).strip(), not before.strip())
+    return directives
+
+def _site_directive(directives, line):
+    """Options text for a site whose addresses start on ``line``, or None"""
+    parts = []
+    if line in directives and not directives[line][1]:
+        parts.append(directives[line][0])
+    above = line - 1
+    while above in directives and directives[above][1]:
+        parts.insert(0, directives[above][0])
+        above -= 1
+    return " ".join(parts) if parts else None
+
+def _is_open(token):
+    return token[0] == "{" and not token[2]
+
+def _is_close(token):
+    return token[0] == "}" and not token[2]
+
+def _block_end(tokens, start, source):
+    """Index just past the block whose opening brace is at ``start``"""
+    depth = 0
+    for i in range(start, len(tokens)):
+        token = tokens[i]
+        if token[2]:
+            continue
+        if token[0] == "{":
+            depth += 1
+        elif token[0] == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    raise ValueError(f"{source}:{tokens[start][1]}: unclosed block")
+
+def _substitute_args(tokens, args):
+    """Replace {args[N]} / {args.N} placeholders in imported tokens"""
+    if not args:
+        return tokens
+    result = []
+    for text, line, quoted in tokens:
+        if text == "{args[:]}":
+            result.extend((arg, line, quoted) for arg in args)
+            continue
+        if "{args" in text:
+            text = _ARGS_RE.sub(lambda m: args[int(m.group(1) or m.group(2))]
+                                if int(m.group(1) or m.group(2)) < len(args) else "", text)
+        result.append((text, line, quoted))
+    return result
+
+def site_host(address):
+    """Hostname part of a site address (scheme, port and path stripped), or None"""
+    if "://" in address:
+        address = address.split("://", 1)[1]
+    address = address.split("/", 1)[0]
+    if not address or address.startswith("["):
+        # Port-only address or IPv6 literal
+        return None
+    host = address.rsplit(":", 1)[0] if ":" in address else address
+    host = host.rstrip(".").lower()
+    if not host or "{" in host:
+        return None
+    return host
+
+class CaddyfileParser:
+    """Walks top-level Caddyfile structure, collecting site hosts, their record options and every file read"""
+
+    def __init__(self):
+        self.hosts = set()
+        self.options = {}
+        self.directives = {}
+        self.snippets = {}
+        self.files = set()
+        self.directories = set()
+
+    def parse_file(self, path):
+        path = os.path.abspath(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.files.add(path)
+        return self.parse(content, source=path)
+
+    def parse(self, content, source="Caddyfile"):
+        base_dir = os.path.dirname(source) if os.path.isabs(source) else os.getcwd()
+        tokens = tokenize(content, source)
+        self.directives[source] = _directive_lines(content)
+        self._walk(tokens, source, base_dir, chain=(source,), root=True)
+        return self.hosts
+
+    def _walk(self, tokens, source, base_dir, chain, root=False):
+        i = 0
+        n = len(tokens)
+        first_block = True
+        while i < n:
+            # A head is the tokens of one line, continued while it ends with a comma
+            line = first_line = tokens[i][1]
+            head = []
+            while i < n and not _is_open(tokens[i]) and (tokens[i][1] == line or
+                                                            (head and head[-1].endswith(","))):
+                if _is_close(tokens[i]):
+                    raise ValueError(f"{source}:{tokens[i][1]}: unexpected '}}'")
+                head.append(tokens[i][0])
+                line = tokens[i][1]
+                i += 1
+            # Caddy wants the brace at the end of the address line; tolerate it on the next one
+            has_block = i < n and _is_open(tokens[i]) and (not head or head[0] != "import")
+
+            if has_block:
+                end = _block_end(tokens, i, source)
+                if not head:
+                    # Global options block
+                    pass
+                elif len(head) == 1 and head[0].startswith("(") and head[0].endswith(")"):
+                    self.snippets[head[0][1:-1]] = tokens[i + 1:end - 1]
+                else:
+                    self._add_sites(head, source, first_line)
+                    first_block = False
+                i = end
+                continue
+
+            if head and head[0] == "import":
+                if len(head) < 2:
+                    raise ValueError(f"{source}:{line}: import requires a file or snippet name")
+                self._import(head[1], head[2:], source, base_dir, chain)
+            elif head and root and first_block and not self.hosts:
+                # A Caddyfile without braces is a single site block; its first line holds the addresses
+                self._add_sites(head, source, first_line)
+                return
+            elif head:
+                logger.debug("%s:%s: ignoring top-level line outside a site block: %s", source, line, ' '.join(head))
+            if not head:
+                i += 1
+
+    def _add_sites(self, head, source, line):
+        directive = _site_directive(self.directives.get(source, {}), line)
+        for token in head:
+            for address in token.split(","):
+                host = site_host(address.strip())
+                if host:
+                    self.hosts.add(host)
+                    if directive:
+                        self.options[host] = directive
+
+    def _import(self, target, args, source, base_dir, chain):
+        if target in self.snippets:
+            if target in chain:
+                raise ValueError(f"{source}: snippet '{target}' imports itself")
+            tokens = _substitute_args(self.snippets[target], args)
+            self._walk(tokens, source, base_dir, chain + (target,))
+            return
+
+        pattern = target if os.path.isabs(target) else os.path.join(base_dir, target)
+        if _GLOB_CHARS.search(target):
+            paths = sorted(glob.glob(pattern))
+            self.directories.add(os.path.dirname(pattern))
+            if not paths:
+                logger.warning("%s: import pattern %s matched no files", source, target)
+        elif os.path.exists(pattern):
+            paths = [pattern]
+        else:
+            raise ValueError(f"{source}: imported file {target} not found")
+
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in chain:
+                raise ValueError(f"{source}: import cycle through {path}")
+            if os.path.isdir(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            self.files.add(path)
+            self.directives[path] = _directive_lines(content)
+            tokens = _substitute_args(tokenize(content, path), args)
+            self._walk(tokens, path, os.path.dirname(path), chain + (path,))
+
+def parse(content, source="Caddyfile"):
+    """Return the set of site hostnames served by Caddyfile ``content``"""
+    return CaddyfileParser().parse(content, source)
+
+def parse_file(path):
+    """Return (site hostnames, dependencies, options) for the Caddyfile at ``path``.
+
+    ``dependencies`` lists every file read and every directory globbed
+    while following imports, for use with ``files_signature``. ``options``
+    maps hostnames to the text of their ``# cloudflare:`` comments.
+    """
+    parser = CaddyfileParser()
+    parser.parse_file(path)
+    return parser.hosts, tuple(sorted(parser.files | parser.directories)), parser.options
+
+def files_signature(paths):
+    """Stat signature of the given files and directories; changes when any is edited, replaced, added or removed"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append((path, None, None, None))
+            continue
+        signature.append((path, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def is_file_set(spec):
+    """True when ``spec`` names several Caddyfiles: a directory or a glob pattern"""
+    return glob.has_magic(spec) or os.path.isdir(spec)
+
+def file_set_root(spec):
+    """Directory containing every file a directory or glob spec can match"""
+    if not glob.has_magic(spec):
+        return spec
+    parts = []
+    for part in spec.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return "/".join(parts) or "."
+
+def _skipped(name):
+    # Hidden files (including Kubernetes ..data directories) and editor backups
+    return name.startswith(".") or name.endswith(("~", ".swp", ".tmp"))
+
+def expand_file_set(spec):
+    """Sorted Caddyfile paths in a directory tree, or matching a glob (``**`` recurses)"""
+    if glob.has_magic(spec):
+        paths = [path for path in glob.iglob(spec, recursive=True) if os.path.isfile(path)]
+    else:
+        paths = []
+        for directory, subdirs, names in os.walk(spec, followlinks=True):
+            subdirs[:] = [d for d in subdirs if not _skipped(d)]
+            paths.extend(os.path.join(directory, name) for name in names)
+    return sorted(os.path.abspath(path) for path in paths if not _skipped(os.path.basename(path)))
+
+def file_set_directories(spec):
+    """Every directory under a file set's root; adding or removing a file changes one of their mtimes"""
+    directories = []
+    for directory, subdirs, _ in os.walk(file_set_root(spec), followlinks=True):
+        subdirs[:] = [d for d in subdirs if not _skipped(d)]
+        directories.append(os.path.abspath(directory))
+    return sorted(directories)
+
+class CaddyfileSet:
+    """Site hosts of every Caddyfile in a directory or glob, parsed and cached per file.
+
+    Each file's hosts are cached with the signature (inode, mtime, size) of
+    every file it read, imports included. ``refresh()`` re-parses only new
+    or changed files and keeps a reference-counted union, so a host defined
+    in several files is dropped only when the last of them drops it. A file
+    that fails to parse keeps its last good hosts until it is fixed.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.entries = {}
+        self.counts = Counter()
+        self.directories = ()
+        self.failed = []
+
+    def _drop(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.counts.subtract(entry[2])
+            for host in entry[2]:
+                if self.counts[host] <= 0:
+                    del self.counts[host]
+
+    def refresh(self):
+        """Bring the union up to date, returning the number of files parsed"""
+        # Taken before listing, so a file added meanwhile shows up as a change next time
+        self.directories = files_signature(file_set_directories(self.spec))
+        current = expand_file_set(self.spec)
+        self.failed = []
+        for path in set(self.entries) - set(current):
+            self._drop(path)
+        parsed = 0
+        for path in current:
+            entry = self.entries.get(path)
+            if entry is not None and files_signature(entry[0]) == entry[1]:
+                continue
+            try:
+                hosts, dependencies, options = parse_file(path)
+            except (OSError, ValueError) as e:
+                logger.error("Failed to parse %s, keeping its previous sites: %s", path, e)
+                self.failed.append(path)
+                continue
+            self._drop(path)
+            self.entries[path] = (dependencies, files_signature(dependencies), frozenset(hosts), options)
+            self.counts.update(hosts)
+            parsed += 1
+        return parsed
+
+    def hosts(self):
+        return set(self.counts)
+
+    def options(self):
+        """Record options comments of every file, later files winning for a host defined twice"""
+        merged = {}
+        for path in sorted(self.entries):
+            merged.update(self.entries[path][3])
+        return merged
+
+    def signature(self):
+        """Stat signature of the set as of the last refresh: its directories and every file parsed.
+
+        Files that failed to parse get a signature no file can match, so the
+        set never looks unchanged while one of them is broken.
+        """
+        parsed = tuple(item for path in sorted(self.entries) for item in self.entries[path][1])
+        return self.directories + parsed + tuple((path, None, None, None) for path in self.failed)
@@ -0,0 +1,69 @@
+"""
+Site hostnames from Caddy's native JSON config.
+
+Reads the config from a file or from the admin API (``GET /config/``) and
+collects the ``match[].host[]`` values of every server's routes, error
+routes and named routes, including routes nested in ``subroute``
+handlers. With ``ijson`` installed the document is walked as a stream of
+parse events, so large configs are never held in memory as Python
+objects; without it the decoded document is walked iteratively. Both
+walks visit the same routes.
+"""
+
+import re
+import json
+import logging
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+HOST_SUFFIX = ".match.item.host.item"
+# ijson prefixes of the host matchers iter_hosts_decoded visits; ijson joins keys with dots, so
+# server and route names are taken to have none (Caddy's adapters name servers srv0, srv1, ...)
+HOST_PREFIX = re.compile(r"apps\.http\.servers\.[^.]+\.(?:routes\.item|errors\.routes\.item|named_routes\.[^.]+)"
+                         r"(?:\.handle\.item\.routes\.item)*" + re.escape(HOST_SUFFIX))
+
+def is_admin_url(source):
+    return source.startswith(("http://", "https://"))
+
+def iter_hosts_streaming(stream):
+    """Yield host matchers from a binary JSON stream using ijson parse events"""
+    for prefix, event, value in ijson.parse(stream):
+        if event == "string" and prefix.endswith(HOST_SUFFIX) and HOST_PREFIX.fullmatch(prefix):
+            yield value
+
+def iter_hosts_decoded(config):
+    """Yield host matchers from a decoded config, walking routes and subroutes with an explicit stack"""
+    servers = ((config or {}).get("apps") or {}).get("http", {}).get("servers") or {}
+    stack = []
+    for server in servers.values():
+        stack.append(server.get("routes") or ())
+        stack.append((server.get("errors") or {}).get("routes") or ())
+        stack.append(tuple((server.get("named_routes") or {}).values()))
+    while stack:
+        for route in stack.pop():
+            for matcher in route.get("match") or ():
+                yield from (host for host in matcher.get("host") or () if isinstance(host, str))
+            for handler in route.get("handle") or ():
+                if handler.get("routes"):
+                    stack.append(handler["routes"])
+
+def iter_hosts(stream):
+    """Yield every HTTP route host matcher in a binary JSON config stream"""
+    if ijson is not None:
+        return iter_hosts_streaming(stream)
+    return iter_hosts_decoded(json.load(stream))
+
+def load_hosts(source, session, timeout=10):
+    """Return the set of host matchers from a config file path or admin API URL"""
+    if is_admin_url(source):
+        with session.get(source, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return set(iter_hosts(response.raw))
+    with open(source, 'rb') as f:
+        return set(iter_hosts(f))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Plan/apply mode: review a sync's changes before making them.
+
+``plan`` detects the public IP, reads the Caddy config, lists each zone
+once and writes the resulting changeset as JSON: the records to create,
+update (with their ids and current content) and delete, per zone.
+``apply --plan`` validates that file as a whole before the first write,
+then applies exactly that changeset with bulk writes and no second
+listing, and records the outcome in the snapshot like a regular sync.
+
+    python changeset.py plan --output plan.json
+    python changeset.py apply --plan plan.json
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import main
+import state
+import metrics
+import logsetup
+import cloudflare
+import recordoptions
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+def snapshot_digest(snapshot):
+    """Fingerprint of a zone's applied state, so apply can tell when a sync ran after the plan"""
+    if not snapshot:
+        return None
+    return hashlib.sha256(json.dumps(snapshot, sort_keys=True).encode("utf-8")).hexdigest()
+
+def plan_zone(zone, zone_name, fqdns, addresses, client):
+    """List one zone and plan its changes, returning the zone's entry in the plan"""
+    snapshot = state.load_snapshot(state.get_state_file(), zone)
+    fqdns, options = main.get_site_options(fqdns, zone_name)
+    record_types = main.managed_types(addresses, options, snapshot)
+    comment = main.get_owner_comment()
+    logger.info("Fetching existing DNS records for zone %s", zone_name or zone)
+    type_filter, name_filter = main.listing_filters(fqdns, record_types, comment)
+    with metrics.PHASE_SECONDS.time(phase="zone_listing"):
+        existing, owned = main.existing_from_listing(
+            zone, main.iter_dns_records(zone, client, record_type=type_filter, name=name_filter),
+            fqdns, record_types, comment
+        )
+    changes, applied = main.plan_zone(zone, fqdns, addresses, snapshot, existing, owned, comment, options)
+    return {
+        "zone_id": zone,
+        "zone": zone_name,
+        "base": snapshot_digest(snapshot),
+        "create": changes["create"],
+        "update": changes["update"],
+        "delete": changes["delete"],
+        "unchanged": changes["unchanged"],
+        "domains": sorted(fqdns),
+        # Sites with other than the built-in options, so apply records what the records were written with
+        "options": {name: list(site) for name, site in sorted(options.items()) if site != recordoptions.BUILTIN},
+        "applied": applied,
+    }
+
+def build_plan():
+    """Detect the IP, read the domains and plan every zone, returning the plan document"""
+    zone, multi_zone = main.get_zone_config()
+    client = main.get_client()
+    with metrics.PHASE_SECONDS.time(phase="ip_detect"):
+        ips = main.get_public_ips()
+    with metrics.PHASE_SECONDS.time(phase="domains"):
+        domains = main.get_domains()
+    fqdns = main.qualify_domains(domains)
+
+    if not fqdns:
+        grouped = {}
+    elif multi_zone:
+        grouped, _ = main.group_by_zone(fqdns, client)
+    else:
+        grouped = {zone: (os.getenv("CF_DOMAIN"), fqdns)}
+
+    workers = max(1, int(os.getenv("CF_ZONE_WORKERS", "4")))
+    with ThreadPoolExecutor(max_workers=min(workers, len(grouped) or 1)) as pool:
+        futures = [pool.submit(logsetup.bind(plan_zone), zone_id, zone_name, names, ips, client)
+                   for zone_id, (zone_name, names) in grouped.items()]
+        planned = [future.result() for future in futures]
+    return {
+        "version": PLAN_VERSION,
+        "updater": main.__version__,
+        "created_at": time.time(),
+        "ips": ips,
+        "zones": planned,
+    }
+
+def validate_plan(plan):
+    """Check a whole plan before anything is written, returning a list of problems (empty when valid)"""
+    if plan.get("version") != PLAN_VERSION:
+        return [f"unsupported plan version {plan.get('version')!r} (expected {PLAN_VERSION})"]
+    problems = []
+    for record_type, ip in plan.get("ips", {}).items():
+        try:
+            if main.record_type_for(ip) != record_type:
+                problems.append(f"{ip} is not an {record_type} address")
+        except ValueError:
+            problems.append(f"invalid IP {ip!r} for {record_type} records")
+    snapshots = {}
+    for entry in plan.get("zones", ()):
+        zone = entry.get("zone_id")
+        label = entry.get("zone") or zone
+        if not zone:
+            problems.append("zone entry without a zone_id")
+            continue
+        if zone in snapshots:
+            problems.append(f"zone {label} appears twice")
+        snapshot = snapshots[zone] = state.load_snapshot(state.get_state_file(), zone)
+        if snapshot_digest(snapshot) != entry.get("base"):
+            problems.append(f"zone {label} was synced after the plan was made; run plan again")
+
+        targets = set()
+        writes = ([("create", data) for data in entry.get("create", ())] +
+                  [("update", item.get("data") or {}) for item in entry.get("update", ())] +
+                  [("delete", item) for item in entry.get("delete", ())])
+        for action, record in writes:
+            name, record_type = record.get("name"), record.get("type")
+            if (name, record_type) in targets:
+                problems.append(f"{label}: more than one change to {name} ({record_type})")
+            targets.add((name, record_type))
+            if record_type not in ("A", "AAAA", "CNAME"):
+                problems.append(f"{label}: {action} of {name} has unsupported record type {record_type!r}")
+                continue
+            if not name or not main.is_valid_domain(name):
+                problems.append(f"{label}: {action} has invalid name {name!r}")
+            elif entry.get("zone") and name != entry["zone"] and not name.endswith(f".{entry['zone']}"):
+                problems.append(f"{label}: {name} is outside the zone")
+            if action != "delete" and record_type == "CNAME":
+                if not main.is_valid_domain(record.get("content") or ""):
+                    problems.append(f"{label}: invalid CNAME target {record.get('content')!r} for {name}")
+            elif action != "delete":
+                try:
+                    if main.record_type_for(record.get("content", "")) != record_type:
+                        problems.append(f"{label}: {record['content']} is not valid {record_type} content "
+                                        f"for {name}")
+                except ValueError:
+                    problems.append(f"{label}: invalid {record_type} content {record.get('content')!r} for {name}")
+        for action in ("update", "delete"):
+            for item in entry.get(action, ()):
+                if not item.get("id"):
+                    name = item.get("name") or (item.get("data") or {}).get("name")
+                    problems.append(f"{label}: {action} of {name} has no record id")
+    return problems
+
+def describe_settings(data):
+    """TTL and proxying of planned record data, as shown in the summary"""
+    ttl = "auto" if data["ttl"] == recordoptions.AUTO_TTL else data["ttl"]
+    return f"ttl={ttl}" + (" proxied" if data["proxied"] else "")
+
+def describe_plan(plan, stream=sys.stderr):
+    """Write a human-readable summary of the plan, one line per change"""
+    for entry in plan["zones"]:
+        stream.write(f"Zone {entry['zone'] or entry['zone_id']}: {len(entry['create'])} to create, "
+                     f"{len(entry['update'])} to update, {len(entry['delete'])} to delete, "
+                     f"{len(entry['unchanged'])} unchanged\n")
+        for data in entry["create"]:
+            stream.write(f"  + {data['type']:<5} {data['name']} {data['content']} {describe_settings(data)}\n")
+        for item in entry["update"]:
+            data = item["data"]
+            stream.write(f"  ~ {data['type']:<5} {data['name']} {item['current']} -> {data['content']} "
+                         f"{describe_settings(data)} ({item['id']})\n")
+        for item in entry["delete"]:
+            stream.write(f"  - {item['type']:<5} {item['name']} ({item['id']})\n")
+
+def apply_plan(plan):
+    """Apply every zone's changeset from a validated plan, returning the combined summary"""
+    client = main.get_client()
+    addresses = plan["ips"]
+    summary = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+    for entry in plan["zones"]:
+        zone = entry["zone_id"]
+        changes = {action: entry[action] for action in ("create", "update", "delete", "unchanged")}
+        logger.info("Applying %d planned changes to zone %s",
+                    len(changes['create']) + len(changes['update']) + len(changes['delete']), entry['zone'] or zone)
+        try:
+            # Exactly the planned changes: a record that vanished since is a failure, not a re-create
+            results = main.apply_changes(zone, client, changes)
+        except requests.RequestException as e:
+            logger.error("Cloudflare API request failed: %s", cloudflare.describe_error(e))
+            raise
+        options = {name: recordoptions.Options(*site) for name, site in entry.get("options", {}).items()}
+        zone_summary = main.finish_zone(zone, set(entry["domains"]), addresses, changes, entry["applied"], results,
+                                        plan["created_at"], options)
+        for key in summary:
+            summary[key] += zone_summary[key]
+    return summary
+
+def run_plan(output):
+    plan = build_plan()
+    describe_plan(plan)
+    if output and output != "-":
+        tmp_path = f"{output}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, indent=2)
+        os.replace(tmp_path, output)
+        logger.info("Plan written to %s", output)
+    else:
+        json.dump(plan, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return 0
+
+def run_apply(path):
+    start = time.perf_counter()
+    result = "failure"
+    summary = None
+    with logsetup.sync_context():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                plan = json.load(f)
+            problems = validate_plan(plan)
+            if problems:
+                for problem in problems:
+                    logger.error("Invalid plan: %s", problem)
+                logger.error("Nothing applied: %d problems in %s", len(problems), path)
+                return 1
+            logger.info("Applying plan from %s (made %.0fs ago)", path, time.time() - plan['created_at'])
+            summary = apply_plan(plan)
+            for outcome, count in summary.items():
+                metrics.RECORDS.set(count, outcome=outcome)
+            if summary["failed"]:
+                logger.error("%d planned DNS changes could not be applied", summary['failed'])
+                return 1
+            result = "success"
+            return 0
+        finally:
+            main.record_run(start, result, summary=summary)
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Plan DNS changes for review, then apply exactly that plan")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser("plan", help="list the zones once and write the changeset as JSON")
+    plan_parser.add_argument("--output", "-o", help="plan file to write (default: stdout)")
+    apply_parser = commands.add_parser("apply", help="validate and apply a plan file without listing the zones")
+    apply_parser.add_argument("--plan", required=True, help="plan file written by the plan command")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "plan":
+            return run_plan(args.output)
+        return run_apply(args.plan)
+    except Exception as e:
+        logger.error("%s failed: %s", args.command, e)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,210 @@
+"""
+Pooled Cloudflare API v4 client.
+
+One ``CloudflareClient`` owns an authenticated ``requests.Session`` whose
+connection pool is sized for the updater's worker threads, so every call
+reuses an open TCP+TLS connection instead of handshaking per record.
+Calls go through a shared token bucket and are retried on 429. Idempotent
+methods are also retried on 5xx and connection errors; a POST only when it
+never reached Cloudflare, so a create that went through is never repeated. With CF_HTTP2=true and ``httpx[http2]`` installed the
+session sends requests over a multiplexed HTTP/2 connection instead.
+"""
+
+import os
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter, BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+import ratelimit
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://api.cloudflare.com/client/v4"
+
+# Methods safe to repeat when a response is lost: the second call has the same effect as the first
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE"})
+
+def error_details(e):
+    """Cloudflare's error messages from a failed request, formatted for appending to a log line"""
+    response = getattr(e, "response", None)
+    if response is None:
+        return ""
+    try:
+        body = response.json()
+    except ValueError:
+        text = response.text
+        return f" - Response: {text[:200] if text else 'No response body'}"
+    if not isinstance(body, dict):
+        return ""
+    if body.get("errors"):
+        messages = [err.get("message", str(err)) if isinstance(err, dict) else str(err) for err in body["errors"]]
+        return f" - API Errors: {'; '.join(messages)}"
+    if "message" in body:
+        return f" - API Message: {body['message']}"
+    return ""
+
+def describe_error(e):
+    """An exception followed by any error details Cloudflare returned"""
+    return f"{e}{error_details(e)}"
+
+def never_sent(e):
+    """True when a failed request never reached the server: a connect timeout or a refused connection"""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if not isinstance(e, requests.ConnectionError) or isinstance(e, requests.Timeout):
+        return False
+    cause = e.args[0] if e.args else None
+    # urllib3 wraps the cause in MaxRetryError; HTTP2Adapter passes the httpx error on as it is
+    cause = getattr(cause, "reason", cause)
+    return isinstance(cause, NewConnectionError) or (httpx is not None and isinstance(cause, httpx.ConnectError))
+
+class HTTP2Adapter(BaseAdapter):
+    """requests transport adapter that sends requests through an HTTP/2 ``httpx.Client``.
+
+    Responses and errors are translated back to their ``requests``
+    equivalents, so callers handle both transports the same way.
+    """
+
+    def __init__(self, pool_size, timeout):
+        super().__init__()
+        self.client = httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        try:
+            reply = self.client.request(request.method, request.url, headers=dict(request.headers),
+                                        content=request.body, timeout=timeout)
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(e, request=request)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e, request=request)
+
+        response = requests.Response()
+        response.status_code = reply.status_code
+        response.reason = reply.reason_phrase
+        # httpx has already decoded any gzip body
+        response.headers = CaseInsensitiveDict((k, v) for k, v in reply.headers.items() if k.lower() != "content-encoding")
+        response._content = reply.content
+        response.encoding = reply.encoding
+        response.url = str(reply.url)
+        response.request = request
+        return response
+
+    def close(self):
+        self.client.close()
+
+class CloudflareClient:
+    """Authenticated, connection-pooled Cloudflare API client shared by every caller in a process"""
+
+    def __init__(self, token, base_url=DEFAULT_API_BASE, rate_limiter=None, max_retries=5,
+                 pool_size=32, timeout=(5, 30), http2=False):
+        self.base_url = base_url.rstrip('/')
+        self.rate_limiter = rate_limiter or ratelimit.TokenBucket(0, 1)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        if http2 and httpx is None:
+            logger.warning("CF_HTTP2 requested but httpx is not installed, using HTTP/1.1 keep-alive")
+            http2 = False
+        self.http2 = http2
+        if http2:
+            adapter = HTTP2Adapter(pool_size, timeout)
+        else:
+            # Threads beyond pool_maxsize would open throwaway connections, so size it for the workers
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_env(cls):
+        """Build a client from CF_API_TOKEN, CF_API_URL and the CF_* tuning variables"""
+        return cls(
+            os.getenv("CF_API_TOKEN"),
+            base_url=os.getenv("CF_API_URL", DEFAULT_API_BASE),
+            rate_limiter=ratelimit.TokenBucket.from_env(),
+            max_retries=int(os.getenv("CF_MAX_RETRIES", "5")),
+            pool_size=max(1, int(os.getenv("CF_POOL_SIZE", "32"))),
+            timeout=(float(os.getenv("CF_CONNECT_TIMEOUT", "5")), float(os.getenv("CF_READ_TIMEOUT", "30"))),
+            http2=os.getenv("CF_HTTP2", "false").lower() == "true",
+        )
+
+    def url(self, path):
+        return path if path.startswith(("http://", "https://")) else f"{self.base_url}{path}"
+
+    def request(self, method, path, **kwargs):
+        """Send an API request through the shared rate limiter.
+
+        429 responses pause the limiter for the server's Retry-After. For
+        idempotent methods, 5xx responses and connection errors are retried
+        with jittered exponential backoff. A POST may have been applied when
+        its response is lost or a 5xx, so it is only retried when it never
+        reached Cloudflare (see never_sent()). At most ``max_retries`` retries
+        are made. The final response is returned as-is so callers decide how
+        to handle it.
+        """
+        url = self.url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.API_REQUESTS.inc(method=method, status="error")
+                if attempt >= self.max_retries or not (idempotent or never_sent(e)):
+                    raise
+                delay = ratelimit.backoff_delay(attempt)
+                logger.warning("%s %s failed (%s), retrying in %.1fs", method, url, e, delay)
+            else:
+                metrics.API_REQUESTS.inc(method=method, status=response.status_code)
+                retryable = response.status_code == 429 or (idempotent and response.status_code >= 500)
+                if attempt >= self.max_retries or not retryable:
+                    return response
+                if response.status_code == 429:
+                    delay = ratelimit.retry_after(response) or ratelimit.backoff_delay(attempt)
+                    logger.warning("Rate limited by Cloudflare, pausing requests for %.1fs", delay)
+                    self.rate_limiter.pause(delay)
+                    attempt += 1
+                    continue
+                delay = ratelimit.backoff_delay(attempt)
+                logger.warning("%s %s returned %s, retrying in %.1fs", method, url, response.status_code, delay)
+            attempt += 1
+            time.sleep(delay)
+
+    def get_json(self, path, **kwargs):
+        """GET ``path``, raising for HTTP errors, and return the decoded body"""
+        response = self.request("GET", path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def verify_token(self):
+        """Return the token verification result (raises for an invalid token)"""
+        return self.get_json("/user/tokens/verify")["result"]
+
+    def get_zone(self, zone_id):
+        return self.get_json(f"/zones/{zone_id}")["result"]
+
+    def close(self):
+        self.session.close()
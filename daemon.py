@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Long-lived daemon mode for Caddy Cloudflare DNS Updater.
+
+Runs DNS syncs in-process on a single worker thread instead of starting a
+new interpreter per Caddyfile change, so the imported modules, the shared
+HTTP session and the parsed Caddyfile stay warm between syncs. File
+events, IP changes and periodic reconciliation (RECONCILE_INTERVAL, used
+by hybrid mode in place of cron) all feed the same worker, so syncs never
+overlap.
+"""
+
+import gc
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from watcher import start_observer, run_sync_subprocess, CoalescingScheduler
+import main
+import caddyfile
+import ipdetect
+import logsetup
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+def current_rss_mb():
+    """Resident set size of this process right now in MB, or None without /proc (macOS, Windows)"""
+    try:
+        with open("/proc/self/statm", 'r', encoding='ascii') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def peak_rss_mb():
+    """Peak RSS over the life of this process in MB (kept across exec), or None without ``resource``"""
+    if resource is None:
+        return None
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+
+class SyncWorker(CoalescingScheduler):
+    """Runs syncs on a background thread, coalescing requests that arrive while busy.
+
+    At most one request is held pending at a time, so a burst of file events
+    costs one extra sync rather than an unbounded queue. Latency is measured
+    from the earliest event folded into a sync to the sync's last API response.
+    """
+
+    def __init__(self, isolation="thread", max_rss_mb=0, history=100, settle=0.0):
+        super().__init__(settle=settle)
+        self.isolation = isolation
+        self.max_rss_mb = max_rss_mb
+        self.latencies = deque(maxlen=history)
+        # Where the current RSS can't be read, growth of the peak since this
+        # worker started is checked instead, as an exec keeps the old peak
+        self.peak_baseline = peak_rss_mb() or 0.0
+        # One event loop per worker, kept across syncs for SYNC_ISOLATION=async
+        self.loop = None
+
+    def run(self):
+        return self._sync()
+
+    def completed(self, event_time, ok):
+        latency = time.monotonic() - event_time
+        self.latencies.append(latency)
+        status = "completed" if ok else "failed"
+        logger.info("Sync %s: %.0f ms from file event to last API response", status, latency * 1000,
+                    extra=logsetup.DETAIL)
+        self._check_memory()
+
+    def _sync(self):
+        if self.isolation == "subprocess":
+            return run_sync_subprocess()
+        try:
+            if self.isolation == "async":
+                import pipeline
+                if self.loop is None:
+                    self.loop = asyncio.new_event_loop()
+                self.loop.run_until_complete(pipeline.run_sync())
+            else:
+                main.run_sync()
+            return True
+        except Exception:
+            # run_sync has already logged the failure; keep the daemon alive
+            return False
+        finally:
+            gc.collect()
+
+    def memory_mb(self):
+        """(MB, description) to compare with DAEMON_MAX_RSS_MB, or None when memory can't be measured"""
+        rss_mb = current_rss_mb()
+        if rss_mb is not None:
+            return rss_mb, "RSS"
+        peak = peak_rss_mb()
+        if peak is None:
+            return None
+        return peak - self.peak_baseline, "Peak RSS growth"
+
+    def _check_memory(self):
+        """Re-exec the daemon if its RSS has grown past the configured bound"""
+        if not self.max_rss_mb:
+            return
+        measured = self.memory_mb()
+        if measured is None:
+            return
+        rss_mb, description = measured
+        if rss_mb > self.max_rss_mb:
+            logger.warning("%s %.0f MB exceeds DAEMON_MAX_RSS_MB=%s, restarting daemon",
+                           description, rss_mb, self.max_rss_mb)
+            logsetup.shutdown()
+            logging.shutdown()
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+
+def monitor_ip(worker, interval, stop):
+    """Re-detect the public IP every ``interval`` seconds and sync only when it changes"""
+    while not stop.wait(interval):
+        changed = False
+        for version in ipdetect.get_ip_versions():
+            try:
+                ip, previous_ip = ipdetect.get_public_ip(main.session, force=True, version=version)
+            except Exception as e:
+                logger.warning("Public IPv%s check failed: %s", version, e)
+                continue
+            if previous_ip and ip != previous_ip:
+                logger.info("Public IPv%s changed: %s -> %s, scheduling sync", version, previous_ip, ip)
+                changed = True
+        if changed:
+            worker.submit()
+
+def poll_admin_api(worker, interval, stop):
+    """Schedule a sync every ``interval`` seconds for domains read from the Caddy admin API.
+
+    The admin API has no file to watch; the state snapshot keeps a poll
+    free of Cloudflare calls when nothing changed.
+    """
+    while not stop.wait(interval):
+        worker.submit()
+
+def reconcile_periodically(worker, interval, jitter, stop):
+    """Schedule a full sync once no sync has finished for ``interval`` (+/- ``jitter``) seconds.
+
+    This replaces the cron job of hybrid mode: ticks go through the same
+    worker as file events, so they can never overlap a sync, and a tick is
+    skipped whenever a sync finished since the previous one.
+    """
+    last_tick = time.monotonic()
+    while True:
+        since = max(last_tick, worker.last_finished or 0)
+        delay = since + interval + random.uniform(-jitter, jitter) - time.monotonic()
+        if stop.wait(max(0, delay)):
+            return
+        if (worker.last_finished or 0) > since:
+            logger.debug("Skipping periodic reconciliation, a sync finished recently")
+            continue
+        logger.info("Running periodic reconciliation")
+        last_tick = time.monotonic()
+        worker.submit()
+
+def run_daemon(path):
+    """Watch the domain source (or poll the admin API when ``path`` is None) and sync through a persistent worker.
+
+    SIGTERM and SIGINT stop the watchers, let an in-flight sync finish
+    (up to SHUTDOWN_TIMEOUT seconds) and exit cleanly.
+    """
+    isolation = os.getenv("SYNC_ISOLATION", "thread").lower()
+    if isolation not in ("thread", "async", "subprocess"):
+        logger.error("Invalid SYNC_ISOLATION '%s', must be 'thread', 'async' or 'subprocess'", isolation)
+        sys.exit(1)
+    max_rss_mb = int(os.getenv("DAEMON_MAX_RSS_MB", "0"))
+    admin_poll_interval = float(os.getenv("ADMIN_POLL_INTERVAL", "60"))
+    if path is None and admin_poll_interval <= 0:
+        logger.error("Invalid ADMIN_POLL_INTERVAL %s, the Caddy admin API has to be polled at a positive interval",
+                     os.getenv("ADMIN_POLL_INTERVAL"))
+        sys.exit(1)
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info("Received %s, shutting down...", signal.Signals(signum).name)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info("Starting daemon (sync isolation: %s)", isolation)
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    metrics_server = None
+    if metrics_port > 0:
+        metrics_server = metrics.start_http_server(metrics_port, os.getenv("METRICS_ADDR", ""))
+    settle = float(os.getenv("WATCH_SETTLE_SECONDS", "1"))
+    worker = SyncWorker(isolation=isolation, max_rss_mb=max_rss_mb, settle=settle).start()
+
+    ip_check_interval = int(os.getenv("IP_CHECK_INTERVAL", "300"))
+    if ip_check_interval > 0:
+        threading.Thread(target=monitor_ip, args=(worker, ip_check_interval, stop),
+                         name="ip-monitor", daemon=True).start()
+
+    reconcile_interval = int(os.getenv("RECONCILE_INTERVAL", "0"))
+    if reconcile_interval > 0:
+        jitter = min(float(os.getenv("RECONCILE_JITTER", "30")), reconcile_interval / 2)
+        logger.info("Periodic reconciliation every %ss (+/- %.0fs)", reconcile_interval, jitter)
+        threading.Thread(target=reconcile_periodically, args=(worker, reconcile_interval, jitter, stop),
+                         name="reconciler", daemon=True).start()
+
+    if path is not None:
+        if not os.path.exists(caddyfile.file_set_root(path)):
+            logger.error("Caddyfile not found at %s", path)
+            sys.exit(1)
+        observer = start_observer(path, worker.submit)
+    else:
+        logger.info("Reading domains from the Caddy admin API, polling every %gs", admin_poll_interval)
+        threading.Thread(target=poll_admin_api, args=(worker, admin_poll_interval, stop),
+                         name="admin-poller", daemon=True).start()
+        observer = None
+
+    logger.info("Running initial DNS sync...")
+    worker.submit()
+    while not stop.wait(1):
+        pass
+
+    if observer is not None:
+        observer.stop()
+        observer.join()
+    timeout = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+    if not worker.stop(timeout):
+        logger.warning("Sync still running after %.0fs, exiting anyway", timeout)
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    logger.info("Daemon stopped")
+
+if __name__ == "__main__":
+    run_daemon(main.get_watch_path())
@@ -16,6 +16,12 @@ run_watcher() {
     python /app/watcher.py
 }
 
+# Function to run the long-lived in-process daemon
+run_daemon() {
+    echo "Starting daemon mode..."
+    exec python /app/daemon.py
+}
+
 # Function to run with cron
 run_cron() {
     echo "Starting cron mode..."
@@ -26,25 +32,44 @@ run_cron() {
     tail -f /var/log/caddy-updater.log
 }
 
-# Function to run cron + watcher (hybrid mode)
+# Function to run file watching + periodic reconciliation (hybrid mode)
 run_hybrid() {
-    echo "Starting hybrid mode (cron + watcher)..."
-    # Start cron daemon
-    cron
-    echo "Cron daemon started"
-    # Start watcher in background and show logs
-    python /app/watcher.py &
-    echo "File watcher started"
-    # Keep container running and show logs
-    tail -f /var/log/caddy-updater.log
+    echo "Starting hybrid mode (watcher + periodic reconciliation)..."
+    # One in-process scheduler replaces cron + watcher, so syncs never overlap
+    export RECONCILE_INTERVAL="${RECONCILE_INTERVAL:-600}"
+    exec python /app/daemon.py
+}
+
+# Function to run the fleet aggregator that reconciles DNS for every reporting host
+run_aggregator() {
+    echo "Starting fleet aggregator on port ${FLEET_PORT:-9480}..."
+    exec python /app/fleet.py serve
+}
+
+# Function to report this host's domains and IP to a fleet aggregator
+run_agent() {
+    echo "Starting fleet agent reporting to $FLEET_URL..."
+    exec python /app/fleet.py agent
 }
 
 # Validate required environment variables
 check_env() {
+    # Agents only talk to the aggregator, which holds the Cloudflare credentials
+    if [ "$RUN_MODE" = "agent" ]; then
+        if [ -z "$FLEET_URL" ] || [ -z "$FLEET_TOKEN" ]; then
+            echo "ERROR: FLEET_URL and FLEET_TOKEN environment variables are required in agent mode"
+            exit 1
+        fi
+        return
+    fi
     if [ -z "$CF_API_TOKEN" ]; then
         echo "ERROR: CF_API_TOKEN environment variable is required"
         exit 1
     fi
+    # Multi-zone mode resolves zones from the token, so no single zone is needed
+    if [ "$CF_MULTI_ZONE" = "true" ]; then
+        return
+    fi
     if [ -z "$CF_ZONE_ID" ]; then
         echo "ERROR: CF_ZONE_ID environment variable is required"
         exit 1
@@ -57,7 +82,11 @@ check_env() {
 
 # Check if Caddyfile exists
 check_caddyfile() {
-    if [ ! -f "$CADDYFILE_PATH" ]; then
+    # Globs (sites.d/*.caddy) are resolved by the updater itself
+    case "$CADDYFILE_PATH" in
+        *[*?[]*) return ;;
+    esac
+    if [ ! -e "$CADDYFILE_PATH" ]; then
         echo "WARNING: Caddyfile not found at $CADDYFILE_PATH"
         echo "Make sure to mount your Caddyfile to the container"
         echo "Example: -v /path/to/Caddyfile:$CADDYFILE_PATH:ro"
@@ -72,7 +101,10 @@ echo "Log level: $LOG_LEVEL"
 
 # Validate environment
 check_env
-check_caddyfile
+# The aggregator reads domains from its agents, not a Caddyfile
+if [ "$RUN_MODE" != "aggregator" ]; then
+    check_caddyfile
+fi
 
 # Create log file if it doesn't exist
 touch /var/log/caddy-updater.log
@@ -85,14 +117,23 @@ case "$RUN_MODE" in
     "watcher")
         run_watcher
         ;;
+    "daemon")
+        run_daemon
+        ;;
     "cron")
         run_cron
         ;;
     "hybrid")
         run_hybrid
         ;;
+    "aggregator")
+        run_aggregator
+        ;;
+    "agent")
+        run_agent
+        ;;
     *)
-        echo "ERROR: Invalid RUN_MODE. Must be one of: once, watcher, cron, hybrid"
+        echo "ERROR: Invalid RUN_MODE. Must be one of: once, watcher, daemon, cron, hybrid, aggregator, agent"
         echo "Defaulting to watcher mode..."
         run_watcher
         ;;
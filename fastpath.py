@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Fast-path entry point for cron runs.
+
+Exits early, without loading the HTTP stack or the sync code, when the
+last successful sync still holds: the settings are unchanged, the domain
+source files have the same stat signature, every synced zone is within
+STATE_MAX_AGE of its last full reconcile, and the public IP is the one
+synced. A cached IP within IP_CACHE_TTL is trusted as is; an expired one
+is re-detected, importing requests only then. Anything else runs the
+regular sync from main.py.
+
+Set STARTUP_TIMINGS=true to print the time spent on each first-time import
+in the ``python -X importtime`` format, plus a summary of the run.
+"""
+
+import os
+import sys
+import time
+
+_start = time.perf_counter()
+
+class ImportTimer:
+    """Times first-time imports made on this thread, like ``python -X importtime``"""
+
+    def __init__(self):
+        import builtins
+        import threading
+        self.builtins = builtins
+        self.original = builtins.__import__
+        self.thread = threading.get_ident()
+        self.get_ident = threading.get_ident
+        self.rows = []
+        # Accumulated child time for each import in progress
+        self.stack = [0.0]
+
+    def __call__(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or self.get_ident() != self.thread:
+            return self.original(name, globals, locals, fromlist, level)
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.stack.pop()
+            self.stack[-1] += elapsed
+            self.rows.append((len(self.stack) - 1, name, elapsed - children, elapsed))
+
+    def install(self):
+        self.builtins.__import__ = self
+        return self
+
+    def total(self):
+        return self.stack[0]
+
+    def report(self, stream=sys.stderr):
+        stream.write("import time: self [us] | cumulative | imported package\n")
+        for depth, name, own, cumulative in self.rows:
+            stream.write(f"import time: {own * 1e6:>9.0f} | {cumulative * 1e6:>10.0f} | {'  ' * depth}{name}\n")
+
+_timer = ImportTimer().install() if os.getenv("STARTUP_TIMINGS", "false").lower() == "true" else None
+
+import logging
+
+import caddyfile
+import ipdetect
+import logsetup
+import state
+
+# Most cron runs are skipped after a line or two, not worth the log queue's import time
+logsetup.configure(queued=False)
+logger = logging.getLogger(__name__)
+
+RECORD_TYPE_VERSIONS = {"A": 4, "AAAA": 6}
+
+def current_ip(version):
+    """Public IP for one family: the cached one within IP_CACHE_TTL, else freshly detected"""
+    cached_ip, detected_at = ipdetect.load_cached_ip(ipdetect.get_ip_cache_file(), version)
+    if cached_ip and time.time() - detected_at < int(os.getenv("IP_CACHE_TTL", "300")):
+        return cached_ip
+    # Only now is an HTTP client worth its import time
+    import requests
+    with requests.Session() as session:
+        ip, _ = ipdetect.get_public_ip(session, version=version)
+    return ip
+
+def up_to_date():
+    """Return (record, None) when the last sync still holds, else (None, reason)"""
+    path = state.get_state_file()
+    record = state.load_fastpath(path) if path else None
+    if not record:
+        return None, "no current fast-path record"
+    if record.get("settings") != state.settings_hash():
+        return None, "settings changed"
+    recorded = [tuple(entry) for entry in record["sources"]]
+    if list(caddyfile.files_signature([entry[0] for entry in recorded])) != recorded:
+        return None, "domain source changed"
+    synced = {RECORD_TYPE_VERSIONS[record_type]: ip for record_type, ip in record["ips"].items()}
+    for version in ipdetect.get_ip_versions():
+        if version not in synced:
+            return None, f"IPv{version} was not detected last time"
+        try:
+            detected = current_ip(version)
+        except Exception as e:
+            return None, f"IPv{version} detection failed ({e})"
+        if detected != synced[version]:
+            return None, f"public IP changed ({synced[version]} -> {detected})"
+    return record, None
+
+def write_metrics(record, elapsed):
+    """Count a skipped run as a successful sync in METRICS_TEXTFILE"""
+    textfile = os.getenv("METRICS_TEXTFILE")
+    if not textfile:
+        return
+    import metrics
+    metrics.PHASE_SECONDS.observe(elapsed, phase="total")
+    metrics.SYNCS.inc(result="success")
+    metrics.DOMAINS.set(record["domains"])
+    metrics.LAST_SUCCESS.set(time.time())
+    metrics.write_textfile(textfile)
+
+def run():
+    """Exit early if nothing changed since the last sync, otherwise run a full one"""
+    check_start = time.perf_counter()
+    record, reason = up_to_date()
+    check_seconds = time.perf_counter() - check_start
+    if record:
+        logger.info("No changes since last sync (%s domains -> %s), skipping",
+                    record['domains'], ', '.join(record['ips'].values()))
+        write_metrics(record, time.perf_counter() - _start)
+        return "skipped", check_seconds
+
+    logger.info("Running a full sync: %s", reason)
+    # A full sync logs a line or more per record, so it gets the log queue after all
+    logsetup.configure(queued=True, force=True)
+    import main
+    main.run_sync()
+    return "synced", check_seconds
+
+if __name__ == "__main__":
+    outcome, check_seconds = "failed", 0.0
+    try:
+        outcome, check_seconds = run()
+    finally:
+        # Write out whatever a full sync left in the log queue
+        logsetup.shutdown()
+        if _timer is not None:
+            _timer.report()
+            sys.stderr.write(f"fastpath: {outcome} in {(time.perf_counter() - _start) * 1000:.1f}ms "
+                             f"(first-time imports {_timer.total() * 1000:.1f}ms, "
+                             f"fast-path check {check_seconds * 1000:.1f}ms, "
+                             f"{len(sys.modules)} modules loaded)\n")
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Fleet mode: one aggregator reconciles DNS for many Caddy hosts.
+
+Agents send their domains and detected IPs to the aggregator instead of
+calling the Cloudflare API themselves. Use ``python fleet.py push`` from
+cron, or ``python fleet.py agent`` as a loop. The aggregator
+(``python fleet.py serve``) merges what every live host reported into one
+desired state: hostname -> record type -> set of IPs. It reconciles a
+zone at most once per FLEET_INTERVAL, with one listing followed by
+batched writes, and only when a report changed that state or
+FLEET_RECONCILE_INTERVAL has passed. A hostname served by several hosts
+gets one A/AAAA record per host IP, which Cloudflare answers
+round-robin. A host silent for FLEET_HOST_TTL seconds is dropped, and its
+IPs are removed from the records. TTL and proxying follow RECORD_TTL,
+RECORD_PROXIED and RECORD_OPTIONS_FILE; the records stay A/AAAA, so a
+``cname`` option does not apply here.
+
+    python fleet.py serve
+    FLEET_URL=http://aggregator:9480 python fleet.py agent
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+import requests
+
+import main
+import metrics
+import logsetup
+import cloudflare
+import hostnames
+import recordoptions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLEET_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".caddy-updater-fleet.json")
+MAX_REPORT_BYTES = 16 * 1024 * 1024
+
+FLEET_HOSTS = metrics.Gauge(
+    "caddy_updater_fleet_hosts",
+    "Hosts whose reports the fleet aggregator currently holds",
+)
+
+class Fleet:
+    """The latest report of every live host, merged into the desired DNS state on demand"""
+
+    def __init__(self, path=None, host_ttl=300):
+        self.path = path
+        self.host_ttl = host_ttl
+        self.hosts = {}
+        self.lock = threading.Lock()
+        # Set whenever the merged state may differ from what was last reconciled
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        """Restore persisted reports, each given a fresh FLEET_HOST_TTL to report again"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                hosts = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable fleet state %s: %s", self.path, e)
+            return
+        now = time.time()
+        self.hosts = {host: {"domains": report["domains"], "ips": report["ips"], "seen_at": now}
+                      for host, report in hosts.items()}
+        self.dirty = bool(self.hosts)
+        logger.info("Restored reports of %d hosts from %s", len(self.hosts), self.path)
+
+    def _save(self):
+        if not self.path:
+            return
+        hosts = {host: {"domains": report["domains"], "ips": report["ips"]} for host, report in self.hosts.items()}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(hosts, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to write fleet state %s: %s", self.path, e)
+
+    def report(self, host, domains, ips):
+        """Store a host's report, returning True when it changed the desired state"""
+        domains = sorted(set(domains))
+        with self.lock:
+            previous = self.hosts.get(host)
+            self.hosts[host] = {"domains": domains, "ips": ips, "seen_at": time.time()}
+            changed = previous is None or (previous["domains"], previous["ips"]) != (domains, ips)
+            if changed:
+                self.dirty = True
+                self._save()
+            FLEET_HOSTS.set(len(self.hosts))
+        return changed
+
+    def remove(self, host):
+        """Forget a host that is leaving the fleet, returning whether it was known"""
+        with self.lock:
+            if self.hosts.pop(host, None) is None:
+                return False
+            self.dirty = True
+            self._save()
+            FLEET_HOSTS.set(len(self.hosts))
+        return True
+
+    def expire(self, now=None):
+        """Drop hosts that have not reported for FLEET_HOST_TTL seconds, returning their names"""
+        now = now or time.time()
+        with self.lock:
+            expired = [host for host, report in self.hosts.items() if now - report["seen_at"] >= self.host_ttl]
+            for host in expired:
+                del self.hosts[host]
+            if expired:
+                self.dirty = True
+                self._save()
+                FLEET_HOSTS.set(len(self.hosts))
+        for host in expired:
+            logger.warning("Host %s has not reported for %ss, removing its addresses", host, self.host_ttl)
+        return expired
+
+    def take(self):
+        """Return (host count, desired state) and clear the dirty flag, for a reconcile about to start.
+
+        The desired state maps (fqdn, record type) -> set of IPs.
+        """
+        with self.lock:
+            self.dirty = False
+            hosts = list(self.hosts.values())
+        desired = {}
+        for report in hosts:
+            for fqdn in main.qualify_domains(report["domains"]):
+                for record_type, ip in report["ips"].items():
+                    desired.setdefault((fqdn, record_type), set()).add(ip)
+        return len(hosts), desired
+
+    def state(self):
+        """Reports and their ages, for GET /v1/state"""
+        now = time.time()
+        with self.lock:
+            return {host: {"domains": len(report["domains"]), "ips": report["ips"],
+                           "seen_seconds_ago": round(now - report["seen_at"], 1)}
+                    for host, report in sorted(self.hosts.items())}
+
+def parse_report(body):
+    """Validate a pushed report, returning (domains, ips) or raising ValueError"""
+    report = json.loads(body)
+    domains, ips = report.get("domains"), report.get("ips")
+    if not isinstance(domains, list) or not all(isinstance(domain, str) for domain in domains):
+        raise ValueError("'domains' must be a list of hostnames")
+    if not isinstance(ips, dict) or not ips:
+        raise ValueError("'ips' must map record types to addresses")
+    for record_type, ip in ips.items():
+        if not isinstance(ip, str) or main.record_type_for(ip) != record_type:
+            raise ValueError(f"{ip} is not an {record_type} address")
+    invalid = [domain for domain in domains if not hostnames.is_valid(domain)]
+    if invalid:
+        raise ValueError(f"invalid hostnames: {', '.join(invalid[:5])}")
+    return domains, ips
+
+def record_data(name, record_type, ip, comment, site):
+    data = {"type": record_type, "name": name, "content": ip, **recordoptions.record_fields(site)}
+    if comment:
+        data["comment"] = comment
+    return data
+
+def plan_round_robin(desired, listed, comment, options=None):
+    """Changes turning ``listed`` ({(name, type): [records]}) into ``desired`` ({(name, type): {ips}}).
+
+    Returns (changes, stale) in the shape of main.plan_changes(). ``options``
+    maps names to their recordoptions.Options for TTL and proxying. One
+    record is kept per wanted IP. Surplus records are rewritten to a missing
+    IP before any new record is created. Once every IP is covered they are
+    deleted, but only our own records when OWNER_COMMENT tags them. Our
+    records for names nobody wants any more are returned separately as
+    stale deletes.
+    """
+    options = options or {}
+    default = recordoptions.defaults()
+    changes = {"create": [], "update": [], "delete": [], "unchanged": []}
+    for (name, record_type), wanted in sorted(desired.items()):
+        site = options.get(name, default)
+        kept = {}
+        surplus = []
+        # Tagged records first, so those are the ones kept
+        records = sorted(listed.get((name, record_type), ()),
+                         key=lambda record: bool(comment) and not main.is_owned(record, comment))
+        for record in records:
+            if record["content"] in wanted and record["content"] not in kept:
+                kept[record["content"]] = record
+            else:
+                surplus.append(record)
+        for ip, record in sorted(kept.items()):
+            data = record_data(name, record_type, ip, comment, site)
+            if main.record_matches(record, data, comment):
+                changes["unchanged"].append({"id": record["id"], "name": name, "type": record_type})
+            else:
+                changes["update"].append({"id": record["id"], "current": ip,
+                                          "data": main.keep_comment(data, record, comment)})
+        missing = sorted(wanted - kept.keys())
+        for record in surplus:
+            if missing:
+                data = record_data(name, record_type, missing.pop(0), comment, site)
+                changes["update"].append({"id": record["id"], "current": record["content"],
+                                          "data": main.keep_comment(data, record, comment)})
+            elif not comment or main.is_owned(record, comment):
+                changes["delete"].append({"id": record["id"], "name": name, "type": record_type})
+            else:
+                logger.info("Leaving untagged %s record %s -> %s, which no host reports",
+                            record_type, name, record['content'])
+        changes["create"].extend(record_data(name, record_type, ip, comment, site) for ip in missing)
+
+    stale = [
+        {"id": record["id"], "name": name, "type": record_type}
+        for (name, record_type), records in sorted(listed.items()) if (name, record_type) not in desired
+        for record in records if main.is_owned(record, comment)
+    ]
+    return changes, stale
+
+def reconcile_zone(zone, desired, client):
+    """List one zone once and apply the fleet's desired records to it in batches, returning the summary"""
+    comment = main.get_owner_comment()
+    record_types = {record_type for _, record_type in desired}
+    type_filter = next(iter(record_types)) if len(record_types) == 1 else None
+    listed = {}
+    with metrics.PHASE_SECONDS.time(phase="zone_listing"):
+        for record in main.iter_dns_records(zone, client, record_type=type_filter):
+            if record["type"] in record_types:
+                listed.setdefault((record["name"], record["type"]), []).append(record)
+
+    patterns = recordoptions.load_file(recordoptions.get_options_file())
+    default = recordoptions.defaults()
+    options = {name: recordoptions.resolve(name, patterns, default=default) for name, _ in desired}
+    changes, stale = plan_round_robin(desired, listed, comment, options)
+    # Records of names no host serves any more fall under the usual stale-record guards
+    held = {"delete": stale}
+    main.hold_stale_deletes(zone, held)
+    changes["delete"].extend(held["delete"])
+
+    results = main.apply_changes(zone, client, changes)
+    summary = main.summarize_results(changes, results)
+    logger.info("Zone %s: %d created, %d updated, %d deleted, %d unchanged, %d failed", zone, summary['created'],
+                summary['updated'], summary['deleted'], summary['unchanged'], summary['failed'])
+    return summary
+
+def reconcile(fleet):
+    """Reconcile every zone against the fleet's merged state, returning the summary (None when nothing to do)"""
+    start = time.perf_counter()
+    result = "failure"
+    names = summary = None
+    with logsetup.sync_context():
+        try:
+            hosts, desired = fleet.take()
+            if not hosts:
+                # Every host gone at once is more likely a network problem than a fleet to tear down
+                logger.debug("No hosts are reporting, nothing to reconcile")
+                result = "success"
+                return None
+            names = {name for name, _ in desired}
+            metrics.DOMAINS.set(len(names))
+            logger.info("Reconciling %d domains reported by %s hosts", len(names), hosts)
+
+            zone, multi_zone = main.get_zone_config()
+            client = main.get_client()
+            if multi_zone:
+                grouped, _ = main.group_by_zone(names, client)
+                zone_names = {zone_id: fqdns for zone_id, (_, fqdns) in grouped.items()}
+            else:
+                zone_names = {zone: names}
+            zone_desired = {zone_id: {key: ips for key, ips in desired.items() if key[0] in fqdns}
+                            for zone_id, fqdns in zone_names.items()}
+
+            summary = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+            workers = max(1, int(os.getenv("CF_ZONE_WORKERS", "4")))
+            with ThreadPoolExecutor(max_workers=min(workers, len(zone_desired) or 1)) as pool:
+                futures = {pool.submit(logsetup.bind(reconcile_zone), zone_id, wanted, client): zone_id
+                           for zone_id, wanted in zone_desired.items()}
+                for future, zone_id in futures.items():
+                    try:
+                        zone_summary = future.result()
+                    except requests.RequestException as e:
+                        logger.error("Reconcile of zone %s failed: %s", zone_id, cloudflare.describe_error(e))
+                        summary["failed"] += sum(len(ips) for ips in zone_desired[zone_id].values())
+                        continue
+                    for key in summary:
+                        summary[key] += zone_summary[key]
+            for outcome, count in summary.items():
+                metrics.RECORDS.set(count, outcome=outcome)
+            if summary["failed"]:
+                raise RuntimeError(f"{summary['failed']} DNS changes could not be applied")
+            result = "success"
+            return summary
+        except Exception:
+            # Try again at the next interval
+            with fleet.lock:
+                fleet.dirty = True
+            raise
+        finally:
+            main.record_run(start, result, names, summary)
+
+def make_handler(fleet, token):
+    class FleetHandler(BaseHTTPRequestHandler):
+        """PUT/DELETE /v1/hosts/<host> for agent reports, GET /v1/state and /metrics"""
+
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def authorized(self):
+            supplied = self.headers.get("Authorization", "")
+            if hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+                return True
+            self.send_json(401, {"error": "invalid or missing bearer token"})
+            return False
+
+        def host(self):
+            path = self.path.split("?", 1)[0]
+            if not path.startswith("/v1/hosts/") or len(path) == len("/v1/hosts/"):
+                self.send_json(404, {"error": "not found"})
+                return None
+            return unquote(path[len("/v1/hosts/"):])
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                payload = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            elif path == "/v1/state":
+                if self.authorized():
+                    self.send_json(200, {"hosts": fleet.state(), "pending": fleet.dirty})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_PUT(self):
+            if not self.authorized():
+                return
+            host = self.host()
+            if host is None:
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_REPORT_BYTES:
+                self.send_json(413, {"error": f"report larger than {MAX_REPORT_BYTES} bytes"})
+                return
+            try:
+                domains, ips = parse_report(self.rfile.read(length))
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            changed = fleet.report(host, domains, ips)
+            if changed:
+                logger.info("Host %s reported %d domains -> %s", host, len(domains), ', '.join(ips.values()))
+            self.send_json(200, {"changed": changed, "pending": fleet.dirty})
+
+        def do_DELETE(self):
+            if not self.authorized():
+                return
+            host = self.host()
+            if host is None:
+                return
+            if fleet.remove(host):
+                logger.info("Host %s left the fleet", host)
+            self.send_json(200, {"pending": fleet.dirty})
+
+        def log_message(self, format, *args):
+            pass
+
+    return FleetHandler
+
+def serve(stop=None):
+    """Run the aggregator until SIGTERM/SIGINT (or ``stop`` is set)"""
+    token = os.getenv("FLEET_TOKEN")
+    if not token:
+        raise ValueError("FLEET_TOKEN is required to run the fleet aggregator")
+    main.get_zone_config()
+    interval = float(os.getenv("FLEET_INTERVAL", "30"))
+    full_interval = float(os.getenv("FLEET_RECONCILE_INTERVAL", "3600"))
+    fleet = Fleet(os.getenv("FLEET_STATE_FILE", DEFAULT_FLEET_STATE_FILE) or None,
+                  host_ttl=int(os.getenv("FLEET_HOST_TTL", "300")))
+
+    if stop is None:
+        stop = threading.Event()
+
+        def handle_signal(signum, frame):
+            logger.info("Received %s, shutting down...", signal.Signals(signum).name)
+            stop.set()
+
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+
+    server = ThreadingHTTPServer((os.getenv("FLEET_ADDR", ""), int(os.getenv("FLEET_PORT", "9480"))),
+                                 make_handler(fleet, token))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fleet-http", daemon=True).start()
+    logger.info("Fleet aggregator listening on %s:%s, reconciling at most every %gs",
+                server.server_address[0] or '0.0.0.0', server.server_address[1], interval)
+
+    last_full = 0.0
+    while not stop.wait(interval):
+        fleet.expire()
+        if not fleet.dirty and time.monotonic() - last_full < full_interval:
+            continue
+        try:
+            if reconcile(fleet) is not None:
+                last_full = time.monotonic()
+        except Exception as e:
+            logger.error("Fleet reconcile failed: %s", e)
+    server.shutdown()
+    logger.info("Fleet aggregator stopped")
+
+def fleet_url(host=None):
+    url = os.getenv("FLEET_URL")
+    if not url:
+        raise ValueError("FLEET_URL must point at the fleet aggregator")
+    return f"{url.rstrip('/')}/v1/hosts/{quote(host or get_host_id(), safe='')}"
+
+def get_host_id():
+    return os.getenv("FLEET_HOST_ID") or socket.gethostname()
+
+def push():
+    """Report this host's domains and public IPs to the aggregator"""
+    ips = main.get_public_ips()
+    domains = main.get_domains()
+    response = main.session.put(fleet_url(), json={"domains": sorted(domains), "ips": ips},
+                                headers={"Authorization": f"Bearer {os.getenv('FLEET_TOKEN', '')}"},
+                                timeout=float(os.getenv("FLEET_TIMEOUT", "10")))
+    response.raise_for_status()
+    logger.info("Reported %d domains -> %s to the fleet aggregator%s", len(domains), ', '.join(ips.values()),
+                " (changed)" if response.json().get("changed") else "")
+
+def leave():
+    """Tell the aggregator this host is leaving, so its addresses are removed at the next reconcile"""
+    response = main.session.delete(fleet_url(), headers={"Authorization": f"Bearer {os.getenv('FLEET_TOKEN', '')}"},
+                                   timeout=float(os.getenv("FLEET_TIMEOUT", "10")))
+    response.raise_for_status()
+    logger.info("Host %s left the fleet", get_host_id())
+
+def run_agent():
+    """Push a report every FLEET_PUSH_INTERVAL seconds, which also serves as the host's heartbeat"""
+    interval = float(os.getenv("FLEET_PUSH_INTERVAL", "60"))
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    logger.info("Fleet agent %s reporting every %.0fs", get_host_id(), interval)
+    while True:
+        try:
+            push()
+        except Exception as e:
+            logger.error("Fleet report failed: %s", e)
+        if stop.wait(interval):
+            return
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate many Caddy hosts' domains into one DNS reconcile")
+    parser.add_argument("command", choices=["serve", "agent", "push", "leave"],
+                        help="serve: run the aggregator; agent: report periodically; push: report once; "
+                             "leave: remove this host")
+    args = parser.parse_args(argv)
+    try:
+        {"serve": serve, "agent": run_agent, "push": push, "leave": leave}[args.command]()
+    except Exception as e:
+        logger.error("fleet %s failed: %s", args.command, e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,151 @@
+"""
+Hostname validation and normalization for domains read from Caddy configs.
+
+Every candidate host goes through one compiled hostname grammar (LDH
+labels, an optional leading ``*`` label, an alphabetic or ``xn--`` TLD),
+after Unicode names are converted to their punycode form. Hosts matching
+DOMAIN_DENY_PATTERNS (shell-style globs) are rejected, and when a Public
+Suffix List file is configured (PUBLIC_SUFFIX_LIST) a host must sit below
+a known public suffix, so unknown TLDs and bare suffixes such as
+``co.uk`` are refused. Results are memoized per hostname in an LRU cache,
+as the same hosts are validated on every parse.
+"""
+
+import os
+import re
+import fnmatch
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Placeholder names, local hosts and certificate file names that are never DNS records
+DEFAULT_DENY_PATTERNS = "localhost*,example.*,test.*,*.key,*.pem,*.crt,*.cert,*.p12,*.pfx"
+DEFAULT_CACHE_SIZE = 65536
+
+# Lookarounds keep hyphens off label edges without backtracking through each label
+_LABEL = r"(?!-)[a-z0-9-]{1,63}(?<!-)"
+_TLD = r"(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})"
+HOSTNAME_RE = re.compile(rf"(?:\*\.)?(?:{_LABEL}\.)+{_TLD}")
+
+@lru_cache(maxsize=4096)
+def _idna_label(label):
+    # nameprep is slow, and Unicode labels (usually the registrable domain) repeat across hosts
+    return label.encode("idna").decode("ascii")
+
+def to_ascii(name):
+    """Lowercase ASCII (punycode) form of a hostname, or None if it cannot be encoded"""
+    name = name.lower()
+    if name.isascii():
+        return name
+    try:
+        return ".".join(label if label.isascii() else _idna_label(label) for label in name.split("."))
+    except UnicodeError:
+        return None
+
+def compile_deny_patterns(patterns):
+    """One regex matching any of the comma-separated globs, or None when there are none"""
+    globs = [p.strip().lower() for p in patterns.split(",") if p.strip()]
+    if not globs:
+        return None
+    return re.compile("|".join(fnmatch.translate(glob) for glob in globs))
+
+class PublicSuffixList:
+    """Rules from a Mozilla Public Suffix List file (public_suffix_list.dat)"""
+
+    def __init__(self, rules):
+        self.rules = set()
+        self.wildcards = set()
+        self.exceptions = set()
+        for rule in rules:
+            if rule.startswith("!"):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith("*."):
+                self.wildcards.add(rule[2:])
+            else:
+                self.rules.add(rule)
+
+    @classmethod
+    def load(cls, path):
+        rules = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                rule = line.split(None, 1)[0] if line.strip() else ""
+                if not rule or rule.startswith("//"):
+                    continue
+                prefix = "!" if rule.startswith("!") else ""
+                ascii_rule = to_ascii(rule[len(prefix):])
+                if ascii_rule:
+                    rules.append(prefix + ascii_rule)
+        return cls(rules)
+
+    def suffix_labels(self, labels):
+        """Number of trailing labels forming the public suffix, 0 when the TLD is unknown"""
+        count = len(labels)
+        for i in range(count):
+            candidate = ".".join(labels[i:])
+            if candidate in self.exceptions:
+                return count - i - 1
+            if candidate in self.rules or (i + 1 < count and ".".join(labels[i + 1:]) in self.wildcards):
+                return count - i
+        return 0
+
+    def is_registrable(self, name):
+        """True when ``name`` is a known public suffix's subdomain, not the suffix itself"""
+        labels = name.split(".")
+        return 0 < self.suffix_labels(labels) < len(labels)
+
+class HostnameValidator:
+    """Compiled, memoized hostname checks"""
+
+    def __init__(self, deny_patterns=DEFAULT_DENY_PATTERNS, public_suffixes=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.deny = compile_deny_patterns(deny_patterns)
+        self.public_suffixes = public_suffixes
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    @classmethod
+    def from_env(cls):
+        """Build a validator from DOMAIN_DENY_PATTERNS, PUBLIC_SUFFIX_LIST and HOSTNAME_CACHE_SIZE"""
+        public_suffixes = None
+        path = os.getenv("PUBLIC_SUFFIX_LIST")
+        if path:
+            try:
+                public_suffixes = PublicSuffixList.load(path)
+            except OSError as e:
+                logger.warning("Could not read public suffix list %s, checking TLD syntax only: %s", path, e)
+        return cls(
+            deny_patterns=os.getenv("DOMAIN_DENY_PATTERNS", DEFAULT_DENY_PATTERNS),
+            public_suffixes=public_suffixes,
+            cache_size=int(os.getenv("HOSTNAME_CACHE_SIZE", str(DEFAULT_CACHE_SIZE))),
+        )
+
+    def _normalize(self, host):
+        if not host or host.startswith("."):
+            return None
+        name = to_ascii(host.rstrip("."))
+        if not name or len(name) > 253 or not HOSTNAME_RE.fullmatch(name):
+            return None
+        if self.deny is not None and self.deny.match(name):
+            return None
+        if self.public_suffixes is not None and not self.public_suffixes.is_registrable(name.removeprefix("*.")):
+            return None
+        return name
+
+    def is_valid(self, host):
+        return self.normalize(host) is not None
+
+_validator = None
+
+def get_validator():
+    """Return the process-wide validator, built from the environment on first use"""
+    global _validator
+    if _validator is None:
+        _validator = HostnameValidator.from_env()
+    return _validator
+
+def normalize(host):
+    """Lowercase ASCII form of a valid hostname, or None when it should not be synced"""
+    return get_validator().normalize(host)
+
+def is_valid(host):
+    return get_validator().normalize(host) is not None
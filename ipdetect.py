@@ -0,0 +1,243 @@
+"""
+Public IP detection from several sources with an on-disk TTL cache.
+
+Sources are listed in IP_SOURCES (IPv4) and IP6_SOURCES (IPv6), comma
+separated, and queried concurrently; the first address reported by
+IP_QUORUM sources wins. IP_VERSIONS selects the families to detect
+("4", "6" or "4,6" for dual-stack). Supported sources:
+
+    https://...       HTTP(S) endpoint returning the address as plain text
+    iface:<name>      IPv4 address of a local network interface
+    iface6:<name>     Global IPv6 address of a local network interface (Linux)
+    upnp              External address reported by the router over UPnP IGD
+"""
+
+import os
+import json
+import time
+import socket
+import struct
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from ipaddress import ip_address
+
+import logsetup
+
+logger = logging.getLogger(__name__)
+
+# IPv4 and IPv6 are detected concurrently but share one cache file
+_cache_lock = threading.Lock()
+
+DEFAULT_SOURCES = {
+    4: "https://api.ipify.org,https://ipv4.icanhazip.com,https://checkip.amazonaws.com",
+    6: "https://api6.ipify.org,https://ipv6.icanhazip.com",
+}
+DEFAULT_IP_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".caddy-updater-ip.json")
+
+SSDP_ADDR = ("239.255.255.250", 1900)
+UPNP_SERVICES = (
+    "urn:schemas-upnp-org:service:WANIPConnection:1",
+    "urn:schemas-upnp-org:service:WANIPConnection:2",
+    "urn:schemas-upnp-org:service:WANPPPConnection:1",
+)
+
+def get_ip_versions():
+    """IP families to detect, from IP_VERSIONS"""
+    versions = [int(v) for v in os.getenv("IP_VERSIONS", "4").replace(' ', '').split(',') if v]
+    if not versions or any(v not in (4, 6) for v in versions):
+        raise ValueError(f"Invalid IP_VERSIONS '{os.getenv('IP_VERSIONS')}', expected 4, 6 or 4,6")
+    return versions
+
+def get_sources(version=4):
+    env = "IP_SOURCES" if version == 4 else "IP6_SOURCES"
+    return [s.strip() for s in os.getenv(env, DEFAULT_SOURCES[version]).split(',') if s.strip()]
+
+def get_ip_cache_file():
+    """Return the IP cache path, or None when caching is disabled (IP_CACHE_FILE="")"""
+    return os.getenv("IP_CACHE_FILE", DEFAULT_IP_CACHE_FILE) or None
+
+def _read_cache(path):
+    """Read the IP cache, returning {"4": {"ip", "detected_at"}, "6": ...}"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable IP cache %s: %s", path, e)
+        return {}
+    return cached if isinstance(cached, dict) else {}
+
+def load_cached_ip(path, version=4):
+    """Return (ip, detected_at) for one family from the cache file, or (None, 0)"""
+    entry = _read_cache(path).get(str(version))
+    if not isinstance(entry, dict) or "ip" not in entry:
+        return None, 0
+    return entry["ip"], entry.get("detected_at", 0)
+
+def save_cached_ip(path, ip, detected_at, version=4):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with _cache_lock:
+        cached = _read_cache(path)
+        cached[str(version)] = {"ip": ip, "detected_at": detected_at}
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write IP cache %s: %s", path, e)
+
+def interface_ipv4(name):
+    """IPv4 address assigned to a network interface (SIOCGIFADDR)"""
+    import fcntl
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        packed = fcntl.ioctl(sock.fileno(), 0x8915, struct.pack('256s', name[:15].encode()))
+    return socket.inet_ntoa(packed[20:24])
+
+def interface_ipv6(name):
+    """First global-scope IPv6 address of a network interface, from /proc/net/if_inet6"""
+    with open("/proc/net/if_inet6", 'r') as f:
+        for line in f:
+            fields = line.split()
+            # address, ifindex, prefix length, scope, flags, interface name
+            if len(fields) == 6 and fields[5] == name and fields[3] == "00":
+                return str(ip_address(bytes.fromhex(fields[0])))
+    raise LookupError(f"No global IPv6 address on interface {name}")
+
+def upnp_external_ip(session, timeout):
+    """Ask the local UPnP Internet Gateway Device for its external address"""
+    # Only UPnP needs these; fastpath.py imports this module on every cron run
+    from urllib.parse import urljoin
+    from xml.etree import ElementTree
+
+    search = (
+        "M-SEARCH * HTTP/1.1\r\n"
+        f"HOST: {SSDP_ADDR[0]}:{SSDP_ADDR[1]}\r\n"
+        "MAN: \"ssdp:discover\"\r\n"
+        "MX: 2\r\n"
+        "ST: urn:schemas-upnp-org:device:InternetGatewayDevice:1\r\n\r\n"
+    )
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(search.encode(), SSDP_ADDR)
+        reply = sock.recv(4096).decode(errors="replace")
+    location = next((line.split(':', 1)[1].strip() for line in reply.split("\r\n")
+                     if line.lower().startswith("location:")), None)
+    if not location:
+        raise LookupError("UPnP gateway reply has no LOCATION header")
+
+    description = session.get(location, timeout=timeout)
+    description.raise_for_status()
+    root = ElementTree.fromstring(description.content)
+    for service in root.iter():
+        if not service.tag.endswith("service"):
+            continue
+        fields = {child.tag.rsplit('}', 1)[-1]: (child.text or "").strip() for child in service}
+        if fields.get("serviceType") in UPNP_SERVICES:
+            service_type, control_url = fields["serviceType"], urljoin(location, fields.get("controlURL", ""))
+            break
+    else:
+        raise LookupError("UPnP gateway exposes no WAN connection service")
+
+    envelope = (
+        '<?xml version="1.0"?>'
+        '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+        's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+        f'<s:Body><u:GetExternalIPAddress xmlns:u="{service_type}"/></s:Body></s:Envelope>'
+    )
+    response = session.post(
+        control_url,
+        data=envelope,
+        headers={
+            "Content-Type": 'text/xml; charset="utf-8"',
+            "SOAPAction": f'"{service_type}#GetExternalIPAddress"',
+        },
+        timeout=timeout
+    )
+    response.raise_for_status()
+    for element in ElementTree.fromstring(response.content).iter():
+        if element.tag.rsplit('}', 1)[-1] == "NewExternalIPAddress" and element.text:
+            return element.text.strip()
+    raise LookupError("UPnP gateway did not return an external address")
+
+def query_source(source, session, timeout, version=4):
+    """Return the address reported by one source, validated against the expected family"""
+    if source.startswith("iface:"):
+        ip = interface_ipv4(source[len("iface:"):])
+    elif source.startswith("iface6:"):
+        ip = interface_ipv6(source[len("iface6:"):])
+    elif source == "upnp":
+        ip = upnp_external_ip(session, timeout)
+    else:
+        response = session.get(source, timeout=timeout)
+        response.raise_for_status()
+        ip = response.text.strip()
+    address = ip_address(ip)
+    if address.version != version:
+        raise ValueError(f"expected an IPv{version} address, got {ip}")
+    return str(address)
+
+def race_sources(sources, session, quorum, timeout, version=4):
+    """Query every source concurrently, returning the first IP reported by ``quorum`` of them.
+
+    If no address reaches the quorum, the most reported one is returned;
+    None means every source failed.
+    """
+    votes = Counter()
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+    futures = {pool.submit(logsetup.bind(query_source), source, session, timeout, version): source
+               for source in sources}
+    try:
+        for future in as_completed(futures, timeout=timeout + 1):
+            source = futures[future]
+            try:
+                ip = future.result()
+            except Exception as e:
+                logger.warning("IP source %s failed: %s", source, e)
+                continue
+            logger.debug("IP source %s reported %s", source, ip)
+            votes[ip] += 1
+            if votes[ip] >= quorum:
+                return ip
+    except FuturesTimeout:
+        logger.warning("IP sources did not all answer within %ss", timeout)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if not votes:
+        return None
+    ip, count = votes.most_common(1)[0]
+    logger.warning("No address reached a quorum of %s (%s), using %s reported by %s", quorum, dict(votes), ip, count)
+    return ip
+
+def get_public_ip(session, force=False, version=4):
+    """Return (ip, previous_ip) for one family, cached within IP_CACHE_TTL, else by racing its sources.
+
+    ``previous_ip`` is the last detected address, so callers can tell
+    whether it changed. When every source fails, the last known address is
+    reused (with a warning) rather than aborting the sync.
+    """
+    cache_file = get_ip_cache_file()
+    cached_ip, detected_at = load_cached_ip(cache_file, version)
+    ttl = int(os.getenv("IP_CACHE_TTL", "300"))
+    if not force and cached_ip and time.time() - detected_at < ttl:
+        logger.debug("Using cached public IPv%s %s (%.0fs old)", version, cached_ip, time.time() - detected_at)
+        return cached_ip, cached_ip
+
+    sources = get_sources(version)
+    quorum = max(1, min(int(os.getenv("IP_QUORUM", "2")), len(sources)))
+    timeout = float(os.getenv("IP_TIMEOUT", "10"))
+    ip = race_sources(sources, session, quorum, timeout, version)
+
+    if ip is None:
+        if cached_ip:
+            logger.warning("All IPv%s sources failed, reusing last known address %s", version, cached_ip)
+            return cached_ip, cached_ip
+        raise RuntimeError(f"Failed to get public IPv{version} address from any of: {', '.join(sources)}")
+
+    save_cached_ip(cache_file, ip, time.time(), version)
+    return ip, cached_ip
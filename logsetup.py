@@ -0,0 +1,224 @@
+"""
+Logging setup shared by every entry point.
+
+The root logger gets a single QueueHandler. A QueueListener thread formats
+the records and writes them to the console and LOG_FILE, so a sync never
+waits on log I/O. LOG_FORMAT=json writes one JSON object per line in place
+of the classic text lines.
+
+Records logged during a sync carry its correlation id (``sync_id``) and the
+milliseconds since it started (``sync_ms``). Every sync ends with one
+summary line holding its counts and the time spent in each phase. With
+LOG_SUMMARY=true, that line and any warnings and errors are all a sync
+logs. The per-domain lines are dropped before they are ever formatted.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import atexit
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(sync_tag)s%(message)s'
+
+# Pass as ``extra`` for lines LOG_SUMMARY should drop even outside a sync
+DETAIL = {"detail": True}
+
+# Attributes of every LogRecord, plus our own; any other attribute came from ``extra``
+_RESERVED = frozenset(logging.makeLogRecord({}).__dict__) | {
+    "message", "asctime", "sync_id", "sync_ms", "sync_tag", "summary", "detail", "raw"}
+
+_current = contextvars.ContextVar("sync", default=None)
+_listener = None
+
+class SyncLog:
+    """One sync's correlation id, start time and seconds spent per phase"""
+
+    def __init__(self):
+        self.id = os.urandom(4).hex()
+        self.start = time.perf_counter()
+        self.timings = {}
+        self.lock = threading.Lock()
+
+def get_format():
+    return os.getenv("LOG_FORMAT", "text").lower()
+
+def summary_only():
+    return os.getenv("LOG_SUMMARY", "false").lower() == "true"
+
+def current_sync():
+    """The SyncLog of the sync running in this context, or None"""
+    return _current.get()
+
+@contextmanager
+def sync_context():
+    """Tag every record logged inside the block with a new sync id, yielding its SyncLog"""
+    sync = SyncLog()
+    token = _current.set(sync)
+    try:
+        yield sync
+    finally:
+        _current.reset(token)
+
+def bind(func):
+    """``func`` wrapped to run in the caller's context, for handing to a thread pool mid-sync"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+def add_timing(seconds, phase):
+    """Add time spent in ``phase`` to the running sync's summary (a PHASE_SECONDS observer)"""
+    sync = current_sync()
+    if sync is not None:
+        with sync.lock:
+            sync.timings[phase] = sync.timings.get(phase, 0.0) + seconds
+
+def log_summary(logger, result, elapsed, domains=None, counts=None):
+    """Log the running sync's one-line summary: its result, duration, record counts and phase timings.
+
+    A successful run that had nothing to sync (no domains or counts) is
+    only logged at debug level.
+    """
+    sync = current_sync()
+    timings = dict(sync.timings) if sync else {}
+    timings.pop("total", None)
+    phases = {phase: round(seconds * 1000) for phase, seconds in sorted(timings.items())}
+    fields = {"event": "sync_summary", "result": result, "duration_ms": round(elapsed * 1000), "phases_ms": phases}
+    details = []
+    if domains is not None:
+        fields["domains"] = domains
+        details.append(f"{domains} domains")
+    if counts:
+        fields["records"] = dict(counts)
+        details.extend(f"{count} {outcome}" for outcome, count in counts.items())
+    timing_text = ", ".join(f"{phase} {ms} ms" for phase, ms in phases.items())
+    level = logging.DEBUG if result == "success" and not details else logging.INFO
+    logger.log(level, "Sync %s in %.0f ms%s%s", result, elapsed * 1000,
+               f": {', '.join(details)}" if details else "", f" ({timing_text})" if timing_text else "",
+               extra={"summary": True, **fields})
+
+class SyncFilter(logging.Filter):
+    """Stamp records with the running sync; with LOG_SUMMARY, drop its info and debug lines"""
+
+    def __init__(self, summary=False):
+        super().__init__()
+        self.summary = summary
+
+    def filter(self, record):
+        sync = current_sync()
+        if self.summary and record.levelno < logging.WARNING and not getattr(record, "summary", False):
+            if sync is not None or getattr(record, "detail", False):
+                return False
+        record.sync_id = sync.id if sync else None
+        record.sync_ms = round((time.perf_counter() - sync.start) * 1000) if sync else None
+        return True
+
+class TextFormatter(logging.Formatter):
+    """The classic text lines, with the sync id in front of messages logged during a sync"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        if getattr(record, "raw", False):
+            return record.getMessage()
+        return super().format(record)
+
+    def formatMessage(self, record):
+        sync_id = getattr(record, "sync_id", None)
+        record.sync_tag = f"[{sync_id}] " if sync_id else ""
+        return super().formatMessage(record)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, sync id and timing, and ``extra`` fields"""
+
+    def format(self, record):
+        if getattr(record, "raw", False):
+            return record.getMessage()
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        entry = {"time": f"{timestamp}.{int(record.msecs):03d}Z",
+                 "level": record.levelname, "logger": record.name, "message": record.getMessage()}
+        if getattr(record, "sync_id", None):
+            entry["sync_id"] = record.sync_id
+            entry["sync_ms"] = record.sync_ms
+        entry.update((key, value) for key, value in record.__dict__.items() if key not in _RESERVED)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def _queue_handler_class():
+    from logging.handlers import QueueHandler as BaseQueueHandler
+
+    class QueueHandler(BaseQueueHandler):
+        """Merges a record's arguments on the logging thread and leaves everything else to the listener"""
+
+        def prepare(self, record):
+            # Arguments may be mutated once the call returns, so they are merged
+            # here; timestamps, JSON encoding and I/O happen on the listener
+            record = copy.copy(record)
+            record.msg, record.args = record.getMessage(), None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            return record
+
+    return QueueHandler
+
+def configure(log_file=None, stream=None, queued=True, force=False):
+    """Configure the root logger from LOG_LEVEL, LOG_FORMAT and LOG_SUMMARY; later calls are no-ops.
+
+    Records go to ``stream`` (stderr by default) and ``log_file`` when given.
+    ``queued=False`` writes them directly, for short runs that log a line or
+    two and can't spare the import time of ``logging.handlers``. ``force``
+    replaces an earlier configuration, such as that unqueued one once the
+    run turns out to be a full sync.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return
+    shutdown()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper()))
+    formatter = JsonFormatter() if get_format() == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if queued:
+        import queue
+        from logging.handlers import QueueListener
+        records = queue.SimpleQueue()
+        _listener = QueueListener(records, *handlers)
+        _listener.start()
+        atexit.register(shutdown)
+        handlers = [_queue_handler_class()(records)]
+    for handler in handlers:
+        handler.addFilter(SyncFilter(summary_only()))
+        root.addHandler(handler)
+
+def shutdown():
+    """Write out every queued record and stop the listener thread (before exec or exit)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def relay(logger, line):
+    """Log a line another process has already formatted, such as a sync subprocess's output, unchanged"""
+    logger.info("%s", line, extra={"raw": True})
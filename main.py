@@ -5,10 +5,25 @@ Automatically sync domains from Caddyfile to Cloudflare DNS records
 """
 
 import os
-import re
+import glob
+import time
 import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from ipaddress import ip_address
+from itertools import islice
+
+import caddyfile
+import caddyjson
+import hostnames
+import state
+import zones
+import recordcache
+import recordoptions
+import ipdetect
+import cloudflare
+import logsetup
+import metrics
 
 try:
     from version import __version__
@@ -16,305 +31,1042 @@ except ImportError:
     __version__ = "unknown"
 
 # Configure logging
-log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, log_level),
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+logsetup.configure()
 logger = logging.getLogger(__name__)
+# Phase timings go into each sync's summary line as well as the metrics
+metrics.PHASE_SECONDS.observers.append(logsetup.add_timing)
 
-def parse_caddyfile(content):
-    """Simple Caddyfile parser to extract domain names"""
-    domains = set()
-    
-    # Remove comments and clean content
-    lines = []
-    for line in content.split('\n'):
-        # Remove comments (everything after #)
-        line = line.split('#')[0].strip()
-        if line:
-            lines.append(line)
-    
-    # Process line by line to find domain blocks
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # Skip empty lines, directives, and block delimiters
-        if (not line or 
-            line.startswith('{') or 
-            line.startswith('}') or
-            line.startswith('import') or
-            line.startswith('log') or
-            line.startswith('tls') or
-            line.startswith('reverse_proxy') or
-            line.startswith('file_server') or
-            line.startswith('root') or
-            line.startswith('header') or
-            line.startswith('encode') or
-            line.startswith('redir') or
-            line.startswith('handle') or
-            line.startswith('route') or
-            line.startswith('respond') or
-            line.startswith('rewrite') or
-            line.startswith('uri') or
-            line.startswith('try_files') or
-            line.startswith('@') or  # matchers
-            '=' in line):  # variable assignments
-            i += 1
-            continue
-        
-        # Look for domain patterns at the start of blocks
-        # Pattern: domain.com {
-        domain_block_match = re.match(r'^([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\s*\{', line)
-        if domain_block_match:
-            domain = domain_block_match.group(1)
-            if is_valid_domain(domain):
-                domains.add(domain)
-            i += 1
-            continue
-        
-        # Pattern: domain1.com, domain2.com {
-        multi_domain_match = re.match(r'^([a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(?:\s*,\s*[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})*)\s*\{', line)
-        if multi_domain_match:
-            domain_list = multi_domain_match.group(1)
-            for domain in domain_list.split(','):
-                domain = domain.strip()
-                if is_valid_domain(domain):
-                    domains.add(domain)
-            i += 1
-            continue
-        
-        # Pattern: standalone domain (followed by opening brace on next line)
-        if (i + 1 < len(lines) and 
-            lines[i + 1].strip() == '{' and
-            re.match(r'^[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', line)):
-            if is_valid_domain(line):
-                domains.add(line)
-            i += 1
-            continue
-        
-        # Pattern: multiple domains on one line followed by brace
-        domain_list_match = re.match(r'^([a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(?:\s*,\s*[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})*)$', line)
-        if (domain_list_match and 
-            i + 1 < len(lines) and 
-            lines[i + 1].strip() == '{'):
-            domain_list = domain_list_match.group(1)
-            for domain in domain_list.split(','):
-                domain = domain.strip()
-                if is_valid_domain(domain):
-                    domains.add(domain)
-            i += 1
-            continue
-        
-        i += 1
-    
-    return list(domains)
+# Plain HTTP session for IP sources and the Caddy admin API; it must never
+# carry the Cloudflare token, which lives on the client below
+session = requests.Session()
+
+# Cloudflare client shared by every sync in this process, so a long-lived
+# daemon keeps its pooled connections (and rate limiter) between syncs
+_client = None
+
+# Parsed Caddyfile / JSON config domains keyed by path, reused while the files are unchanged
+_domain_cache = {}
+
+# Per-file parse caches for CADDYFILE_PATH directories and globs, keyed by the path spec
+_caddyfile_sets = {}
+
+# Zone ids reconciled by the current run, recorded for the fast path
+_synced_zones = set()
+
+# When /dns_records/batch last answered 404, 405 or 501 (0.0 if it has not; None until read from the state file)
+_batch_unsupported_at = None
+
+# Caddy admin API endpoint serving the active JSON config
+DEFAULT_CADDY_JSON_CONFIG = "http://localhost:2019/config/"
+
+# Comment written on every record this tool manages; records carrying it are ours to garbage collect
+DEFAULT_OWNER_COMMENT = "managed by caddy-cloudflare-updater"
+
+def parse_caddyfile(content, source="Caddyfile"):
+    """Extract valid domain names from the site addresses of a Caddyfile"""
+    return valid_domains(caddyfile.parse(content, source))
 
 def is_valid_domain(domain):
-    """Validate if a string is a valid domain name"""
-    if not domain:
-        return False
-    
-    # Reject domains that start with a dot (like .beavis.tech)
-    if domain.startswith('.'):
-        return False
-    
-    # Remove trailing dots
-    domain = domain.rstrip('.')
-    
-    # Basic validation
-    if (len(domain) < 4 or  # minimum: a.co
-        len(domain) > 253 or  # maximum domain length
-        domain.startswith('-') or
-        domain.endswith('-') or
-        '..' in domain or
-        domain.startswith('localhost') or
-        domain.startswith('example.') or
-        domain.startswith('test.') or
-        domain.endswith('.key') or
-        domain.endswith('.pem') or
-        domain.endswith('.crt') or
-        domain.endswith('.cert') or
-        domain.endswith('.p12') or
-        domain.endswith('.pfx') or
-        'env.' in domain.lower() or
-        'cloudflare' in domain.lower() and not domain.endswith('.com')):
-        return False
-    
-    # Check if it's an IP address
-    if re.match(r'^\d+\.\d+\.\d+\.\d+$', domain):
-        return False
-    
-    # Must contain at least one dot and have valid TLD
-    parts = domain.split('.')
-    if len(parts) < 2:
-        return False
-    
-    # TLD should be at least 2 characters and only letters
-    tld = parts[-1]
-    if len(tld) < 2 or not tld.isalpha():
-        return False
-    
-    # Each part should be valid
-    for part in parts:
-        if (not part or 
-            len(part) > 63 or
-            part.startswith('-') or
-            part.endswith('-') or
-            not re.match(r'^[a-zA-Z0-9-]+$', part)):
-            return False
-    
-    return True
+    """Validate if a string is a valid domain name (see hostnames for the rules)"""
+    return hostnames.is_valid(domain)
+
+def valid_domains(hosts):
+    """Normalized (lowercase, punycode) names of the valid hosts among ``hosts``"""
+    normalize = hostnames.normalize
+    return [name for name in map(normalize, hosts) if name]
+
+def record_type_for(ip):
+    """DNS record type for an address"""
+    return "A" if ip_address(ip).version == 4 else "AAAA"
 
-def get_public_ip():
-    """Get the server's public IP address"""
+def get_public_ip(force=False, version=4):
+    """Get the server's public IP address (see ipdetect for sources and caching)"""
     try:
-        response = requests.get("https://api.ipify.org", timeout=10)
-        response.raise_for_status()
-        ip = response.text.strip()
-        logger.info(f"Detected public IP: {ip}")
-        return ip
-    except requests.RequestException as e:
-        logger.error(f"Failed to get public IP: {e}")
+        ip, previous_ip = ipdetect.get_public_ip(session, force=force, version=version)
+    except Exception as e:
+        logger.error("Failed to get public IPv%s address: %s", version, e)
         raise
+    if previous_ip and previous_ip != ip:
+        logger.info("Public IP changed: %s -> %s", previous_ip, ip)
+    else:
+        logger.info("Detected public IP: %s", ip)
+    return ip
+
+def get_public_ips(force=False):
+    """Detect every family in IP_VERSIONS concurrently, returning {record type: ip}.
+
+    In dual-stack mode a family that cannot be detected is left out (and
+    its records left untouched) as long as the other one succeeds.
+    """
+    versions = ipdetect.get_ip_versions()
+    if len(versions) == 1:
+        ip = get_public_ip(force, versions[0])
+        return {record_type_for(ip): ip}
+
+    addresses = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(versions)) as pool:
+        futures = [pool.submit(logsetup.bind(get_public_ip), force, version) for version in versions]
+        for future in futures:
+            try:
+                ip = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            addresses[record_type_for(ip)] = ip
+    if not addresses:
+        raise errors[0]
+    return addresses
+
+def get_caddyfile_set_domains(spec):
+    """Extract domains from every Caddyfile in a directory or matching a glob, re-parsing only changed files"""
+    file_set = _caddyfile_sets.get(spec)
+    if file_set is None:
+        if not glob.has_magic(spec) and not os.path.isdir(spec):
+            raise FileNotFoundError(f"Caddyfile directory not found at {spec}")
+        file_set = _caddyfile_sets[spec] = caddyfile.CaddyfileSet(spec)
+    parsed = file_set.refresh()
+    domains = set(valid_domains(file_set.hosts()))
+    if not file_set.entries:
+        logger.warning("No Caddyfiles found matching %s", spec)
+    elif domains:
+        logger.info("Found %d valid domains in %d Caddyfiles (%d parsed, %d unchanged)",
+                    len(domains), len(file_set.entries), parsed, len(file_set.entries) - parsed)
+        logger.debug("Domains: %s", ', '.join(sorted(domains)))
+    else:
+        logger.warning("No valid domains found in the Caddyfiles matching %s - check your configuration", spec)
+    return domains
 
 def get_caddy_domains(file_path):
-    """Extract domains from Caddyfile"""
+    """Extract domains from Caddyfile (or a directory or glob of them)"""
     try:
+        if caddyfile.is_file_set(file_path):
+            return get_caddyfile_set_domains(file_path)
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Caddyfile not found at {file_path}")
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # The cache covers the Caddyfile and everything it imports
+        cached = _domain_cache.get(file_path)
+        if cached and caddyfile.files_signature(cached[0]) == cached[1]:
+            logger.info("Caddyfile unchanged, reusing %d parsed domains", len(cached[2]))
+            return set(cached[2])
         
-        domains = parse_caddyfile(content)
+        hosts, dependencies, options = caddyfile.parse_file(file_path)
+        signature = caddyfile.files_signature(dependencies)
+        domains = set(valid_domains(hosts))
+        _domain_cache[file_path] = (dependencies, signature, frozenset(domains), options)
         
         if domains:
-            logger.info(f"Found {len(domains)} valid domains in Caddyfile: {', '.join(sorted(domains))}")
+            logger.info("Found %d valid domains in Caddyfile: %s", len(domains), ', '.join(sorted(domains)))
         else:
             logger.warning("No valid domains found in Caddyfile - check your configuration")
-            # Log some debug info about what was found
-            logger.debug(f"Caddyfile content preview: {content[:200]}...")
+            logger.debug("Site addresses found: %s", ', '.join(sorted(hosts)) or 'none')
         
         return set(domains)
     except Exception as e:
-        logger.error(f"Failed to parse Caddyfile: {e}")
+        logger.error("Failed to parse Caddyfile: %s", e)
         raise
 
-def sync_to_cloudflare(subdomains, ip):
-    """Sync domains to Cloudflare DNS"""
-    token = os.getenv("CF_API_TOKEN")
-    zone = os.getenv("CF_ZONE_ID")
-    root_domain = os.getenv("CF_DOMAIN")
+def get_caddy_json_domains(source):
+    """Extract domains from Caddy's JSON config, read from a file or the admin API URL"""
+    try:
+        if not caddyjson.is_admin_url(source):
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"Caddy JSON config not found at {source}")
+            cached = _domain_cache.get(source)
+            if cached and caddyfile.files_signature(cached[0]) == cached[1]:
+                logger.info("Caddy JSON config unchanged, reusing %d parsed domains", len(cached[2]))
+                return set(cached[2])
+            signature = caddyfile.files_signature((source,))
 
-    if not all([token, zone, root_domain]):
-        raise ValueError("Missing required Cloudflare environment variables")
+        hosts = caddyjson.load_hosts(source, session)
+        domains = set(valid_domains(hosts))
+        if not caddyjson.is_admin_url(source):
+            _domain_cache[source] = ((source,), signature, frozenset(domains), {})
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+        if domains:
+            logger.info("Found %d valid domains in Caddy JSON config: %s", len(domains), ', '.join(sorted(domains)))
+        else:
+            logger.warning("No valid domains found in Caddy JSON config at %s", source)
+        return domains
+    except Exception as e:
+        logger.error("Failed to read Caddy JSON config: %s", e)
+        raise
 
-    try:
-        # Get existing DNS records
-        logger.info(f"Fetching existing DNS records for zone {zone}")
-        r = requests.get(
-            f"https://api.cloudflare.com/client/v4/zones/{zone}/dns_records", 
-            headers=headers,
-            timeout=30
+def get_domains():
+    """Extract domains from the configured DOMAIN_SOURCE (caddyfile or json)"""
+    source = os.getenv("DOMAIN_SOURCE", "caddyfile").lower()
+    if source == "json":
+        return get_caddy_json_domains(os.getenv("CADDY_JSON_CONFIG", DEFAULT_CADDY_JSON_CONFIG))
+    if source != "caddyfile":
+        raise ValueError(f"Invalid DOMAIN_SOURCE '{source}', must be 'caddyfile' or 'json'")
+    return get_caddy_domains(os.getenv("CADDYFILE_PATH", "/etc/caddy/Caddyfile"))
+
+def get_watch_path():
+    """File whose changes should trigger a sync, or None when domains come from the admin API"""
+    if os.getenv("DOMAIN_SOURCE", "caddyfile").lower() == "json":
+        source = os.getenv("CADDY_JSON_CONFIG", DEFAULT_CADDY_JSON_CONFIG)
+        return None if caddyjson.is_admin_url(source) else source
+    return os.getenv("CADDYFILE_PATH", "/etc/caddy/Caddyfile")
+
+def get_source_signature():
+    """Stat signature of every file the last domain read depended on, or None when they are not local files.
+
+    RECORD_OPTIONS_FILE is included, so editing it also invalidates the fast-path record.
+    """
+    path = get_watch_path()
+    if path is None:
+        return None
+    file_set = _caddyfile_sets.get(path)
+    if file_set is not None:
+        signature = file_set.signature()
+    else:
+        cached = _domain_cache.get(path)
+        if not cached:
+            return None
+        signature = cached[1]
+    options_file = recordoptions.get_options_file()
+    return signature + caddyfile.files_signature((options_file,)) if options_file else signature
+
+def get_site_directives():
+    """Hostname -> ``# cloudflare:`` comment text of every site in the last Caddyfile read"""
+    path = get_watch_path()
+    file_set = _caddyfile_sets.get(path)
+    if file_set is not None:
+        return file_set.options()
+    cached = _domain_cache.get(path)
+    return cached[3] if cached else {}
+
+def get_site_options(fqdns, zone_name):
+    """Resolve the record options of one zone's domains, returning (fqdns, {fqdn: recordoptions.Options}).
+
+    ``cname=@`` is resolved to ``zone_name``. A CNAME target inside the zone
+    is added to the returned domains as an A/AAAA site, so the one record
+    every CNAME points to follows the public IP; unless it is a site itself
+    its options are marked ``target``, and its record is left untagged and
+    never garbage collected. The zone apex itself always keeps its A/AAAA
+    records.
+    """
+    patterns = recordoptions.load_file(recordoptions.get_options_file())
+    directives = {}
+    for host, text in get_site_directives().items():
+        name = hostnames.normalize(host)
+        if name:
+            try:
+                directives[next(iter(qualify_domains([name])))] = recordoptions.parse_directive(text)
+            except ValueError as e:
+                raise ValueError(f"Invalid '# cloudflare:' options for {host}: {e}") from None
+    default = recordoptions.defaults()
+
+    def resolve(name):
+        return recordoptions.resolve(name, patterns, directives.get(name), default)
+    options = {fqdn: resolve(fqdn) for fqdn in fqdns}
+
+    for fqdn, site in list(options.items()):
+        if not site.cname:
+            continue
+        if fqdn == zone_name:
+            # A CNAME at the apex would replace (and with DELETE_STALE_RECORDS, delete) its address records
+            logger.warning("%s is the zone apex and cannot be a CNAME, keeping its address records", fqdn)
+            options[fqdn] = site._replace(cname=None)
+            continue
+        target = zone_name if site.cname == recordoptions.APEX else hostnames.normalize(site.cname)
+        if not target or target == fqdn or not is_valid_domain(target):
+            logger.warning("%s cannot be a CNAME to %s, writing address records instead", fqdn, target or site.cname)
+            options[fqdn] = site._replace(cname=None)
+            continue
+        options[fqdn] = site._replace(cname=target)
+        if zone_name and (target == zone_name or target.endswith(f".{zone_name}")) and target not in fqdns:
+            options.setdefault(target, resolve(target)._replace(target=True))
+    for fqdn, site in options.items():
+        target = options.get(site.cname)
+        if target is not None and target.cname:
+            # The record every CNAME relies on must hold the addresses itself
+            logger.warning("%s is the CNAME target of %s, writing address records for it", site.cname, fqdn)
+            options[site.cname] = target._replace(cname=None)
+    return set(options), options
+
+def get_client():
+    """Return the process-wide CloudflareClient, creating it from the environment on first use"""
+    global _client
+    if _client is None:
+        _client = cloudflare.CloudflareClient.from_env()
+    return _client
+
+def fetch_dns_records_page(zone, client, params, page):
+    """Fetch a single page of DNS records, returning (records, result_info)"""
+    body = client.get_json(f"/zones/{zone}/dns_records", params={**params, "page": page})
+    return body["result"], body.get("result_info") or {}
+
+def iter_dns_records(zone, client, record_type=None, name=None):
+    """Yield DNS records from every page of a zone listing.
+
+    The first page is fetched on its own to learn ``total_pages``; the
+    remaining pages are then fetched concurrently (``CF_PAGE_WORKERS``) with
+    at most that many pages in flight, so records are yielded as each page
+    arrives instead of buffering the whole zone.
+    """
+    per_page = int(os.getenv("CF_PAGE_SIZE", "5000"))
+    workers = max(1, int(os.getenv("CF_PAGE_WORKERS", "4")))
+
+    params = {"per_page": per_page}
+    if record_type:
+        params["type"] = record_type
+    if name:
+        params["name"] = name
+
+    records, result_info = fetch_dns_records_page(zone, client, params, 1)
+    yield from records
+
+    total_pages = result_info.get("total_pages") or 1
+    if total_pages <= 1:
+        return
+
+    logger.debug("Zone listing spans %d pages, fetching with %d workers", total_pages, workers)
+    pages = iter(range(2, total_pages + 1))
+
+    if workers == 1:
+        for page in pages:
+            records, _ = fetch_dns_records_page(zone, client, params, page)
+            yield from records
+        return
+
+    fetch_page = logsetup.bind(fetch_dns_records_page)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {
+            pool.submit(fetch_page, zone, client, params, page)
+            for page in islice(pages, workers)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                records, _ = future.result()
+                yield from records
+                # Keep the window full: one new page per completed page
+                for page in islice(pages, 1):
+                    pending.add(pool.submit(fetch_page, zone, client, params, page))
+
+def get_owner_comment():
+    """Ownership comment for managed records, or None when tagging is disabled"""
+    return os.getenv("OWNER_COMMENT", DEFAULT_OWNER_COMMENT) or None
+
+def site_comment(site, comment):
+    """Ownership tag for the records of ``site``: none for a CNAME target that is not a site and may be hand-made"""
+    return None if site.target else comment
+
+def site_records(fqdn, site, addresses, comment):
+    """Record data ``fqdn`` should have with options ``site``: one CNAME, or one record per address"""
+    fields = recordoptions.record_fields(site)
+    targets = {"CNAME": site.cname} if site.cname else addresses
+    comment = site_comment(site, comment)
+    records = []
+    for record_type, content in sorted(targets.items()):
+        data = {"type": record_type, "name": fqdn, "content": content, **fields}
+        if comment:
+            data["comment"] = comment
+        records.append(data)
+    return records
+
+def is_owned(record, comment):
+    """True when the ownership tag ``comment`` appears anywhere in ``record``'s comment"""
+    return bool(comment) and comment in (record.get("comment") or "")
+
+def keep_comment(data, record, comment):
+    """``data`` for rewriting ``record`` with the record's own comment kept, the ownership tag appended to it"""
+    existing = record.get("comment")
+    if not existing:
+        return data
+    if comment and comment not in existing:
+        existing = f"{existing} {comment}"
+    return {**data, "comment": existing}
+
+def record_matches(record, data, comment):
+    """True when an existing record already has everything ``data`` would write"""
+    return (record["type"] == data["type"] and record["content"] == data["content"]
+            and record.get("ttl") == data["ttl"] and record.get("proxied") == data["proxied"]
+            and (not comment or is_owned(record, comment)))
+
+def managed_types(addresses, options, snapshot=None):
+    """Record types a zone's sync manages: the detected families, plus CNAME while any site uses or used one"""
+    types = set(addresses)
+    if any(site.cname for site in options.values()) or (snapshot and snapshot["records"].get("CNAME")):
+        types.add("CNAME")
+    return types
+
+def plan_changes(fqdns, addresses, existing, stale=None, comment=None, options=None):
+    """Compute the minimal changeset that gives every fqdn its wanted records.
+
+    ``addresses`` maps record type (A/AAAA) -> IP. ``existing`` maps
+    (name, type) -> Cloudflare record (at least ``id`` and ``content``).
+    ``stale`` maps (name, type) no longer wanted -> record id. ``options``
+    maps fqdn -> recordoptions.Options (the defaults for others): a CNAME
+    site gets one CNAME record instead of one per address, and TTL and
+    proxying are compared like the content. With a ``comment``, records are
+    written with it as an ownership tag and an existing record missing the
+    tag is updated to carry it after its own comment, which is never lost.
+
+    When a name changes between CNAME and address records, one of its
+    records is rewritten in place (a PUT may change the type) and the others
+    are deleted; those entries carry ``conflict`` as they must be applied
+    before the rest.
+    """
+    options = options or {}
+    default = recordoptions.defaults()
+    current = {}
+    for (name, record_type), record in existing.items():
+        if name in fqdns:
+            current.setdefault(name, {})[record_type] = record
+    changes = {"create": [], "update": [], "delete": [], "unchanged": []}
+    for fqdn in sorted(fqdns):
+        records = current.get(fqdn, {})
+        site = options.get(fqdn, default)
+        wanted = site_records(fqdn, site, addresses, comment)
+        tag = site_comment(site, comment)
+        leftover = sorted(records.keys() - {data["type"] for data in wanted})
+        for data in wanted:
+            record = records.get(data["type"])
+            if record is None and leftover:
+                record = records[leftover.pop(0)]
+            if record is None:
+                changes["create"].append(data)
+            elif record_matches(record, data, tag):
+                changes["unchanged"].append({"id": record["id"], "name": fqdn, "type": data["type"]})
+            else:
+                item = {"id": record["id"], "current": record["content"], "data": keep_comment(data, record, tag)}
+                if record["type"] != data["type"]:
+                    item["conflict"] = True
+                changes["update"].append(item)
+        for record_type in leftover:
+            changes["delete"].append({"id": records[record_type]["id"], "name": fqdn, "type": record_type,
+                                      "conflict": True})
+    for (name, record_type), rec_id in sorted((stale or {}).items()):
+        changes["delete"].append({"id": rec_id, "name": name, "type": record_type})
+    return changes
+
+def change_target(action, item):
+    """(name, record type) targeted by a changeset entry"""
+    record = item["data"] if action == "update" else item
+    return record["name"], record["type"]
+
+def change_result(action, item, rec_id, error=None):
+    """Per-record outcome of applying a changeset entry"""
+    name, record_type = change_target(action, item)
+    result = {"action": action, "name": name, "type": record_type, "id": rec_id, "ok": error is None}
+    if error is not None:
+        result["error"] = error
+    return result
+
+def write_record(zone, client, action, item, recreate_missing=False):
+    """Apply one changeset entry with a single API call, returning its result"""
+    name, record_type = change_target(action, item)
+    if action == "update":
+        if item["current"] == item["data"]["content"]:
+            logger.info("Updating TTL, proxying or ownership tag of the %s record for %s", record_type, name)
+        else:
+            logger.info("Updating %s record for %s: %s -> %s",
+                        record_type, name, item['current'], item['data']['content'])
+        response = client.request(
+            "PUT",
+            f"/zones/{zone}/dns_records/{item['id']}",
+            json=item["data"]
         )
-        r.raise_for_status()
-        records = r.json()["result"]
-        existing = {r["name"]: r for r in records if r["type"] in ("A", "AAAA")}
-        logger.info(f"Found {len(existing)} existing DNS records")
-
-        # Process each domain
-        for domain in subdomains:
-            fqdn = domain if "." in domain else f"{domain}.{root_domain}"
-            record_type = "A" if ip_address(ip).version == 4 else "AAAA"
-            
-            data = {
-                "type": record_type,
-                "name": fqdn,
-                "content": ip,
-                "ttl": 300,
-                "proxied": False
-            }
-
-            if fqdn in existing:
-                # Update existing record
-                rec_id = existing[fqdn]["id"]
-                current_ip = existing[fqdn]["content"]
-                
-                if current_ip == ip:
-                    logger.info(f"DNS record for {fqdn} is already up to date ({ip})")
-                    continue
-                
-                logger.info(f"Updating DNS record for {fqdn}: {current_ip} -> {ip}")
-                response = requests.put(
-                    f"https://api.cloudflare.com/client/v4/zones/{zone}/dns_records/{rec_id}", 
-                    headers=headers, 
-                    json=data,
-                    timeout=30
-                )
-                response.raise_for_status()
-                logger.info(f"Successfully updated {fqdn}")
+        if response.status_code == 404 and recreate_missing:
+            # Record was removed out-of-band since the snapshot was taken
+            logger.warning("%s record for %s no longer exists, re-creating it", record_type, name)
+            return write_record(zone, client, "create", item["data"])
+        response.raise_for_status()
+        rec_id = item["id"]
+        logger.info("Successfully updated %s", name)
+    elif action == "create":
+        logger.info("Creating new %s record for %s -> %s", record_type, name, item['content'])
+        response = client.request(
+            "POST",
+            f"/zones/{zone}/dns_records",
+            json=item
+        )
+        response.raise_for_status()
+        rec_id = response.json()["result"]["id"]
+        logger.info("Successfully created %s", name)
+    else:
+        logger.info("Deleting %s record for %s", record_type, name)
+        response = client.request(
+            "DELETE",
+            f"/zones/{zone}/dns_records/{item['id']}"
+        )
+        if response.status_code != 404:
+            response.raise_for_status()
+        rec_id = item["id"]
+        logger.info("Successfully deleted %s", name)
+    return change_result(action, item, rec_id)
+
+def try_write_record(zone, client, action, item, recreate_missing=False):
+    """write_record() that reports a failed call as a result instead of raising"""
+    try:
+        with metrics.PHASE_SECONDS.time(phase="write"):
+            return write_record(zone, client, action, item, recreate_missing)
+    except requests.RequestException as e:
+        name, record_type = change_target(action, item)
+        error = cloudflare.describe_error(e)
+        logger.error("Failed to %s %s record for %s: %s", action, record_type, name, error)
+        return change_result(action, item, item.get("id"), error)
+
+def write_records(zone, client, writes, recreate_missing=False):
+    """Apply writes one call per record on a pool of CF_WRITE_WORKERS threads.
+
+    Every call goes through the shared rate limiter, and a failure is
+    recorded in that record's result rather than stopping the others.
+    """
+    workers = max(1, int(os.getenv("CF_WRITE_WORKERS", "8")))
+    if workers == 1 or len(writes) <= 1:
+        return [try_write_record(zone, client, action, item, recreate_missing) for action, item in writes]
+    with ThreadPoolExecutor(max_workers=min(workers, len(writes))) as pool:
+        return list(pool.map(
+            logsetup.bind(lambda write: try_write_record(zone, client, write[0], write[1], recreate_missing)),
+            writes
+        ))
+
+def batch_unavailable():
+    """True when the batch endpoint was found unavailable by this process or, recently, a previous run"""
+    global _batch_unsupported_at
+    if _batch_unsupported_at is None:
+        _batch_unsupported_at = state.load_batch_unsupported(state.get_state_file()) or 0.0
+    return time.time() - _batch_unsupported_at < state.BATCH_REPROBE_AFTER
+
+def remember_batch_unavailable():
+    """Skip the batch endpoint for the rest of this process and, through the state file, later runs"""
+    global _batch_unsupported_at
+    _batch_unsupported_at = time.time()
+    state.save_batch_unsupported(state.get_state_file(), _batch_unsupported_at)
+
+def write_batches(zone, client, writes, chunk_size, recreate_missing=False):
+    """Apply writes through /dns_records/batch in chunks of ``chunk_size``.
+
+    Returns (results, remaining) where ``remaining`` holds the writes that
+    still need per-record calls because the batch endpoint is unavailable.
+    """
+    results = []
+    for start in range(0, len(writes), chunk_size):
+        chunk = writes[start:start + chunk_size]
+        body = {"deletes": [], "puts": [], "posts": []}
+        for action, item in chunk:
+            if action == "delete":
+                body["deletes"].append({"id": item["id"]})
+            elif action == "update":
+                body["puts"].append({"id": item["id"], **item["data"]})
             else:
-                # Create new record
-                logger.info(f"Creating new DNS record for {fqdn} -> {ip}")
-                response = requests.post(
-                    f"https://api.cloudflare.com/client/v4/zones/{zone}/dns_records", 
-                    headers=headers, 
-                    json=data,
-                    timeout=30
+                body["posts"].append(item)
+
+        logger.info("Applying %d DNS changes in one batch request (%d creates, %d updates, %d deletes)",
+                    len(chunk), len(body['posts']), len(body['puts']), len(body['deletes']))
+        try:
+            with metrics.PHASE_SECONDS.time(phase="batch_write"):
+                response = client.request(
+                    "POST",
+                    f"/zones/{zone}/dns_records/batch",
+                    json=body,
+                    timeout=60
                 )
+            if response.status_code >= 500 and response.status_code != 501:
                 response.raise_for_status()
-                logger.info(f"Successfully created {fqdn}")
+        except requests.RequestException as e:
+            error = cloudflare.describe_error(e)
+            logger.error("Batch of %d DNS changes failed: %s", len(chunk), error)
+            results.extend(change_result(action, item, item.get("id"), error) for action, item in chunk)
+            continue
+        if response.status_code in (404, 405, 501):
+            logger.warning("Batch DNS endpoint not available (%s), falling back to per-record calls",
+                           response.status_code)
+            remember_batch_unavailable()
+            return results, writes[start:]
+        if 400 <= response.status_code < 500:
+            # Batches are applied atomically, so retry this chunk record by
+            # record to isolate the change Cloudflare rejected
+            logger.warning("Batch of %d changes rejected (%s): %s; retrying per record",
+                           len(chunk), response.status_code, response.text[:200])
+            results.extend(write_records(zone, client, chunk, recreate_missing))
+            continue
+
+        result = response.json()["result"] or {}
+        returned = {key: iter(result.get(key) or []) for key in ("deletes", "puts", "posts")}
+        for action, item in chunk:
+            name, record_type = change_target(action, item)
+            key = {"delete": "deletes", "update": "puts", "create": "posts"}[action]
+            record = next(returned[key], None) or {}
+            rec_id = record.get("id", item.get("id"))
+            verb = {"delete": "deleted", "update": "updated", "create": "created"}[action]
+            logger.info("Successfully %s %s record for %s (batched)", verb, record_type, name)
+            results.append(change_result(action, item, rec_id))
+    return results, []
+
+def settings_key(data):
+    """Settings a write shares with others in its group: record type, TTL and proxying"""
+    return data["type"], data["ttl"], data["proxied"]
+
+def write_phases(changes):
+    """The changeset's (action, item) writes as phases, each to finish before the next starts.
+
+    Deletes making room for a CNAME come first, then records changing
+    type, then everything else. Within that last phase, updates and
+    creates are grouped by record settings, so records with identical
+    settings share batch requests, and stale deletes come last.
+    """
+    conflicts = [("delete", item) for item in changes["delete"] if item.get("conflict")]
+    retyped = [("update", item) for item in changes["update"] if item.get("conflict")]
+    writes = sorted([("update", item) for item in changes["update"] if not item.get("conflict")] +
+                    [("create", item) for item in changes["create"]],
+                    key=lambda write: settings_key(write[1]["data"] if write[0] == "update" else write[1]))
+    writes += [("delete", item) for item in changes["delete"] if not item.get("conflict")]
+    return [phase for phase in (conflicts, retyped, writes) if phase]
+
+def apply_changes(zone, client, changes, recreate_missing=False):
+    """Apply a changeset from plan_changes(), returning one result per record.
+
+    With CF_BATCH enabled (the default) multiple writes are grouped into
+    /dns_records/batch requests of up to CF_BATCH_SIZE changes, in the
+    order of write_phases(); otherwise, or when the batch endpoint is
+    unavailable (remembered for state.BATCH_REPROBE_AFTER seconds), each
+    change is its own call on the write_records() pool, one phase at a
+    time. Failed changes are reported with ``ok: False`` and do not stop
+    the remaining ones.
+    """
+    phases = write_phases(changes)
+    writes = [write for phase in phases for write in phase]
+    if not writes:
+        return []
+
+    results = []
+    use_batch = os.getenv("CF_BATCH", "true").lower() == "true" and len(writes) > 1 and not batch_unavailable()
+    if use_batch:
+        # A batch applies its deletes, then updates, then creates, which keeps the phases in order
+        chunk_size = max(1, int(os.getenv("CF_BATCH_SIZE", "200")))
+        results, writes = write_batches(zone, client, writes, chunk_size, recreate_missing)
+
+    if writes:
+        remaining = {id(item) for _, item in writes}
+        for phase in phases:
+            phase = [write for write in phase if id(write[1]) in remaining]
+            if phase:
+                results.extend(write_records(zone, client, phase, recreate_missing))
+    return results
+
+def hold_stale_deletes(zone, changes):
+    """Drop stale-record deletes from ``changes`` unless they may be applied, returning the held deletes.
+
+    Deletes run only with DELETE_STALE_RECORDS=true and at most
+    MAX_STALE_DELETES of them per zone; above that threshold none are
+    applied, guarding against a truncated Caddyfile wiping the zone.
+    DELETE_STALE_RECORDS=dry-run logs what would be deleted instead.
+    """
+    # Deletes making room for a CNAME are part of the site's change, not stale records
+    conflicts = [item for item in changes["delete"] if item.get("conflict")]
+    deletes = [item for item in changes["delete"] if not item.get("conflict")]
+    if not deletes:
+        return []
+    mode = os.getenv("DELETE_STALE_RECORDS", "false").lower()
+    max_deletes = int(os.getenv("MAX_STALE_DELETES", "50"))
+    if mode not in ("true", "dry-run"):
+        names = ', '.join(sorted({d["name"] for d in deletes}))
+        logger.info("Leaving records for domains removed from Caddyfile: %s "
+                    "(set DELETE_STALE_RECORDS=true to delete them)", names)
+    elif max_deletes and len(deletes) > max_deletes:
+        logger.warning("Refusing to delete %d stale records in zone %s: more than "
+                       "MAX_STALE_DELETES=%d; check the Caddy config or raise the limit",
+                       len(deletes), zone, max_deletes)
+    elif mode == "dry-run":
+        for item in deletes:
+            logger.info("[dry-run] Would delete stale %s record for %s (%s)", item['type'], item['name'], item['id'])
+    else:
+        return []
+    changes["delete"] = conflicts
+    return deletes
+
+def summarize_results(changes, results):
+    """Count the outcome of a sync by action"""
+    summary = {"created": 0, "updated": 0, "deleted": 0, "unchanged": len(changes["unchanged"]), "failed": 0}
+    for result in results:
+        if not result["ok"]:
+            summary["failed"] += 1
+            continue
+        summary[{"create": "created", "update": "updated", "delete": "deleted"}[result["action"]]] += 1
+    return summary
+
+def listing_filters(fqdns, record_types, comment):
+    """Server-side (type, name) filters for a zone listing, None where the listing must not be narrowed.
+
+    The type is filtered when only one record type is managed, and the name
+    only when a single domain is synced, no owned records are sought and the
+    listing is not stored in the record cache.
+    """
+    type_filter = next(iter(record_types)) if len(record_types) == 1 else None
+    name_filter = (next(iter(fqdns)) if fqdns and len(fqdns) == 1 and not comment
+                   and not recordcache.get_cache_file() else None)
+    return type_filter, name_filter
+
+def collect_existing(records, fqdns, record_types, comment):
+    """Split listed records of ``record_types`` into (existing, owned): records for ``fqdns`` and our orphaned ones"""
+    existing = {}
+    owned = {}
+    for record in records:
+        if record["type"] not in record_types:
+            continue
+        if record["name"] in fqdns:
+            existing[(record["name"], record["type"])] = record
+        elif is_owned(record, comment):
+            # Tagged by us but no longer configured, even if the snapshot lost track of it
+            owned[(record["name"], record["type"])] = record["id"]
+    return existing, owned
+
+def load_cached_records(zone, record_types):
+    """The zone's cached (records, listed_at) within RECORD_CACHE_TTL, None when stale or the cache is disabled"""
+    cache_file = recordcache.get_cache_file()
+    return recordcache.load(cache_file, zone, record_types) if cache_file else None
+
+def zone_is_current(snapshot, fqdns, addresses, cached, options=None):
+    """True when the snapshot matches, record options included, and the record cache is not due a listing"""
+    return (state.snapshot_is_current(snapshot, state.domains_hash(fqdns), addresses)
+            and snapshot.get("options") == recordoptions.digest(options or {})
+            and (cached is not None or not recordcache.get_cache_file()))
+
+def report_drift(zone, drift):
+    """Log and count records a fresh listing found changed since they were cached"""
+    if not drift:
+        return
+    for kind, _, _, _ in drift:
+        metrics.RECORD_DRIFT.inc(kind=kind)
+    shown = ', '.join(f"{name} ({record_type}) {kind} {detail}" for kind, name, record_type, detail in drift[:10])
+    more = f" and {len(drift) - 10} more" if len(drift) > 10 else ""
+    logger.warning("%d DNS records in zone %s changed outside the updater since they were cached: %s%s",
+                   len(drift), zone, shown, more)
+
+def existing_from_listing(zone, records, fqdns, record_types, comment):
+    """collect_existing() over a zone listing, stored in the record cache first when it is enabled"""
+    cache_file = recordcache.get_cache_file()
+    if cache_file:
+        # Only the cache needs the whole zone in memory; otherwise the pages stream through collect_existing
+        records = list(records)
+        report_drift(zone, recordcache.save_listing(cache_file, zone, records, record_types))
+    existing, owned = collect_existing(records, fqdns, record_types, comment)
+    logger.info("Found %d existing DNS records%s", len(existing),
+                f" and {len(owned)} owned records no longer configured" if owned else "")
+    return existing, owned
+
+def existing_from_cache(zone, cached, fqdns, record_types, comment):
+    """collect_existing() over the record cache in place of a zone listing"""
+    records, listed_at = cached
+    logger.info("Using %d cached DNS records for zone %s (listed %.0fs ago), skipping zone listing",
+                len(records), zone, time.time() - listed_at)
+    return collect_existing(records.values(), fqdns, record_types, comment)
+
+def snapshot_covers(snapshot, fqdns, addresses, options=None):
+    """True when every domain's records were applied last time with the same options, so the snapshot can stand in"""
+    if not snapshot or snapshot.get("options") != recordoptions.digest(options or {}):
+        return False
+    known = snapshot["records"]
+    options = options or {}
+    default = recordoptions.defaults()
+    cnames = {fqdn for fqdn in fqdns if options.get(fqdn, default).cname}
+    return (all(record_type in snapshot["ips"] and fqdns - cnames <= known.get(record_type, {}).keys()
+                for record_type in addresses)
+            and cnames <= known.get("CNAME", {}).keys())
+
+def existing_from_snapshot(snapshot, fqdns, addresses, comment, options=None):
+    """The snapshot's record ids and IPs, with the options they were written with, in the shape of a zone listing"""
+    options = options or {}
+    default = recordoptions.defaults()
+    existing = {}
+    for fqdn in fqdns:
+        for data in site_records(fqdn, options.get(fqdn, default), snapshot["ips"], comment):
+            if data["type"] == "CNAME" or data["type"] in addresses:
+                existing[(fqdn, data["type"])] = {**data, "id": snapshot["records"][data["type"]][fqdn]}
+    return existing
+
+def plan_zone(zone, fqdns, addresses, snapshot, existing, owned, comment, options=None):
+    """Plan one zone's changes, returning (changes, applied) where ``applied`` is the snapshot to build on"""
+    known = snapshot["records"] if snapshot else {}
+    # CNAME targets that were not sites are left alone once no CNAME needs them
+    targets = set(snapshot.get("targets", ())) if snapshot else set()
+    record_types = managed_types(addresses, options or {}, snapshot)
+    # Families not detected this run keep their recorded state untouched
+    stale = {
+        (name, record_type): rec_id
+        for record_type, records in known.items() if record_type in record_types
+        for name, rec_id in records.items() if name not in fqdns and name not in targets
+    }
+    stale.update(owned)
+    changes = plan_changes(fqdns, addresses, existing, stale, comment, options)
+    applied = {record_type: dict(records) for record_type, records in known.items()
+               if record_type not in record_types}
+    for record_type in record_types:
+        applied.setdefault(record_type, {})
+    for record in changes["unchanged"]:
+        applied[record["type"]][record["name"]] = record["id"]
+        target = addresses.get(record["type"]) or (options or {})[record["name"]].cname
+        logger.info("%s record for %s is already up to date (%s)", record['type'], record['name'], target)
+
+    # Held records stay in the snapshot so a later run can still delete them
+    for item in hold_stale_deletes(zone, changes):
+        applied[item["type"]][item["name"]] = item["id"]
+    return changes, applied
+
+def finish_zone(zone, fqdns, addresses, changes, applied, results, synced_at, options=None):
+    """Record the applied state of one zone and return its summary"""
+    failed = [result for result in results if not result["ok"]]
+    for result in results:
+        if result["action"] == "delete" and result["ok"]:
+            applied[result["type"]].pop(result["name"], None)
+        elif result["ok"] or result["action"] == "delete":
+            applied[result["type"]][result["name"]] = result["id"]
+
+    cache_file = recordcache.get_cache_file()
+    if cache_file:
+        # Our own writes keep the cached copy current without listing the zone again
+        written = {(data["name"], data["type"]): data
+                   for data in changes["create"] + [item["data"] for item in changes["update"]]}
+        recordcache.apply_results(cache_file, zone, results, written)
+
+    # A partially applied run must not look current, so the next run retries the failures. Only the
+    # families synced now are recorded: domains added while one was undetected have none of its records
+    digest = None if failed else state.domains_hash(fqdns)
+    state.save_snapshot(state.get_state_file(), zone, addresses, digest, applied,
+                        synced_at=synced_at, options=recordoptions.digest(options or {}),
+                        targets=sorted(name for name, site in (options or {}).items() if site.target))
+    summary = summarize_results(changes, results)
+    logger.info("Sync summary: %d created, %d updated, %d deleted, %d unchanged, %d failed", summary['created'],
+                summary['updated'], summary['deleted'], summary['unchanged'], summary['failed'])
+    if failed:
+        names = ', '.join(f"{r['name']} ({r['type']})" for r in failed)
+        logger.error("%d DNS changes failed: %s", len(failed), names)
+    return summary
+
+def skipped_zone_summary(zone, fqdns, addresses, options=None):
+    """Summary of a zone whose snapshot already matches, so no API call is needed"""
+    logger.info("No changes since last sync (%d domains in zone %s -> %s), skipping Cloudflare API calls",
+                len(fqdns), zone, ', '.join(addresses.values()))
+    cnames = sum(1 for site in (options or {}).values() if site.cname)
+    unchanged = (len(fqdns) - cnames) * len(addresses) + cnames
+    return {"created": 0, "updated": 0, "deleted": 0, "unchanged": unchanged, "failed": 0}
+
+def sync_zone(zone, fqdns, addresses, client, options=None):
+    """Sync ``fqdns`` within one zone to ``addresses`` ({record type: ip}), returning counts of records by outcome.
+
+    ``options`` maps fqdn -> recordoptions.Options, as from get_site_options().
+    """
+    _synced_zones.add(zone)
+
+    # Compare against the last applied state before touching the API
+    snapshot = state.load_snapshot(state.get_state_file(), zone)
+    record_types = managed_types(addresses, options or {}, snapshot)
+    cached = load_cached_records(zone, record_types)
+    if zone_is_current(snapshot, fqdns, addresses, cached, options):
+        return skipped_zone_summary(zone, fqdns, addresses, options)
+    comment = get_owner_comment()
+
+    try:
+        if cached is not None:
+            # The cached listing, kept current by our own writes, stands in for the zone listing
+            existing, owned = existing_from_cache(zone, cached, fqdns, record_types, comment)
+            synced_at = cached[1]
+        elif not recordcache.get_cache_file() and snapshot_covers(snapshot, fqdns, addresses, options):
+            # Every domain was applied last time, so the snapshot's record ids
+            # and IPs stand in for the zone listing
+            logger.info("All %d domains known from last sync, skipping zone listing", len(fqdns))
+            existing, owned = existing_from_snapshot(snapshot, fqdns, addresses, comment, options), {}
+            synced_at = snapshot["synced_at"]
+        else:
+            # Get existing DNS records in a single listing, filtered server-side where possible
+            logger.info("Fetching existing DNS records for zone %s", zone)
+            type_filter, name_filter = listing_filters(fqdns, record_types, comment)
+            with metrics.PHASE_SECONDS.time(phase="zone_listing"):
+                existing, owned = existing_from_listing(
+                    zone, iter_dns_records(zone, client, record_type=type_filter, name=name_filter),
+                    fqdns, record_types, comment
+                )
+            synced_at = None
+
+        changes, applied = plan_zone(zone, fqdns, addresses, snapshot, existing, owned, comment, options)
+        results = apply_changes(zone, client, changes, recreate_missing=synced_at is not None)
+        return finish_zone(zone, fqdns, addresses, changes, applied, results, synced_at, options)
                 
     except requests.RequestException as e:
-        error_details = ""
-        if hasattr(e, 'response') and e.response is not None:
-            try:
-                error_json = e.response.json()
-                if 'errors' in error_json and error_json['errors']:
-                    error_messages = [err.get('message', str(err)) for err in error_json['errors']]
-                    error_details = f" - API Errors: {'; '.join(error_messages)}"
-                elif 'message' in error_json:
-                    error_details = f" - API Message: {error_json['message']}"
-            except:
-                error_details = f" - Response: {e.response.text[:200] if e.response.text else 'No response body'}"
-        
-        logger.error(f"Cloudflare API request failed: {e}{error_details}")
+        logger.error("Cloudflare API request failed: %s", cloudflare.describe_error(e))
         raise
     except Exception as e:
-        logger.error(f"Failed to sync to Cloudflare: {e}")
+        logger.error("Failed to sync to Cloudflare: %s", e)
         raise
 
+def list_zones(client):
+    """Return {zone_name: zone_id} for every active zone the token can access"""
+    found = {}
+    page = 1
+    while True:
+        body = client.get_json("/zones", params={"status": "active", "per_page": 50, "page": page})
+        for zone in body["result"]:
+            found[zone["name"]] = zone["id"]
+        if page >= (body.get("result_info") or {}).get("total_pages", 1):
+            return found
+        page += 1
+
+def get_zone_index(client, refresh=False):
+    """Load the hostname -> zone index, from the on-disk cache while within ZONE_CACHE_TTL"""
+    cache_file = zones.get_zone_cache_file()
+    if not refresh:
+        index = zones.load_cached_index(cache_file, int(os.getenv("ZONE_CACHE_TTL", "3600")))
+        if index is not None:
+            logger.info("Using cached index of %d zones", len(index.zones))
+            return index
+    logger.info("Listing zones accessible to the API token")
+    index = zones.ZoneIndex(list_zones(client))
+    logger.info("Found %d accessible zones", len(index.zones))
+    zones.save_index(cache_file, index)
+    return index
+
+# Minimum cache age before an unresolvable hostname triggers a zone re-listing
+ZONE_REFRESH_MIN_AGE = 300
+
+def group_by_zone(fqdns, client, index=None):
+    """Split fqdns into {zone_id: (zone_name, {fqdns})} and the unmatched names, using ``index`` if given"""
+    index = index or get_zone_index(client)
+    grouped, unmatched = index.group(fqdns)
+    if unmatched and index.from_cache and time.time() - index.fetched_at > ZONE_REFRESH_MIN_AGE:
+        # A zone may have been added since the cache was written
+        index = get_zone_index(client, refresh=True)
+        grouped, unmatched = index.group(fqdns)
+    for name in sorted(unmatched):
+        logger.warning("No accessible Cloudflare zone for %s, skipping it", name)
+    return grouped, unmatched
+
+def sync_all_zones(fqdns, addresses, client):
+    """Resolve each fqdn to its zone and sync the zones in parallel (CF_ZONE_WORKERS)"""
+    grouped, unmatched = group_by_zone(fqdns, client)
+
+    summary = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+    if not grouped:
+        return summary
+
+    workers = max(1, int(os.getenv("CF_ZONE_WORKERS", "4")))
+    logger.info("Syncing %d domains across %d zones", len(fqdns) - len(unmatched), len(grouped))
+    # CNAME targets join their zone's domains before the zones are synced
+    sites = {zone_id: (zone_name, *get_site_options(names, zone_name))
+             for zone_id, (zone_name, names) in grouped.items()}
+    with ThreadPoolExecutor(max_workers=min(workers, len(grouped))) as pool:
+        futures = {
+            pool.submit(logsetup.bind(sync_zone), zone_id, names, addresses, client, options): (zone_name, names)
+            for zone_id, (zone_name, names, options) in sites.items()
+        }
+        for future in futures:
+            zone_name, names = futures[future]
+            try:
+                zone_summary = future.result()
+            except Exception as e:
+                # sync_zone has already logged the failure; keep the other zones going
+                logger.error("Sync of zone %s failed: %s", zone_name, e)
+                summary["failed"] += len(names) * len(addresses)
+                continue
+            for key in summary:
+                summary[key] += zone_summary[key]
+    return summary
+
+def get_zone_config():
+    """Return (CF_ZONE_ID, multi-zone mode), raising ValueError when the Cloudflare settings are incomplete"""
+    zone = os.getenv("CF_ZONE_ID")
+    multi_zone = os.getenv("CF_MULTI_ZONE", "false").lower() == "true"
+    if not os.getenv("CF_API_TOKEN") or (not multi_zone and not all([zone, os.getenv("CF_DOMAIN")])):
+        raise ValueError("Missing required Cloudflare environment variables")
+    return zone, multi_zone
+
+def qualify_domains(subdomains):
+    """Fully-qualified names for ``subdomains``, appending CF_DOMAIN to bare labels"""
+    root_domain = os.getenv("CF_DOMAIN")
+    return {domain if "." in domain or not root_domain else f"{domain}.{root_domain}" for domain in subdomains}
+
+def sync_to_cloudflare(subdomains, ips):
+    """Sync domains to Cloudflare DNS, returning counts of records by outcome.
+
+    ``ips`` is a single address or a {record type: ip} mapping for
+    dual-stack syncs, where A and AAAA records are reconciled together.
+
+    With CF_MULTI_ZONE=true every zone the token can access is eligible and
+    each domain goes to the zone with the longest matching suffix; otherwise
+    all domains are written to CF_ZONE_ID. Each zone's record options come
+    from get_site_options().
+    """
+    zone, multi_zone = get_zone_config()
+    client = get_client()
+    fqdns = qualify_domains(subdomains)
+    addresses = {record_type_for(ips): ips} if isinstance(ips, str) else ips
+
+    if multi_zone:
+        try:
+            return sync_all_zones(fqdns, addresses, client)
+        except requests.RequestException as e:
+            logger.error("Cloudflare API request failed: %s", cloudflare.describe_error(e))
+            raise
+    fqdns, options = get_site_options(fqdns, os.getenv("CF_DOMAIN"))
+    return sync_zone(zone, fqdns, addresses, client, options)
+
 def run_sync():
     """Main synchronization function"""
-    try:
-        logger.info(f"=== Caddy Cloudflare DNS Updater v{__version__} ===")
-        logger.info("=== Starting DNS synchronization ===")
-        
-        # Get current public IP
-        ip = get_public_ip()
-        
-        # Get domains from Caddyfile
-        caddyfile_path = os.getenv("CADDYFILE_PATH", "/etc/caddy/Caddyfile")
-        domains = get_caddy_domains(caddyfile_path)
-        
-        if not domains:
-            logger.warning("No domains found in Caddyfile")
-            return
-        
-        # Sync to Cloudflare
-        sync_to_cloudflare(domains, ip)
-        logger.info("=== DNS synchronization completed successfully ===")
-        
-    except Exception as e:
-        logger.error(f"DNS synchronization failed: {e}")
-        raise
+    start = time.perf_counter()
+    result = "failure"
+    domains = summary = None
+    _synced_zones.clear()
+    with logsetup.sync_context():
+        try:
+            logger.info("=== Caddy Cloudflare DNS Updater v%s ===", __version__)
+            logger.info("=== Starting DNS synchronization ===")
+
+            # Get current public IP(s)
+            with metrics.PHASE_SECONDS.time(phase="ip_detect"):
+                ips = get_public_ips()
+
+            # Get domains from the Caddyfile or Caddy's JSON config
+            with metrics.PHASE_SECONDS.time(phase="domains"):
+                domains = get_domains()
+            metrics.DOMAINS.set(len(domains))
+
+            if not domains:
+                logger.warning("No domains found in Caddy configuration")
+                result = "success"
+                return
+
+            # Sync to Cloudflare
+            with metrics.PHASE_SECONDS.time(phase="cloudflare_sync"):
+                summary = sync_to_cloudflare(domains, ips)
+            complete_sync(domains, ips, summary)
+            result = "success"
+
+        except Exception as e:
+            logger.error("DNS synchronization failed: %s", e)
+            raise
+        finally:
+            record_run(start, result, domains, summary)
+
+def complete_sync(domains, ips, summary):
+    """Report a sync's summary, raising if any change failed, and store the fast-path record"""
+    for outcome, count in summary.items():
+        metrics.RECORDS.set(count, outcome=outcome)
+    if summary["failed"]:
+        raise RuntimeError(f"{summary['failed']} DNS changes could not be applied")
+    
+    # Lets fastpath.py skip the next runs entirely while nothing changes
+    signature = get_source_signature()
+    if signature is not None:
+        cache_file = recordcache.get_cache_file()
+        refresh_at = recordcache.refresh_due(cache_file, _synced_zones) if cache_file else None
+        state.save_fastpath(state.get_state_file(), signature, ips, _synced_zones, len(domains), refresh_at)
+    logger.info("=== DNS synchronization completed successfully ===")
+
+def record_run(start, result, domains=None, summary=None):
+    """Record a run's duration and result in the metrics, writing METRICS_TEXTFILE when set, and log its summary"""
+    elapsed = time.perf_counter() - start
+    metrics.PHASE_SECONDS.observe(elapsed, phase="total")
+    metrics.SYNCS.inc(result=result)
+    if result == "success":
+        metrics.LAST_SUCCESS.set(time.time())
+    textfile = os.getenv("METRICS_TEXTFILE")
+    if textfile:
+        metrics.write_textfile(textfile)
+    logsetup.log_summary(logger, result, elapsed, None if domains is None else len(domains), summary)
 
 if __name__ == "__main__":
     run_sync()
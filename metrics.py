@@ -0,0 +1,292 @@
+"""
+Prometheus metrics for sync phases, Cloudflare API calls and sync outcomes.
+
+Metrics are kept in-process and rendered in the Prometheus text exposition
+format, either served on ``/metrics`` (daemon mode, METRICS_PORT) or
+written atomically to a file for node_exporter's textfile collector
+(METRICS_TEXTFILE, for cron and one-shot runs). Recording a sample is a
+lock and a few dict operations, so instrumentation stays on the hot path.
+"""
+
+import os
+import re
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Base class: a named family of samples keyed by label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), persist=False):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Persisted samples survive a textfile rewrite by a process that never set them
+        self.persist = persist
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) for rendering"""
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in sorted(items):
+            yield "", key, (), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, key, extra)} {_number(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Called as observer(value, **labels) after each observation
+        self.observers = []
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+        for observer in self.observers:
+            observer(value, **labels)
+
+    def restore(self, key, cumulative, total, count):
+        """Add the cumulative bucket counts ({le: count}), sum and count of an earlier process to ``key``"""
+        bounds = [_number(bound) for bound in self.buckets]
+        if set(cumulative) != set(bounds):
+            # Written with other buckets, which cannot be carried over
+            return
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            below = 0
+            for i, bound in enumerate(bounds):
+                entry[0][i] += int(cumulative[bound]) - below
+                below = int(cumulative[bound])
+            entry[1] += total
+            entry[2] += int(count)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self.values.items()]
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield "_bucket", key, (("le", _number(bound)),), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), count
+
+PHASE_SECONDS = Histogram(
+    "caddy_updater_phase_duration_seconds",
+    "Time spent in each sync phase",
+    ["phase"],
+)
+API_REQUESTS = Counter(
+    "caddy_updater_cloudflare_requests_total",
+    "Cloudflare API requests sent, by method and HTTP status (\"error\" for connection failures)",
+    ["method", "status"],
+)
+SYNCS = Counter(
+    "caddy_updater_syncs_total",
+    "Completed syncs by result",
+    ["result"],
+)
+DOMAINS = Gauge(
+    "caddy_updater_domains",
+    "Valid domains found in the Caddy config by the last sync",
+)
+RECORDS = Gauge(
+    "caddy_updater_records",
+    "DNS records by outcome in the last sync",
+    ["outcome"],
+)
+RECORD_DRIFT = Counter(
+    "caddy_updater_record_drift_total",
+    "Cached DNS records found changed outside the updater when the zone was listed again, by kind",
+    ["kind"],
+)
+LAST_SUCCESS = Gauge(
+    "caddy_updater_last_success_timestamp_seconds",
+    "Unix time the last sync completed successfully",
+    persist=True,
+)
+
+def render():
+    """Every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+_UNESCAPE = re.compile(r'\\(.)')
+
+# Textfiles whose earlier samples this process has already taken over
+_restored = set()
+
+def _read_samples(path):
+    """Yield (name, {label: value}, value) for every sample of a previously written textfile"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = _SAMPLE.match(line.strip())
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            labels = {key: _UNESCAPE.sub(lambda m: "\n" if m.group(1) == "n" else m.group(1), text)
+                      for key, text in _LABEL.findall(labels or "")}
+            yield name, labels, float(value)
+
+def _restore_previous(path):
+    """Carry the samples of a previously written textfile into this process's first write of it.
+
+    Each cron or one-shot run is a new process, so counters and histograms
+    continue from the totals of earlier runs instead of starting from zero,
+    and persisted gauges this process never set keep their last value.
+    """
+    if path in _restored:
+        return
+    _restored.add(path)
+    if not os.path.exists(path):
+        return
+    gauges = {metric.name: metric for metric in _registry
+              if metric.persist and not metric.labelnames and not metric.values}
+    counters = {metric.name: metric for metric in _registry if isinstance(metric, Counter)}
+    histograms = {f"{metric.name}{suffix}": (metric, suffix) for metric in _registry
+                  if isinstance(metric, Histogram) for suffix in ("_bucket", "_sum", "_count")}
+    # Applied only once the whole file has been read
+    samples = []
+    # (histogram, label values) -> [{le: cumulative count}, sum, count]
+    previous = {}
+    try:
+        for name, labels, value in _read_samples(path):
+            if name in gauges:
+                samples.append((gauges[name].set, labels, value))
+            elif name in counters and set(labels) == set(counters[name].labelnames):
+                samples.append((counters[name].inc, labels, value))
+            elif name in histograms:
+                metric, suffix = histograms[name]
+                le = labels.pop("le", None)
+                if set(labels) != set(metric.labelnames):
+                    continue
+                entry = previous.setdefault((metric, metric._key(labels)), [{}, 0.0, 0])
+                if suffix == "_bucket":
+                    entry[0][le] = value
+                else:
+                    entry[1 if suffix == "_sum" else 2] = value
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read previous metrics from %s: %s", path, e)
+        return
+    for record, labels, value in samples:
+        record(value, **labels)
+    for (metric, key), (cumulative, total, count) in previous.items():
+        metric.restore(key, cumulative, total, count)
+
+def write_textfile(path):
+    """Atomically write every metric to ``path`` for node_exporter's textfile collector"""
+    _restore_previous(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write metrics to %s: %s", path, e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port, addr=""):
+    """Serve /metrics on a background thread, returning the server (call shutdown() to stop)"""
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving Prometheus metrics on %s:%s/metrics", addr or '0.0.0.0', server.server_address[1])
+    return server
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Asyncio sync pipeline.
+
+Runs the same sync as main.run_sync with its stages overlapped. Public IP
+detection and reading the Caddy config run at the same time. So does the
+zone listing whenever the record cache is due one (in multi-zone mode, the
+zone index); without the cache a listing is streamed into the plan rather
+than held in memory. Planned writes are streamed through a
+bounded queue to CF_WRITE_WORKERS writer tasks, which group whatever is
+queued into /dns_records/batch requests of up to CF_BATCH_SIZE (one call
+per record without CF_BATCH). A full queue holds back planning, so the
+API sets the pace.
+
+The HTTP and file work is blocking and runs on a pipeline thread pool, so
+the pooled CloudflareClient, its rate limiter, the snapshot and the
+per-record results are exactly those of the threaded code path.
+
+    python pipeline.py
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import main
+import state
+import recordcache
+import ipdetect
+import metrics
+import logsetup
+import cloudflare
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+def get_executor():
+    """Thread pool for blocking calls, sized for every writer plus the concurrent read stages"""
+    global _executor
+    if _executor is None:
+        workers = max(1, int(os.getenv("CF_WRITE_WORKERS", "8")))
+        _executor = ThreadPoolExecutor(max_workers=workers + 4, thread_name_prefix="pipeline")
+    return _executor
+
+def blocking(func, *args, **kwargs):
+    """Run a blocking call on the pipeline pool, returning an awaitable"""
+    call = functools.partial(logsetup.bind(func), *args, **kwargs)
+    return asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+async def timed(phase, func, *args):
+    with metrics.PHASE_SECONDS.time(phase=phase):
+        return await blocking(func, *args)
+
+def start_listing(zone, client, fqdns, record_types, comment):
+    """Start listing a zone in the background for the record cache, returning a future of its records"""
+    type_filter, name_filter = main.listing_filters(fqdns, record_types, comment)
+
+    def listing():
+        with metrics.PHASE_SECONDS.time(phase="zone_listing"):
+            return list(main.iter_dns_records(zone, client, record_type=type_filter, name=name_filter))
+    return blocking(listing)
+
+def list_existing(zone, client, fqdns, record_types, comment):
+    """main.existing_from_listing() over a listing streamed page by page, as main.sync_zone() does"""
+    type_filter, name_filter = main.listing_filters(fqdns, record_types, comment)
+    with metrics.PHASE_SECONDS.time(phase="zone_listing"):
+        return main.existing_from_listing(
+            zone, main.iter_dns_records(zone, client, record_type=type_filter, name=name_filter),
+            fqdns, record_types, comment)
+
+async def apply_changes(zone, client, changes, recreate_missing=False):
+    """main.apply_changes() as a stream of writes through a bounded queue to concurrent writers.
+
+    The phases of main.write_phases() are streamed one after the other, so
+    a record changing type is only written once the deletes making room for
+    it are done.
+    """
+    phases = main.write_phases(changes)
+    writes = [write for phase in phases for write in phase]
+    if not writes:
+        return []
+
+    workers = max(1, int(os.getenv("CF_WRITE_WORKERS", "8")))
+    use_batch = os.getenv("CF_BATCH", "true").lower() == "true" and len(writes) > 1 and not main.batch_unavailable()
+    chunk_size = max(1, int(os.getenv("CF_BATCH_SIZE", "200"))) if use_batch else 1
+    # Two chunks per writer: one being written, one ready to go
+    queue = asyncio.Queue(maxsize=workers * chunk_size * 2)
+    results = []
+    errors = []
+
+    async def writer():
+        nonlocal use_batch
+        while True:
+            chunk = [await queue.get()]
+            while len(chunk) < chunk_size:
+                try:
+                    chunk.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                remaining = chunk
+                if use_batch and len(chunk) > 1:
+                    batched, remaining = await blocking(main.write_batches, zone, client, chunk, len(chunk),
+                                                        recreate_missing)
+                    results.extend(batched)
+                    if remaining:
+                        # The batch endpoint is unavailable (write_batches remembered it for later
+                        # syncs); the other writers need not try it again
+                        use_batch = False
+                for action, item in remaining:
+                    results.append(await blocking(main.try_write_record, zone, client, action, item,
+                                                  recreate_missing))
+            except Exception as e:
+                # Keep draining the queue so join() returns; the error is raised once it does
+                errors.append(e)
+            finally:
+                for _ in chunk:
+                    queue.task_done()
+
+    tasks = [asyncio.create_task(writer()) for _ in range(min(workers, len(writes)))]
+    try:
+        for phase in phases:
+            for write in phase:
+                await queue.put(write)
+            await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if errors:
+        raise errors[0]
+    return results
+
+async def sync_zone(zone, fqdns, addresses, client, listing=None, options=None):
+    """main.sync_zone() with the zone listing and writes awaited; ``listing`` is a listing already under way"""
+    main._synced_zones.add(zone)
+
+    snapshot = await blocking(state.load_snapshot, state.get_state_file(), zone)
+    record_types = main.managed_types(addresses, options or {}, snapshot)
+    cached = await blocking(main.load_cached_records, zone, record_types)
+    if main.zone_is_current(snapshot, fqdns, addresses, cached, options):
+        return main.skipped_zone_summary(zone, fqdns, addresses, options)
+    comment = main.get_owner_comment()
+    early_filter = main.listing_filters(None, expected_addresses(), comment)[0]
+    if listing is not None and early_filter and record_types != {early_filter}:
+        # Started before the domains were read, that listing left out the CNAME records this zone now needs
+        listing = None
+
+    # Without the record cache, a snapshot of every domain can stand in for the listing
+    covered = not recordcache.get_cache_file() and main.snapshot_covers(snapshot, fqdns, addresses, options)
+    try:
+        if listing is None and cached is not None:
+            existing, owned = main.existing_from_cache(zone, cached, fqdns, record_types, comment)
+            synced_at = cached[1]
+        elif listing is None and covered:
+            logger.info("All %d domains known from last sync, skipping zone listing", len(fqdns))
+            existing, owned = main.existing_from_snapshot(snapshot, fqdns, addresses, comment, options), {}
+            synced_at = snapshot["synced_at"]
+        elif listing is not None:
+            existing, owned = await blocking(main.existing_from_listing, zone, await listing, fqdns, record_types,
+                                             comment)
+            synced_at = None
+        else:
+            logger.info("Fetching existing DNS records for zone %s", zone)
+            existing, owned = await blocking(list_existing, zone, client, fqdns, record_types, comment)
+            synced_at = None
+
+        changes, applied = main.plan_zone(zone, fqdns, addresses, snapshot, existing, owned, comment, options)
+        results = await apply_changes(zone, client, changes, recreate_missing=synced_at is not None)
+        return await blocking(main.finish_zone, zone, fqdns, addresses, changes, applied, results, synced_at,
+                              options)
+
+    except requests.RequestException as e:
+        logger.error("Cloudflare API request failed: %s", cloudflare.describe_error(e))
+        raise
+    except Exception as e:
+        logger.error("Failed to sync to Cloudflare: %s", e)
+        raise
+
+async def sync_all_zones(fqdns, addresses, client, index):
+    """main.sync_all_zones() with up to CF_ZONE_WORKERS zones synced concurrently"""
+    grouped, unmatched = await blocking(main.group_by_zone, fqdns, client, index)
+    summary = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+    if not grouped:
+        return summary
+
+    logger.info("Syncing %d domains across %d zones", len(fqdns) - len(unmatched), len(grouped))
+    limit = asyncio.Semaphore(max(1, int(os.getenv("CF_ZONE_WORKERS", "4"))))
+
+    async def sync_one(zone_id, names, options):
+        async with limit:
+            return await sync_zone(zone_id, names, addresses, client, options=options)
+
+    sites = {zone_id: (zone_name, *main.get_site_options(names, zone_name))
+             for zone_id, (zone_name, names) in grouped.items()}
+    outcomes = await asyncio.gather(*(sync_one(zone_id, names, options)
+                                      for zone_id, (_, names, options) in sites.items()),
+                                    return_exceptions=True)
+    for (zone_name, names, _), outcome in zip(sites.values(), outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Sync of zone %s failed: %s", zone_name, outcome)
+            summary["failed"] += len(names) * len(addresses)
+            continue
+        for key in summary:
+            summary[key] += outcome[key]
+    return summary
+
+def expected_addresses():
+    """Record types IP_VERSIONS will yield, for filtering a listing started before detection ends"""
+    return {"A" if version == 4 else "AAAA": None for version in ipdetect.get_ip_versions()}
+
+def listing_needed(zone):
+    """True when the record cache is on and has no fresh records for the zone, so a listing is certain.
+
+    Without the cache the listing is not started early: it would have to be
+    held in memory until the domains are known.
+    """
+    return bool(recordcache.get_cache_file()) and main.load_cached_records(zone, expected_addresses()) is None
+
+async def run_sync():
+    """main.run_sync() as a pipeline, returning the sync summary (None when there are no domains)"""
+    start = time.perf_counter()
+    result = "failure"
+    domains = summary = None
+    main._synced_zones.clear()
+    pending = []
+    with logsetup.sync_context():
+        try:
+            logger.info("=== Caddy Cloudflare DNS Updater v%s ===", main.__version__)
+            logger.info("=== Starting DNS synchronization (pipeline) ===")
+            zone, multi_zone = main.get_zone_config()
+            client = main.get_client()
+
+            # IP detection, the Caddy config and whatever part of the Cloudflare
+            # side can be fetched without them all start together
+            ip_task = asyncio.ensure_future(timed("ip_detect", main.get_public_ips))
+            domains_task = asyncio.ensure_future(timed("domains", main.get_domains))
+            pending = [ip_task, domains_task]
+            listing = index = None
+            if multi_zone:
+                index = asyncio.ensure_future(blocking(main.get_zone_index, client))
+                pending.append(index)
+            elif await blocking(listing_needed, zone):
+                # The listing is needed whatever the domains turn out to be
+                logger.info("Fetching existing DNS records for zone %s while detecting IP and reading domains", zone)
+                listing = start_listing(zone, client, None, expected_addresses(), main.get_owner_comment())
+                pending.append(listing)
+
+            ips, domains = await asyncio.gather(ip_task, domains_task)
+            metrics.DOMAINS.set(len(domains))
+            if not domains:
+                logger.warning("No domains found in Caddy configuration")
+                result = "success"
+                return None
+
+            with metrics.PHASE_SECONDS.time(phase="cloudflare_sync"):
+                fqdns = main.qualify_domains(domains)
+                if multi_zone:
+                    try:
+                        summary = await sync_all_zones(fqdns, ips, client, await index)
+                    except requests.RequestException as e:
+                        logger.error("Cloudflare API request failed: %s", cloudflare.describe_error(e))
+                        raise
+                else:
+                    fqdns, options = main.get_site_options(fqdns, os.getenv("CF_DOMAIN"))
+                    summary = await sync_zone(zone, fqdns, ips, client, listing, options)
+            await blocking(main.complete_sync, domains, ips, summary)
+            result = "success"
+            return summary
+
+        except Exception as e:
+            logger.error("DNS synchronization failed: %s", e)
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await blocking(main.record_run, start, result, domains, summary)
+
+if __name__ == "__main__":
+    asyncio.run(run_sync())
@@ -0,0 +1,83 @@
+"""
+Client-side rate limiting and retry backoff for Cloudflare API calls.
+
+Cloudflare allows 1200 requests per 5 minutes per user. The token bucket
+below is sized so that its burst plus its refill over one window never
+exceeds that budget, and a 429 response pauses every caller sharing it.
+"""
+
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+    """Thread-safe token bucket; ``rate`` of 0 disables limiting"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a bucket from CF_RATE_LIMIT requests per CF_RATE_WINDOW seconds"""
+        limit = int(os.getenv("CF_RATE_LIMIT", "1200"))
+        window = float(os.getenv("CF_RATE_WINDOW", "300"))
+        if limit <= 0:
+            return cls(0, 1)
+        burst = min(int(os.getenv("CF_RATE_BURST", "100")), limit)
+        # Keep burst + refill over one window within the budget
+        return cls(max(limit - burst, 1) / window, burst)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every caller for ``seconds`` (e.g. after a 429) and drain the bucket"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with jitter for retry number ``attempt`` (0-based)"""
+    delay = min(cap, base * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+def retry_after(response):
+    """Seconds requested by a Retry-After header, or None if absent/unparseable"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
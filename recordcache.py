@@ -0,0 +1,155 @@
+"""
+On-disk cache of each zone's A/AAAA (and, with CNAME sites, CNAME)
+records, keyed by (name, type).
+
+A full zone listing is stored here, and every write the updater makes is
+applied to the cached copy in place. A later sync, including one that
+adds domains, can therefore plan its changes without listing the zone
+again. The cache is trusted for RECORD_CACHE_TTL seconds after the listing
+that filled it. After that, the next sync lists the zone again. Any
+difference between that listing and the cache is a change made outside
+the updater (drift). It is logged and counted before the sync corrects
+it. Cloudflare offers no change feed or conditional (ETag) listing for
+DNS records, so a refresh is always a full listing.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Zones are synced in parallel but share one cache file
+_cache_lock = threading.Lock()
+
+CACHE_VERSION = 2
+DEFAULT_RECORD_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".caddy-updater-records.json")
+
+def get_cache_file():
+    """Return the record cache path, or None when the cache is disabled (RECORD_CACHE_FILE="")"""
+    return os.getenv("RECORD_CACHE_FILE", DEFAULT_RECORD_CACHE_FILE) or None
+
+def get_ttl():
+    return int(os.getenv("RECORD_CACHE_TTL", "3600"))
+
+def _read_cache(path):
+    """Read the cache file, returning {zone: entry} (empty if missing or unusable)"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable record cache %s: %s", path, e)
+        return {}
+    if data.get("version") != CACHE_VERSION:
+        return {}
+    return data.get("zones") or {}
+
+def _write_cache(path, zones):
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": CACHE_VERSION, "zones": zones}, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write record cache %s: %s", path, e)
+
+def _decode(entry):
+    """Cached entry as {(name, type): record}, records shaped like a zone listing's"""
+    records = {}
+    for key, (rec_id, content, comment, ttl, proxied) in entry.get("records", {}).items():
+        record_type, name = key.split(" ", 1)
+        records[(name, record_type)] = {"id": rec_id, "name": name, "type": record_type, "content": content,
+                                        "comment": comment, "ttl": ttl, "proxied": proxied}
+    return records
+
+def _encode(records):
+    return {f"{record_type} {name}": [record["id"], record["content"], record.get("comment"), record.get("ttl"),
+                                      record.get("proxied")]
+            for (name, record_type), record in records.items()}
+
+def _fields(record):
+    return record["id"], record["content"], record.get("comment"), record.get("ttl"), record.get("proxied")
+
+def load(path, zone, record_types):
+    """Return (records, listed_at) from a cached listing of ``record_types`` within RECORD_CACHE_TTL, else None"""
+    with _cache_lock:
+        entry = _read_cache(path).get(zone)
+    if not entry or not set(record_types) <= set(entry.get("types", ())):
+        return None
+    age = time.time() - entry.get("listed_at", 0)
+    if age >= get_ttl():
+        logger.debug("Cached records for zone %s are %.0fs old, past RECORD_CACHE_TTL", zone, age)
+        return None
+    return _decode(entry), entry["listed_at"]
+
+def drift(previous, current, record_types):
+    """Differences between a cached and a fresh listing: (kind, name, type, detail) tuples"""
+    changes = []
+    for key in sorted(previous.keys() | current.keys()):
+        if key[1] not in record_types:
+            continue
+        old, new = previous.get(key), current.get(key)
+        if new is None:
+            changes.append(("deleted", key[0], key[1], old["content"]))
+        elif old is None:
+            changes.append(("created", key[0], key[1], new["content"]))
+        elif _fields(old) != _fields(new):
+            detail = [old["content"] if old["content"] == new["content"] else f"{old['content']} -> {new['content']}"]
+            detail += [f"{field} {old.get(field)} -> {new.get(field)}" for field in ("ttl", "proxied")
+                       if old.get(field) != new.get(field)]
+            changes.append(("changed", key[0], key[1], ", ".join(detail)))
+    return changes
+
+def save_listing(path, zone, records, record_types):
+    """Store a full listing of ``record_types`` for a zone, returning its drift from the cached copy.
+
+    Drift is only reported when a cached listing of the same types exists;
+    otherwise the list is empty.
+    """
+    current = {(record["name"], record["type"]): record for record in records if record["type"] in record_types}
+    with _cache_lock:
+        zones = _read_cache(path)
+        entry = zones.get(zone)
+        changes = []
+        if entry and set(record_types) <= set(entry.get("types", ())):
+            changes = drift(_decode(entry), current, record_types)
+        zones[zone] = {"listed_at": time.time(), "types": sorted(record_types), "records": _encode(current)}
+        _write_cache(path, zones)
+    return changes
+
+def apply_results(path, zone, results, written):
+    """Apply the outcome of a sync's writes to the cached copy of a zone, keeping its listing time.
+
+    ``written`` maps the (name, type) of every create and update to the record data sent.
+    """
+    succeeded = [result for result in results if result["ok"]]
+    if not succeeded:
+        return
+    with _cache_lock:
+        zones = _read_cache(path)
+        entry = zones.get(zone)
+        if not entry:
+            return
+        records = _decode(entry)
+        keys = {record["id"]: key for key, record in records.items()}
+        for result in succeeded:
+            key = (result["name"], result["type"])
+            # An update that changed the record's type leaves its old key behind
+            records.pop(keys.get(result["id"]), None)
+            if result["action"] == "delete":
+                records.pop(key, None)
+            else:
+                records[key] = {**written[key], "id": result["id"]}
+        entry["records"] = _encode(records)
+        _write_cache(path, zones)
+
+def refresh_due(path, zones):
+    """Earliest time one of ``zones`` needs its records listed again, or None when none is cached"""
+    with _cache_lock:
+        cached = _read_cache(path)
+    times = [cached[zone]["listed_at"] + get_ttl() for zone in zones if zone in cached]
+    return min(times) if times else None
@@ -0,0 +1,152 @@
+"""
+Per-site DNS record options: Cloudflare proxying, TTL, and a CNAME in
+place of A/AAAA records.
+
+Options are resolved per hostname. Each source overrides the ones before it:
+
+- ``RECORD_TTL`` and ``RECORD_PROXIED``, the defaults for every site
+- ``RECORD_OPTIONS_FILE``, a JSON object mapping hostnames or glob patterns
+  (``*.example.com``) to options, with more specific patterns winning
+- a ``# cloudflare:`` comment at the end of a site's address line in the
+  Caddyfile, or on the lines directly above it, such as
+  ``# cloudflare: proxied ttl=120 cname``
+
+``cname`` points a site at the zone apex (``cname=@``, the default) or at
+another hostname (``cname=origin.example.com``). A CNAME site has nothing
+to update when the public IP changes, because only the record it points to
+does. A rotation of hundreds of CNAME sites is therefore a single A record
+write.
+"""
+
+import os
+import re
+import json
+import fnmatch
+import hashlib
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# ``cname`` is None for A/AAAA records, APEX or a hostname for a CNAME. ``target``
+# marks a name synced only because CNAME sites point to it, not a site itself
+Options = namedtuple("Options", ("ttl", "proxied", "cname", "target"), defaults=(False,))
+
+DEFAULT_TTL = 300
+# Cloudflare's "automatic" TTL, which it enforces on proxied records
+AUTO_TTL = 1
+APEX = "@"
+BUILTIN = Options(DEFAULT_TTL, False, None)
+
+_GLOB_CHARS = re.compile(r'[*?\[]')
+_TRUE = ("true", "on", "yes", "1")
+_FALSE = ("false", "off", "no", "0")
+
+# Parsed RECORD_OPTIONS_FILE keyed by path: (stat signature, patterns)
+_file_cache = {}
+
+def get_options_file():
+    """Return the RECORD_OPTIONS_FILE path, or None when no mapping file is used"""
+    return os.getenv("RECORD_OPTIONS_FILE") or None
+
+def defaults():
+    """Options for sites nothing else configures, from RECORD_TTL and RECORD_PROXIED"""
+    return Options(parse_value("ttl", os.getenv("RECORD_TTL", str(DEFAULT_TTL))),
+                   parse_value("proxied", os.getenv("RECORD_PROXIED", "false")), None)
+
+def parse_value(key, value):
+    """Validate one option, returning its normalized value or raising ValueError"""
+    if key == "ttl":
+        if isinstance(value, str) and value.lower() == "auto":
+            return AUTO_TTL
+        try:
+            ttl = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"ttl must be a number of seconds or 'auto', not {value!r}") from None
+        if ttl != AUTO_TTL and not 30 <= ttl <= 86400:
+            raise ValueError(f"ttl must be 'auto' or between 30 and 86400 seconds, not {ttl}")
+        return ttl
+    if key == "proxied":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in _TRUE + _FALSE:
+            return value.lower() in _TRUE
+        raise ValueError(f"proxied must be true or false, not {value!r}")
+    if key == "cname":
+        if value is True:
+            return APEX
+        if value is None or value is False or (isinstance(value, str) and value.lower() in _FALSE):
+            return None
+        if isinstance(value, str) and value.lower() in _TRUE:
+            return APEX
+        if not isinstance(value, str) or not value.strip(". "):
+            raise ValueError(f"cname must be '@' or a hostname, not {value!r}")
+        return value if value == APEX else value.rstrip(".").lower()
+    raise ValueError(f"unknown record option {key!r} (expected ttl, proxied or cname)")
+
+def parse_directive(text):
+    """Options set by a ``# cloudflare:`` comment: bare ``proxied``/``cname`` flags and ``key=value`` pairs"""
+    fields = {}
+    for word in text.replace(",", " ").split():
+        key, _, value = word.partition("=")
+        key = key.lower()
+        fields[key] = parse_value(key, value if value else True)
+    return fields
+
+def parse_mapping(data, source):
+    """Validate a RECORD_OPTIONS_FILE object, returning [(pattern, fields)] from least to most specific"""
+    if not isinstance(data, dict):
+        raise ValueError(f"{source}: expected an object mapping hostnames or patterns to options")
+    patterns = []
+    for pattern, values in data.items():
+        if not isinstance(values, dict):
+            raise ValueError(f"{source}: options for {pattern!r} must be an object")
+        try:
+            fields = {key: parse_value(key, value) for key, value in values.items()}
+        except ValueError as e:
+            raise ValueError(f"{source}: {pattern}: {e}") from None
+        patterns.append((pattern.rstrip(".").lower(), fields))
+    # Applied in order, so exact names come after patterns and longer patterns after shorter ones
+    patterns.sort(key=lambda item: (not _GLOB_CHARS.search(item[0]), len(item[0])))
+    return patterns
+
+def load_file(path):
+    """Patterns from the mapping file at ``path``, re-read only when it changes ([] without a file)"""
+    if not path:
+        return []
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _file_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{path}: invalid JSON: {e}") from None
+    patterns = parse_mapping(data, path)
+    _file_cache[path] = (signature, patterns)
+    logger.info("Loaded record options for %d hostnames and patterns from %s", len(patterns), path)
+    return patterns
+
+def resolve(name, patterns, directive=None, default=None):
+    """Options for ``name``: the defaults, overridden by matching patterns and then by its Caddyfile directive"""
+    fields = (default or defaults())._asdict()
+    for pattern, values in patterns:
+        if pattern == name or fnmatch.fnmatchcase(name, pattern):
+            fields.update(values)
+    if directive:
+        fields.update(directive)
+    return Options(**fields)
+
+def record_fields(options):
+    """TTL and proxied fields of a record written with ``options``"""
+    return {"ttl": AUTO_TTL if options.proxied else options.ttl, "proxied": options.proxied}
+
+def digest(options):
+    """Hash of the options ({name: Options}) that differ from the built-in defaults, None when none do"""
+    lines = sorted("\t".join((name, str(site.ttl), str(site.proxied), site.cname or "") + ("target",) * site.target)
+                   for name, site in options.items() if site != BUILTIN)
+    if not lines:
+        return None
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
@@ -46,7 +46,7 @@ def run_with_mode(mode="once"):
     # Run the main script
     python_exe = "I:/Development/caddy-cloudflare-updater/.venv/Scripts/python.exe"
     
-    if mode in ["watcher", "cron", "hybrid"]:
+    if mode in ["watcher", "daemon", "cron", "hybrid"]:
         print(f"⚡ Starting in {mode} mode (will run continuously)")
         print("Press Ctrl+C to stop")
         
@@ -54,6 +54,8 @@ def run_with_mode(mode="once"):
             # For continuous modes, import and run the appropriate script
             if mode == "watcher":
                 subprocess.run([python_exe, "watcher_windows.py"], check=True)
+            elif mode == "daemon":
+                subprocess.run([python_exe, "daemon.py"], check=True)
             elif mode == "cron":
                 print("⏰ Starting cron mode (sync every 10 minutes)")
                 while True:
@@ -69,29 +71,9 @@ def run_with_mode(mode="once"):
                     print("💤 Sleeping for 10 minutes...")
                     time.sleep(600)  # 10 minutes
             elif mode == "hybrid":
-                # Run both watcher and cron
-                import threading
-                import time
-                
-                def cron_runner():
-                    print("⏰ Cron thread started (sync every 10 minutes)")
-                    while True:
-                        try:
-                            result = subprocess.run([python_exe, "main.py"], capture_output=True, text=True)
-                            if result.returncode == 0:
-                                print(f"⏰ Cron sync completed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-                            else:
-                                print(f"⏰ Cron sync failed: {result.stderr}")
-                        except Exception as e:
-                            print(f"⏰ Cron error: {e}")
-                        time.sleep(600)  # 10 minutes
-                
-                # Start cron in background
-                cron_thread = threading.Thread(target=cron_runner, daemon=True)
-                cron_thread.start()
-                
-                # Run watcher in foreground
-                subprocess.run([python_exe, "watcher_windows.py"], check=True)
+                # The daemon's scheduler handles both file events and the periodic sync
+                os.environ.setdefault("RECONCILE_INTERVAL", "600")
+                subprocess.run([python_exe, "daemon.py"], check=True)
         except KeyboardInterrupt:
             print("\n⏹️  Stopped by user")
         except Exception as e:
@@ -118,14 +100,15 @@ def main():
         print("Available modes:")
         print("  once    - Run sync once and exit")
         print("  watcher - Monitor Caddyfile for changes")
+        print("  daemon  - Monitor Caddyfile, syncing in-process")
         print("  cron    - Run every 10 minutes")
-        print("  hybrid  - Both watcher + cron")
+        print("  hybrid  - Daemon + periodic sync every 10 minutes")
         print()
-        mode = input("Select mode (once/watcher/cron/hybrid) [once]: ").strip().lower()
+        mode = input("Select mode (once/watcher/daemon/cron/hybrid) [once]: ").strip().lower()
         if not mode:
             mode = "once"
     
-    if mode not in ["once", "watcher", "cron", "hybrid"]:
+    if mode not in ["once", "watcher", "daemon", "cron", "hybrid"]:
         print(f"❌ Invalid mode: {mode}")
         return 1
     
@@ -5,7 +5,8 @@ Environment setup and validation for Caddy Cloudflare DNS Updater
 
 import os
 import requests
-import json
+
+from cloudflare import CloudflareClient, describe_error
 
 try:
     from version import __version__
@@ -33,82 +34,44 @@ def test_cloudflare_credentials():
     
     print(f"\n🔍 Testing API connection...")
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    client = CloudflareClient.from_env()
     
     try:
         # Test API token validity
         print("1. Testing API token validity...")
-        response = requests.get(
-            "https://api.cloudflare.com/client/v4/user/tokens/verify",
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                print("   ✅ API token is valid!")
-            else:
-                print(f"   ❌ API token invalid: {result.get('errors', 'Unknown error')}")
-                return False
-        else:
-            print(f"   ❌ API token validation failed: {response.status_code} - {response.text}")
+        token_info = client.verify_token()
+        if token_info.get("status", "active") != "active":
+            print(f"   ❌ API token is not active: {token_info.get('status')}")
             return False
+        print("   ✅ API token is valid!")
         
         # Test zone access
         print("2. Testing zone access...")
-        response = requests.get(
-            f"https://api.cloudflare.com/client/v4/zones/{zone_id}",
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                zone_name = result["result"]["name"]
-                print(f"   ✅ Zone access confirmed! Zone: {zone_name}")
-                if zone_name != domain:
-                    print(f"   ⚠️  Warning: Zone name ({zone_name}) doesn't match CF_DOMAIN ({domain})")
-            else:
-                print(f"   ❌ Zone access failed: {result.get('errors', 'Unknown error')}")
-                return False
-        else:
-            print(f"   ❌ Zone access failed: {response.status_code} - {response.text}")
-            return False
+        zone_name = client.get_zone(zone_id)["name"]
+        print(f"   ✅ Zone access confirmed! Zone: {zone_name}")
+        if zone_name != domain:
+            print(f"   ⚠️  Warning: Zone name ({zone_name}) doesn't match CF_DOMAIN ({domain})")
         
         # Test DNS records access
         print("3. Testing DNS records access...")
-        response = requests.get(
-            f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records",
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                records = result["result"]
-                print(f"   ✅ DNS records access confirmed! Found {len(records)} existing records")
-            else:
-                print(f"   ❌ DNS records access failed: {result.get('errors', 'Unknown error')}")
-                return False
-        else:
-            print(f"   ❌ DNS records access failed: {response.status_code} - {response.text}")
-            return False
+        body = client.get_json(f"/zones/{zone_id}/dns_records", params={"per_page": 1})
+        total = (body.get("result_info") or {}).get("total_count", len(body["result"]))
+        print(f"   ✅ DNS records access confirmed! Found {total} existing records")
         
         print("\n🎉 All credentials are working correctly!")
         return True
         
+    except requests.HTTPError as e:
+        print(f"   ❌ API request failed: {describe_error(e)}")
+        return False
     except requests.RequestException as e:
-        print(f"   ❌ Network error: {e}")
+        print(f"   ❌ Network error: {describe_error(e)}")
         return False
     except Exception as e:
         print(f"   ❌ Unexpected error: {e}")
         return False
+    finally:
+        client.close()
 
 def show_setup_instructions():
     """Show detailed setup instructions"""
@@ -153,3 +116,6 @@ if __name__ == "__main__":
         print("\n✅ Your setup is ready! You can now run the DNS updater.")
         print(f"\nTo run the updater:")
         print(f"   python main.py")
+        print(f"\nTo review the changes before making them:")
+        print(f"   python changeset.py plan --output plan.json")
+        print(f"   python changeset.py apply --plan plan.json")
@@ -0,0 +1,189 @@
+"""
+Persisted snapshot of the last successfully applied DNS state.
+
+The snapshot lets a sync skip every Cloudflare API call when neither the
+Caddyfile's domain set nor the public IP has changed since the last run,
+and lets IP changes for already-known domains be written straight to the
+recorded record ids without listing the zone first.
+
+Next to the per-zone snapshots, a successful sync stores a fast-path record
+(a hash of the settings, the stat signature of the domain source files and
+the synced IPs) that fastpath.py checks without importing the sync code.
+The file also remembers when the batch DNS endpoint was last found
+unavailable, so later runs skip probing it.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Zones are synced in parallel but share one state file
+_state_lock = threading.Lock()
+
+SNAPSHOT_VERSION = 3
+# Probe the batch DNS endpoint again this long after finding it unavailable
+BATCH_REPROBE_AFTER = 86400
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".caddy-updater-state.json")
+
+def get_state_file():
+    """Return the snapshot path, or None when snapshots are disabled (STATE_FILE="")"""
+    return os.getenv("STATE_FILE", DEFAULT_STATE_FILE) or None
+
+def domains_hash(fqdns):
+    """Stable hash of a set of fully-qualified domain names"""
+    return hashlib.sha256("\n".join(sorted(fqdns)).encode("utf-8")).hexdigest()
+
+# Settings that decide what a sync writes; reporting options (LOG_LEVEL, METRICS_*)
+# and per-invocation variables from cron or systemd are left out
+SETTING_PREFIXES = ("CF_", "CADDY", "DOMAIN_", "IP", "OWNER_", "DELETE_STALE", "MAX_STALE", "PUBLIC_SUFFIX",
+                    "HOSTNAME_", "RECORD_", "STATE_", "ZONE_")
+
+def settings_hash(environ=None):
+    """Stable hash of the updater's settings, so a configuration change invalidates the fast-path record"""
+    environ = os.environ if environ is None else environ
+    items = (f"{key}={environ[key]}" for key in sorted(environ) if key.startswith(SETTING_PREFIXES))
+    return hashlib.sha256("\0".join(items).encode("utf-8")).hexdigest()
+
+def _read_state(path):
+    """Read the state file, returning its contents (empty if missing or unusable)"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable state file %s: %s", path, e)
+        return {}
+    if data.get("version") != SNAPSHOT_VERSION:
+        return {}
+    return data
+
+def _write_state(path, data):
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**data, "version": SNAPSHOT_VERSION}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write state file %s: %s", path, e)
+
+def _snapshot_age(snapshot):
+    """Seconds since the snapshot's last full sync, or None while within STATE_MAX_AGE"""
+    max_age = int(os.getenv("STATE_MAX_AGE", "86400"))
+    age = time.time() - snapshot.get("synced_at", 0)
+    return age if max_age and age > max_age else None
+
+def load_snapshot(path, zone):
+    """Load the snapshot for ``zone``, or None if missing, stale or unusable"""
+    with _state_lock:
+        snapshot = (_read_state(path).get("zones") or {}).get(zone)
+    if not snapshot:
+        return None
+
+    age = _snapshot_age(snapshot)
+    if age is not None:
+        logger.info("Last full sync was %.1fh ago, forcing a full reconcile", age / 3600)
+        return None
+    return snapshot
+
+def snapshot_is_current(snapshot, digest, addresses):
+    """True when the snapshot already reflects this domain set and every address in ``addresses``"""
+    if not snapshot or snapshot.get("domains_hash") != digest:
+        return False
+    ips = snapshot.get("ips") or {}
+    return all(ips.get(record_type) == ip for record_type, ip in addresses.items())
+
+def save_snapshot(path, zone, addresses, digest, records, synced_at=None, options=None, targets=None):
+    """Atomically write the applied state for one zone.
+
+    ``addresses`` maps record type -> IP and ``records`` maps record type ->
+    {fqdn: record id}. ``options`` is the digest of the record options the
+    records were written with (None for the defaults), and ``targets`` the
+    CNAME targets among the records that are not sites themselves.
+    """
+    if not path:
+        return
+    snapshot = {
+        "ips": addresses,
+        "domains_hash": digest,
+        "records": records,
+        "synced_at": synced_at if synced_at is not None else time.time(),
+    }
+    if options:
+        snapshot["options"] = options
+    if targets:
+        snapshot["targets"] = targets
+    with _state_lock:
+        data = _read_state(path)
+        data.setdefault("zones", {})[zone] = snapshot
+        # The applied state moved on, so the next run must not trust the fast-path record
+        data.pop("fastpath", None)
+        _write_state(path, data)
+
+def load_fastpath(path):
+    """Load the fast-path record, or None if missing, the record cache is due a listing or any zone a full reconcile"""
+    with _state_lock:
+        data = _read_state(path)
+    record = data.get("fastpath")
+    if not record:
+        return None
+    if record.get("refresh_at") and time.time() >= record["refresh_at"]:
+        logger.info("Cached zone records are past RECORD_CACHE_TTL, running a full sync")
+        return None
+    snapshots = data.get("zones") or {}
+    for zone in record.get("zones", ()):
+        snapshot = snapshots.get(zone)
+        if not snapshot:
+            return None
+        age = _snapshot_age(snapshot)
+        if age is not None:
+            logger.info("Last full sync of zone %s was %.1fh ago, running a full sync", zone, age / 3600)
+            return None
+    return record
+
+def save_fastpath(path, sources, addresses, zones, domains, refresh_at=None):
+    """Record what a successful sync depended on, for fastpath.py.
+
+    ``sources`` is the stat signature of the domain source files,
+    ``addresses`` maps record type -> IP and ``zones`` lists the zone ids
+    synced. ``refresh_at`` is when the record cache is next due a listing.
+    Nothing is written when the stored record already matches.
+    """
+    if not path:
+        return
+    record = {
+        "settings": settings_hash(),
+        "sources": [list(entry) for entry in sources],
+        "ips": addresses,
+        "zones": sorted(zones),
+        "domains": domains,
+        "refresh_at": refresh_at,
+    }
+    with _state_lock:
+        data = _read_state(path)
+        if data.get("fastpath") == record:
+            return
+        data["fastpath"] = record
+        _write_state(path, data)
+
+def load_batch_unsupported(path):
+    """When the batch DNS endpoint was found unavailable, or None if never or over BATCH_REPROBE_AFTER ago"""
+    with _state_lock:
+        unsupported_at = _read_state(path).get("batch_unsupported_at")
+    if unsupported_at and time.time() - unsupported_at < BATCH_REPROBE_AFTER:
+        return unsupported_at
+    return None
+
+def save_batch_unsupported(path, unsupported_at):
+    """Record that the batch DNS endpoint answered 404, 405 or 501 at ``unsupported_at``"""
+    if not path:
+        return
+    with _state_lock:
+        data = _read_state(path)
+        data["batch_unsupported_at"] = unsupported_at
+        _write_state(path, data)
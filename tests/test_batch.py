@@ -0,0 +1,81 @@
+"""Tests that an unavailable batch DNS endpoint is probed once, not on every sync."""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import cloudflare
+import main
+import state
+from mock_cloudflare import MockCloudflare, start_server
+
+class BatchUnsupportedTest(unittest.TestCase):
+    def setUp(self):
+        self.api = MockCloudflare(batch=False)
+        self.server, base_url = start_server(self.api)
+        self.directory = tempfile.mkdtemp(prefix="caddy-batch-")
+        self.state_file = os.path.join(self.directory, "state.json")
+        env = mock.patch.dict(os.environ, {"CF_API_URL": base_url, "CF_API_TOKEN": "mock", "CF_BATCH": "true",
+                                           "STATE_FILE": self.state_file, "CF_RATE_LIMIT": "1000000",
+                                           "CF_RATE_BURST": "1000000"})
+        env.start()
+        self.addCleanup(env.stop)
+        self.client = cloudflare.CloudflareClient.from_env()
+        main._batch_unsupported_at = None
+
+    def tearDown(self):
+        main._batch_unsupported_at = None
+        self.server.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def apply(self, *names, apply_changes=main.apply_changes):
+        """Create A records for ``names``, returning the number of batch probes it took"""
+        fqdns = {f"{name}.{self.api.domain}" for name in names}
+        changes = main.plan_changes(fqdns, {"A": "198.51.100.7"}, {})
+        self.api.reset_counters()
+        results = apply_changes(self.api.zone, self.client, changes)
+        self.assertTrue(all(result["ok"] for result in results))
+        # Every write is a POST: one per record, plus the batch probe
+        return self.api.requests_by_method.get("POST", 0) - len(names)
+
+    def test_probe_is_remembered_in_process(self):
+        self.assertEqual(self.apply("a", "b"), 1)
+        self.assertEqual(self.apply("c", "d"), 0)
+
+    def test_probe_is_remembered_across_runs(self):
+        self.assertEqual(self.apply("a", "b"), 1)
+        self.assertIsNotNone(state.load_batch_unsupported(self.state_file))
+        # A new process starts without the in-memory flag
+        main._batch_unsupported_at = None
+        self.assertEqual(self.apply("c", "d"), 0)
+
+    def test_async_writers_remember_the_probe(self):
+        import pipeline
+
+        def apply_changes(zone, client, changes):
+            return asyncio.run(pipeline.apply_changes(zone, client, changes))
+        self.assertEqual(self.apply("a", "b", apply_changes=apply_changes), 1)
+        self.assertIsNotNone(state.load_batch_unsupported(self.state_file))
+        main._batch_unsupported_at = None
+        self.assertEqual(self.apply("c", "d", apply_changes=apply_changes), 0)
+
+    def test_endpoint_is_probed_again_after_a_while(self):
+        state.save_batch_unsupported(self.state_file, time.time() - state.BATCH_REPROBE_AFTER - 1)
+        self.assertEqual(self.apply("a", "b"), 1)
+
+    def test_snapshot_keeps_the_probe_result(self):
+        self.apply("a", "b")
+        state.save_snapshot(self.state_file, self.api.zone, {"A": "198.51.100.7"}, "digest", {})
+        self.assertIsNotNone(state.load_batch_unsupported(self.state_file))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Tests for the Caddyfile lexer and site address parser."""
+
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import caddyfile
+
+def parse(text):
+    return caddyfile.parse(textwrap.dedent(text))
+
+class LexerTest(unittest.TestCase):
+    def test_quotes_backticks_and_comments(self):
+        tokens = caddyfile.tokenize('respond "a \\"b\\" #c" `d e` # comment\nx#y\n')
+        self.assertEqual([(text, line) for text, line, _ in tokens],
+                         [("respond", 1), ('a "b" #c', 1), ("d e", 1), ("x#y", 2)])
+
+    def test_heredoc_is_one_token(self):
+        tokens = caddyfile.tokenize("respond <<HTML\n  <p>{\n  }</p>\n  HTML 200\nnext\n")
+        self.assertEqual([text.strip() for text, _, _ in tokens], ["respond", "<p>{\n  }</p>", "200", "next"])
+        self.assertEqual(tokens[-1][1], 5)
+
+    def test_unterminated_heredoc(self):
+        with self.assertRaises(ValueError):
+            caddyfile.tokenize("respond <<EOF\nno end\n")
+
+class ParserTest(unittest.TestCase):
+    def test_site_addresses(self):
+        hosts = parse("""
+            example.com, www.example.com {
+                respond "hi"
+            }
+            https://api.example.com:8443/v1 http://old.example.com {
+                reverse_proxy localhost:8080
+            }
+            :8080, [::1]:80, {http.request.host} {
+                respond "no hosts here"
+            }
+        """)
+        self.assertEqual(hosts, {"example.com", "www.example.com", "api.example.com", "old.example.com"})
+
+    def test_only_top_level_blocks_are_sites(self):
+        hosts = parse("""
+            {
+                email admin@example.com
+                servers {
+                    protocols h1 h2
+                }
+            }
+            app.example.com {
+                handle_path /api/* {
+                    reverse_proxy backend.internal:9000 {
+                        header_up Host upstream.example.com
+                    }
+                }
+                respond <<TEXT
+                    not.a.site {
+                    }
+                    TEXT
+            }
+        """)
+        self.assertEqual(hosts, {"app.example.com"})
+
+    def test_brace_on_the_next_line(self):
+        self.assertEqual(parse("a.example.com b.example.com\n{\n  respond ok\n}\n"),
+                         {"a.example.com", "b.example.com"})
+
+    def test_braceless_caddyfile_is_one_site(self):
+        self.assertEqual(parse("single.example.com\nrespond ok\nfile_server\n"), {"single.example.com"})
+
+    def test_snippets_with_arguments(self):
+        hosts = parse("""
+            (site) {
+                {args[0]}.example.com {
+                    respond {args[1]}
+                }
+            }
+            (common) {
+                encode gzip
+            }
+            import site blog hi
+            import site shop hello
+            docs.example.com {
+                import common
+            }
+        """)
+        self.assertEqual(hosts, {"blog.example.com", "shop.example.com", "docs.example.com"})
+
+    def test_environment_placeholders(self):
+        with mock.patch.dict(os.environ, {"SITE_HOST": "env.example.com"}):
+            hosts = parse("""
+                {$SITE_HOST} {
+                    respond ok
+                }
+                {$MISSING_HOST:fallback.example.com} {
+                    respond ok
+                }
+            """)
+        self.assertEqual(hosts, {"env.example.com", "fallback.example.com"})
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            parse("a.example.com {\n  respond ok\n")
+        with self.assertRaises(ValueError):
+            parse("}\n")
+        with self.assertRaises(ValueError):
+            parse("(loop) {\n  import loop\n}\nimport loop\n")
+
+    def test_record_options_comment(self):
+        parser = caddyfile.CaddyfileParser()
+        parser.parse(textwrap.dedent("""
+            # cloudflare: proxied ttl=120
+            a.example.com {
+            }
+            b.example.com { # cloudflare: cname
+            }
+            c.example.com {
+            }
+        """))
+        self.assertEqual(parser.options, {"a.example.com": "proxied ttl=120", "b.example.com": "cname"})
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="caddy-parse-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        os.mkdir(os.path.join(self.directory, "sites"))
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(textwrap.dedent(content))
+        return path
+
+    def test_file_and_glob_imports(self):
+        self.write("sites/a.caddy", "a.example.com {\n  import ../common\n}\n")
+        self.write("sites/b.caddy", "(shared) {\n  b.example.com {\n  }\n}\nimport shared\n")
+        self.write("common", "encode gzip\n")
+        path = self.write("Caddyfile", "import sites/*.caddy\nimport common\nroot.example.com {\n}\n")
+        hosts, dependencies, _ = caddyfile.parse_file(path)
+        self.assertEqual(hosts, {"a.example.com", "b.example.com", "root.example.com"})
+        self.assertEqual(set(dependencies), {
+            os.path.join(self.directory, name) for name in ("Caddyfile", "common", "sites", "sites/a.caddy",
+                                                            "sites/b.caddy")})
+
+    def test_import_errors(self):
+        path = self.write("Caddyfile", "import missing\n")
+        with self.assertRaises(ValueError):
+            caddyfile.parse_file(path)
+        self.write("loop", "import Caddyfile\n")
+        path = self.write("Caddyfile", "import loop\n")
+        with self.assertRaises(ValueError):
+            caddyfile.parse_file(path)
+
+    def test_glob_matching_nothing_is_a_warning(self):
+        path = self.write("Caddyfile", "import sites/*.caddy\nsolo.example.com {\n}\n")
+        with self.assertLogs(caddyfile.logger, "WARNING"):
+            hosts, _, _ = caddyfile.parse_file(path)
+        self.assertEqual(hosts, {"solo.example.com"})
+
+if __name__ == "__main__":
+    unittest.main()
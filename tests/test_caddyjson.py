@@ -0,0 +1,67 @@
+"""Tests that the streaming (ijson) and decoded walks of a Caddy JSON config find the same hosts."""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import caddyjson
+from mock_caddy_admin import generate_config
+
+def route(*hosts, handle=()):
+    return {"match": [{"host": list(hosts)}], "handle": list(handle)}
+
+def subroute(*routes):
+    return {"handler": "subroute", "routes": list(routes)}
+
+CONFIG = {
+    "apps": {
+        "http": {
+            "servers": {
+                "srv0": {
+                    "routes": [
+                        route("www.example.net", "example.net"),
+                        route("app.example.net", handle=[subroute(route("api.example.net",
+                                                                         handle=[subroute(route("v2.example.net"))]))]),
+                        {"match": [{"not": [{"host": ["excluded.example.net"]}]}], "handle": []},
+                        {"match": [{"host": [42]}]},
+                        {"handle": [{"handler": "reverse_proxy", "handle_response": [
+                            {"match": {"status_code": [502]}, "routes": [route("response.example.net")]}]}]},
+                    ],
+                    "errors": {"routes": [route("errors.example.net")]},
+                    "named_routes": {"shared": route("named.example.net")},
+                },
+                "srv1": {"routes": [route("other.example.net")]},
+            },
+        },
+        "layer4": {"servers": {"srv0": {"routes": [route("tcp.example.net")]}}},
+    },
+}
+
+EXPECTED = {"www.example.net", "example.net", "app.example.net", "api.example.net", "v2.example.net",
+            "errors.example.net", "named.example.net", "other.example.net"}
+
+def stream(config):
+    return io.BytesIO(json.dumps(config).encode("utf-8"))
+
+class HostWalkTest(unittest.TestCase):
+    def test_decoded_walk(self):
+        self.assertEqual(set(caddyjson.iter_hosts_decoded(CONFIG)), EXPECTED)
+
+    @unittest.skipIf(caddyjson.ijson is None, "needs ijson")
+    def test_streaming_walk_matches_decoded(self):
+        self.assertEqual(set(caddyjson.iter_hosts_streaming(stream(CONFIG))), EXPECTED)
+
+    @unittest.skipIf(caddyjson.ijson is None, "needs ijson")
+    def test_generated_config_gives_the_same_hosts_both_ways(self):
+        config = generate_config(200)
+        self.assertEqual(sorted(caddyjson.iter_hosts_streaming(stream(config))),
+                         sorted(caddyjson.iter_hosts_decoded(config)))
+
+if __name__ == "__main__":
+    unittest.main()
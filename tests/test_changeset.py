@@ -0,0 +1,113 @@
+"""Tests for plan/apply mode against the mock Cloudflare API."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import changeset
+import ipdetect
+import main
+from mock_cloudflare import MockCloudflare, start_server
+
+IP = "198.51.100.7"
+
+class ChangesetTest(unittest.TestCase):
+    def setUp(self):
+        self.api = MockCloudflare()
+        self.server, base_url = start_server(self.api)
+        self.addCleanup(self.server.shutdown)
+        self.directory = tempfile.mkdtemp(prefix="caddy-changeset-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.caddyfile = os.path.join(self.directory, "Caddyfile")
+        self.plan_file = os.path.join(self.directory, "plan.json")
+        ip_cache = os.path.join(self.directory, "ip.json")
+        ipdetect.save_cached_ip(ip_cache, IP, time.time())
+        env = mock.patch.dict(os.environ, {
+            "CF_API_URL": base_url, "CF_API_TOKEN": "mock", "CF_ZONE_ID": self.api.zone, "CF_DOMAIN": self.api.domain,
+            "CF_MULTI_ZONE": "false", "STATE_FILE": os.path.join(self.directory, "state.json"),
+            "CADDYFILE_PATH": self.caddyfile, "IP_CACHE_FILE": ip_cache, "IP_CACHE_TTL": "86400", "IP_VERSIONS": "4",
+            "ZONE_CACHE_FILE": "", "RECORD_CACHE_FILE": "", "METRICS_TEXTFILE": "", "DOMAIN_DENY_PATTERNS": "",
+            "CF_RATE_LIMIT": "1000000", "CF_RATE_BURST": "1000000",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        main._client = None
+        main._domain_cache.clear()
+        self.addCleanup(setattr, main, "_client", None)
+
+    def write_sites(self, *names):
+        with open(self.caddyfile, "w", encoding="utf-8") as f:
+            for name in names:
+                f.write(f"{name}.{self.api.domain} {{\n    respond ok\n}}\n")
+
+    def plan(self):
+        self.assertEqual(changeset.cli(["plan", "--output", self.plan_file]), 0)
+        with open(self.plan_file, encoding="utf-8") as f:
+            return json.load(f)
+
+    def apply(self, plan=None):
+        if plan is not None:
+            with open(self.plan_file, "w", encoding="utf-8") as f:
+                json.dump(plan, f)
+        self.api.reset_counters()
+        return changeset.cli(["apply", "--plan", self.plan_file])
+
+    def test_plan_then_apply_without_a_second_listing(self):
+        self.write_sites("a", "b")
+        self.api.add_record("A", f"a.{self.api.domain}", "192.0.2.1")
+        plan = self.plan()
+        entry = plan["zones"][0]
+        self.assertEqual([data["name"] for data in entry["create"]], [f"b.{self.api.domain}"])
+        self.assertEqual([item["current"] for item in entry["update"]], ["192.0.2.1"])
+        self.assertEqual(self.api.find_record(f"a.{self.api.domain}")["content"], "192.0.2.1")
+
+        self.assertEqual(self.apply(), 0)
+        self.assertEqual(self.api.requests_by_method.get("GET", 0), 0)
+        self.assertEqual([self.api.find_record(f"{name}.{self.api.domain}")["content"] for name in "ab"], [IP, IP])
+        # The applied plan is recorded like a sync, so the next plan is empty
+        entry = self.plan()["zones"][0]
+        self.assertEqual((entry["create"], entry["update"], len(entry["unchanged"])), ([], [], 2))
+
+    def test_invalid_plan_applies_nothing(self):
+        self.write_sites("a", "b")
+        plan = self.plan()
+        plan["zones"][0]["create"][0]["content"] = "2001:db8::1"
+        plan["zones"][0]["create"][1]["name"] = "b.elsewhere.org"
+        plan["zones"][0]["update"].append({"id": "", "current": IP, "data": {**plan["zones"][0]["create"][0],
+                                                                             "name": f"c.{self.api.domain}",
+                                                                             "content": IP}})
+        problems = changeset.validate_plan(plan)
+        self.assertEqual(len(problems), 3, problems)
+        self.assertEqual(self.apply(plan), 1)
+        self.assertEqual(self.api.request_count, 0)
+        self.assertEqual(changeset.validate_plan({**plan, "version": 99})[0][:24], "unsupported plan version")
+
+    def test_plan_is_refused_after_another_sync(self):
+        self.write_sites("a")
+        self.plan()
+        self.write_sites("a", "b")
+        main.run_sync()
+        self.assertIsNotNone(self.api.find_record(f"b.{self.api.domain}"))
+        self.assertEqual(self.apply(), 1)
+        self.assertEqual(self.api.request_count, 0)
+
+    def test_record_gone_since_the_plan_is_a_failure(self):
+        self.write_sites("a")
+        self.api.add_record("A", f"a.{self.api.domain}", "192.0.2.1")
+        self.plan()
+        self.api.remove_record(f"a.{self.api.domain}")
+        self.assertEqual(self.apply(), 1)
+        self.assertIsNone(self.api.find_record(f"a.{self.api.domain}"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Tests for the Cloudflare client's retries, using a fake session."""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import cloudflare
+
+URL = "https://api.example.test/client/v4"
+
+def response(status, headers=None):
+    reply = requests.Response()
+    reply.status_code = status
+    reply.headers.update(headers or {})
+    reply._content = b"{}"
+    return reply
+
+def refused():
+    cause = NewConnectionError(None, "Failed to establish a new connection: [Errno 111] Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, URL, cause))
+
+class FakeSession:
+    """Returns (or raises) the given outcomes in order, recording each request's method"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.methods = []
+
+    def request(self, method, url, **kwargs):
+        self.methods.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return response(*outcome) if isinstance(outcome, tuple) else response(outcome)
+
+class FakeLimiter:
+    def __init__(self):
+        self.pauses = []
+
+    def acquire(self):
+        pass
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+class RequestRetryTest(unittest.TestCase):
+    def setUp(self):
+        sleep = mock.patch.object(cloudflare.time, "sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+        self.limiter = FakeLimiter()
+        self.client = cloudflare.CloudflareClient("token", base_url=URL, rate_limiter=self.limiter, max_retries=3)
+
+    def send(self, method, *outcomes):
+        self.client.session = FakeSession(*outcomes)
+        return self.client.request(method, "/zones")
+
+    def test_429_pauses_the_limiter_for_retry_after_and_retries_any_method(self):
+        for method in ("GET", "POST"):
+            with self.subTest(method=method):
+                self.limiter.pauses.clear()
+                reply = self.send(method, (429, {"Retry-After": "7"}), 200)
+                self.assertEqual(reply.status_code, 200)
+                self.assertEqual(self.limiter.pauses, [7.0])
+                self.assertEqual(self.client.session.methods, [method, method])
+
+    def test_idempotent_methods_are_retried_on_5xx_and_timeouts(self):
+        for method in ("GET", "PUT", "PATCH", "DELETE"):
+            with self.subTest(method=method):
+                reply = self.send(method, 502, requests.ReadTimeout("read timed out"), 200)
+                self.assertEqual(reply.status_code, 200)
+                self.assertEqual(len(self.client.session.methods), 3)
+
+    def test_post_is_not_retried_once_it_may_have_been_applied(self):
+        self.assertEqual(self.send("POST", 500, 200).status_code, 500)
+        with self.assertRaises(requests.ReadTimeout):
+            self.send("POST", requests.ReadTimeout("read timed out"), 200)
+        with self.assertRaises(requests.ConnectionError):
+            self.send("POST", requests.ConnectionError("Connection reset by peer"), 200)
+        self.assertEqual(len(self.client.session.methods), 1)
+
+    def test_post_is_retried_when_it_never_connected(self):
+        reply = self.send("POST", requests.ConnectTimeout("connect timed out"), refused(), 200)
+        self.assertEqual(reply.status_code, 200)
+        self.assertEqual(len(self.client.session.methods), 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.assertEqual(self.send("GET", 503, 503, 503, 503, 200).status_code, 503)
+        self.assertEqual(len(self.client.session.methods), 4)
+        with self.assertRaises(requests.ConnectionError):
+            self.send("GET", *[refused()] * 4, 200)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Tests for the daemon's memory bound (DAEMON_MAX_RSS_MB) and Caddy admin API polling."""
+
+import os
+import signal
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import daemon
+
+# Run in a fresh interpreter: raise the peak RSS to ~300 MB, release it,
+# then exec a daemon worker that reports what it would compare to the limit
+EXEC_AFTER_PEAK = """
+import os, sys
+block = bytearray(300 * 1024 * 1024)
+block[::4096] = b"x" * len(block[::4096])
+del block
+os.execv(sys.executable, [sys.executable, "-c", '''
+import sys
+sys.path.insert(0, {root!r})
+import daemon
+worker = daemon.SyncWorker(max_rss_mb=200)
+print(daemon.peak_rss_mb(), worker.memory_mb()[0])
+'''])
+"""
+
+class MemoryLimitTest(unittest.TestCase):
+    def check(self, worker):
+        with mock.patch.object(daemon.os, "execv") as execv, mock.patch.object(daemon.logsetup, "shutdown"), \
+                mock.patch.object(daemon.logging, "shutdown"):
+            worker._check_memory()
+        return execv.called
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc")
+    def test_fresh_exec_does_not_trip_the_limit(self):
+        env = dict(os.environ, LOG_FILE=os.devnull, LOG_LEVEL="WARNING")
+        output = subprocess.run([sys.executable, "-c", EXEC_AFTER_PEAK.format(root=ROOT)], env=env,
+                                check=True, capture_output=True, text=True).stdout
+        peak, measured = map(float, output.split())
+        # The exec'd process inherits the 300 MB peak but its own RSS is far below the limit
+        self.assertGreater(peak, 250)
+        self.assertLess(measured, 200)
+
+    def test_high_peak_with_low_current_rss_does_not_restart(self):
+        with mock.patch.object(daemon, "peak_rss_mb", return_value=313.0), \
+                mock.patch.object(daemon, "current_rss_mb", return_value=60.0):
+            self.assertFalse(self.check(daemon.SyncWorker(max_rss_mb=200)))
+
+    def test_current_rss_over_limit_restarts(self):
+        with mock.patch.object(daemon, "current_rss_mb", return_value=250.0):
+            self.assertTrue(self.check(daemon.SyncWorker(max_rss_mb=200)))
+
+    def test_without_proc_only_growth_since_start_counts(self):
+        with mock.patch.object(daemon, "current_rss_mb", return_value=None), \
+                mock.patch.object(daemon, "peak_rss_mb", return_value=313.0):
+            worker = daemon.SyncWorker(max_rss_mb=200)
+            self.assertFalse(self.check(worker))
+        with mock.patch.object(daemon, "current_rss_mb", return_value=None), \
+                mock.patch.object(daemon, "peak_rss_mb", return_value=540.0):
+            self.assertTrue(self.check(worker))
+
+class FakeWorker:
+    """Stands in for SyncWorker; sends SIGTERM to the daemon after ``limit`` requests"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.submits = 0
+        self.last_finished = None
+        self.handler = None
+
+    def start(self):
+        return self
+
+    def submit(self, event_time=None):
+        self.submits += 1
+        if self.submits == self.limit:
+            self.handler(signal.SIGTERM, None)
+
+    def stop(self, timeout=None):
+        return True
+
+class AdminPollTest(unittest.TestCase):
+    def run_daemon(self, worker, **env):
+        env = dict({"IP_CHECK_INTERVAL": "0", "RECONCILE_INTERVAL": "0", "METRICS_PORT": "0"}, **env)
+
+        def install(signum, handler):
+            worker.handler = handler
+
+        with mock.patch.dict(os.environ, env), mock.patch.object(daemon, "SyncWorker", return_value=worker), \
+                mock.patch.object(daemon.signal, "signal", side_effect=install):
+            daemon.run_daemon(None)
+
+    def test_polls_with_ip_checks_disabled(self):
+        # The initial sync plus two polls
+        worker = FakeWorker(limit=3)
+        self.run_daemon(worker, ADMIN_POLL_INTERVAL="0.05")
+        self.assertEqual(worker.submits, 3)
+
+    def test_non_positive_interval_is_rejected(self):
+        worker = FakeWorker(limit=1)
+        with self.assertRaises(SystemExit):
+            self.run_daemon(worker, ADMIN_POLL_INTERVAL="0")
+        self.assertEqual(worker.submits, 0)
+
+if __name__ == "__main__":
+    unittest.main()
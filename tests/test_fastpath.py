@@ -0,0 +1,38 @@
+"""Tests for the fast-path cron entry point."""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Run fastpath.py as cron would, with main replaced by a stub that reports how records are logged
+FULL_SYNC = """
+import logging, runpy, sys, types
+stub = types.ModuleType("main")
+def run_sync():
+    root = logging.getLogger()
+    print(" ".join(type(handler).__name__ for handler in root.handlers))
+    logging.getLogger("main").info("logged by the full sync")
+stub.run_sync = run_sync
+sys.modules["main"] = stub
+sys.path.insert(0, {root!r})
+runpy.run_path({path!r}, run_name="__main__")
+"""
+
+class FastPathTest(unittest.TestCase):
+    def test_full_sync_logs_through_the_queue(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, STATE_FILE=os.path.join(directory, "state.json"), LOG_LEVEL="INFO",
+                       LOG_FORMAT="text", METRICS_TEXTFILE="")
+            script = FULL_SYNC.format(root=ROOT, path=os.path.join(ROOT, "fastpath.py"))
+            run = subprocess.run([sys.executable, "-c", script], env=env, check=True, capture_output=True, text=True)
+        self.assertEqual(run.stdout.split(), ["QueueHandler"])
+        self.assertIn("Running a full sync: no current fast-path record", run.stderr)
+        # Flushed by the listener before exit
+        self.assertIn("logged by the full sync", run.stderr)
+
+if __name__ == "__main__":
+    unittest.main()
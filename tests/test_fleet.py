@@ -0,0 +1,171 @@
+"""Tests for the fleet aggregator: round-robin planning, reports and the authenticated HTTP API."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import fleet
+import main
+from mock_cloudflare import MockCloudflare, start_server
+
+TAG = "managed by caddy-cloudflare-updater"
+NAME = "www.example.net"
+
+def record(ip, comment=TAG, name=NAME):
+    return {"id": f"id-{name}-{ip}", "type": "A", "name": name, "content": ip, "ttl": 300, "proxied": False,
+            "comment": comment}
+
+class RoundRobinPlanTest(unittest.TestCase):
+    def plan(self, wanted, listed, comment=TAG):
+        listed_by_key = {}
+        for item in listed:
+            listed_by_key.setdefault((item["name"], "A"), []).append(item)
+        return fleet.plan_round_robin({(NAME, "A"): set(wanted)}, listed_by_key, comment)
+
+    def test_one_record_per_host_ip(self):
+        changes, stale = self.plan({"192.0.2.1", "192.0.2.2"}, [record("192.0.2.1")])
+        self.assertEqual([item["id"] for item in changes["unchanged"]], [f"id-{NAME}-192.0.2.1"])
+        self.assertEqual([data["content"] for data in changes["create"]], ["192.0.2.2"])
+        self.assertEqual((changes["update"], changes["delete"], stale), ([], [], []))
+
+    def test_surplus_records_are_rewritten_before_creating(self):
+        changes, _ = self.plan({"192.0.2.1", "192.0.2.2"}, [record("192.0.2.1"), record("192.0.2.9")])
+        self.assertEqual([(item["current"], item["data"]["content"]) for item in changes["update"]],
+                         [("192.0.2.9", "192.0.2.2")])
+        self.assertEqual(changes["create"], [])
+
+    def test_only_our_surplus_records_are_deleted(self):
+        changes, _ = self.plan({"192.0.2.1"}, [record("192.0.2.1"), record("192.0.2.8", comment=f"ops: {TAG}"),
+                                               record("192.0.2.9", comment="hand-made")])
+        self.assertEqual([item["id"] for item in changes["delete"]], [f"id-{NAME}-192.0.2.8"])
+
+    def test_duplicate_ips_keep_the_tagged_record(self):
+        changes, _ = self.plan({"192.0.2.1"}, [record("192.0.2.1", comment=None), record("192.0.2.1")])
+        self.assertEqual([item["id"] for item in changes["unchanged"]], [f"id-{NAME}-192.0.2.1"])
+        self.assertEqual(len(changes["delete"]), 0)
+
+    def test_names_nobody_serves_are_stale_when_ours(self):
+        listed = {(NAME, "A"): [record("192.0.2.1")], ("old.example.net", "A"): [record("192.0.2.1", name="old.example.net")],
+                  ("manual.example.net", "A"): [record("192.0.2.1", comment=None, name="manual.example.net")]}
+        _, stale = fleet.plan_round_robin({(NAME, "A"): {"192.0.2.1"}}, listed, TAG)
+        self.assertEqual([item["name"] for item in stale], ["old.example.net"])
+
+class FleetStateTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="caddy-fleet-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "fleet.json")
+        env = mock.patch.dict(os.environ, {"CF_DOMAIN": "example.net"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_reports_merge_into_round_robin_state(self):
+        state = fleet.Fleet(self.path)
+        self.assertTrue(state.report("h1", ["www", "api.example.net"], {"A": "192.0.2.1"}))
+        self.assertTrue(state.report("h2", ["www"], {"A": "192.0.2.2", "AAAA": "2001:db8::2"}))
+        self.assertFalse(state.report("h2", ["www"], {"A": "192.0.2.2", "AAAA": "2001:db8::2"}))
+        hosts, desired = state.take()
+        self.assertEqual(hosts, 2)
+        self.assertEqual(desired, {(NAME, "A"): {"192.0.2.1", "192.0.2.2"}, (NAME, "AAAA"): {"2001:db8::2"},
+                                   ("api.example.net", "A"): {"192.0.2.1"}})
+        self.assertFalse(state.dirty)
+        # Reports survive a restart
+        self.assertEqual(fleet.Fleet(self.path).take()[1], desired)
+
+    def test_silent_and_leaving_hosts_drop_out(self):
+        state = fleet.Fleet(self.path, host_ttl=60)
+        state.report("h1", ["www"], {"A": "192.0.2.1"})
+        state.report("h2", ["www"], {"A": "192.0.2.2"})
+        state.take()
+        with self.assertLogs(fleet.logger, "WARNING"):
+            self.assertEqual(state.expire(now=time.time() + 61), ["h1", "h2"])
+        state.report("h1", ["www"], {"A": "192.0.2.1"})
+        self.assertTrue(state.remove("h1"))
+        self.assertFalse(state.remove("h1"))
+        self.assertEqual(state.take(), (0, {}))
+
+class FleetApiTest(unittest.TestCase):
+    def setUp(self):
+        env = mock.patch.dict(os.environ, {"CF_DOMAIN": "example.net", "DOMAIN_DENY_PATTERNS": ""})
+        env.start()
+        self.addCleanup(env.stop)
+        self.fleet = fleet.Fleet()
+        server = ThreadingHTTPServer(("127.0.0.1", 0), fleet.make_handler(self.fleet, "s3cret"))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def put(self, body, token="s3cret", host="h1"):
+        headers = {"Authorization": f"Bearer {token}"} if token is not None else {}
+        return requests.put(f"{self.url}/v1/hosts/{host}", data=json.dumps(body), headers=headers, timeout=5)
+
+    def test_requests_need_the_bearer_token(self):
+        report = {"domains": [NAME], "ips": {"A": "192.0.2.1"}}
+        self.assertEqual(self.put(report, token=None).status_code, 401)
+        self.assertEqual(self.put(report, token="wrong").status_code, 401)
+        self.assertEqual(requests.get(f"{self.url}/v1/state", timeout=5).status_code, 401)
+        self.assertEqual(requests.delete(f"{self.url}/v1/hosts/h1", timeout=5).status_code, 401)
+        self.assertEqual(self.fleet.take(), (0, {}))
+
+    def test_report_state_and_leave(self):
+        reply = self.put({"domains": [NAME], "ips": {"A": "192.0.2.1"}})
+        self.assertEqual(reply.json(), {"changed": True, "pending": True})
+        self.assertFalse(self.put({"domains": [NAME], "ips": {"A": "192.0.2.1"}}).json()["changed"])
+        state = requests.get(f"{self.url}/v1/state", headers={"Authorization": "Bearer s3cret"}, timeout=5).json()
+        self.assertEqual(state["hosts"]["h1"]["ips"], {"A": "192.0.2.1"})
+        reply = requests.delete(f"{self.url}/v1/hosts/h1", headers={"Authorization": "Bearer s3cret"}, timeout=5)
+        self.assertEqual(reply.status_code, 200)
+        self.assertEqual(self.fleet.take(), (0, {}))
+
+    def test_invalid_reports_are_rejected(self):
+        for body in ({"domains": [NAME], "ips": {"A": "2001:db8::1"}}, {"domains": ["bad_host!"], "ips": {}},
+                     {"ips": {"A": "192.0.2.1"}}):
+            with self.subTest(body=body):
+                self.assertEqual(self.put(body).status_code, 400)
+        self.assertEqual(self.fleet.take(), (0, {}))
+
+class ReconcileTest(unittest.TestCase):
+    def test_hosts_share_a_name_round_robin(self):
+        api = MockCloudflare()
+        server, base_url = start_server(api)
+        self.addCleanup(server.shutdown)
+        state_file = os.path.join(tempfile.mkdtemp(prefix="caddy-fleet-"), "state.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(state_file), ignore_errors=True)
+        env = mock.patch.dict(os.environ, {
+            "CF_API_URL": base_url, "CF_API_TOKEN": "mock", "CF_ZONE_ID": api.zone, "CF_DOMAIN": api.domain,
+            "CF_MULTI_ZONE": "false", "STATE_FILE": state_file, "METRICS_TEXTFILE": "", "DOMAIN_DENY_PATTERNS": "",
+            "CF_RATE_LIMIT": "1000000", "CF_RATE_BURST": "1000000",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        main._client = None
+        self.addCleanup(setattr, main, "_client", None)
+
+        state = fleet.Fleet()
+        state.report("h1", ["www"], {"A": "192.0.2.1"})
+        state.report("h2", ["www"], {"A": "192.0.2.2"})
+        self.assertEqual(fleet.reconcile(state)["created"], 2)
+        state.remove("h2")
+        summary = fleet.reconcile(state)
+        self.assertEqual((summary["deleted"], summary["unchanged"]), (1, 1))
+        with api.lock:
+            contents = [item["content"] for item in api.records.values() if item["name"] == NAME]
+        self.assertEqual(contents, ["192.0.2.1"])
+
+if __name__ == "__main__":
+    unittest.main()
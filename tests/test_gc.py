@@ -0,0 +1,91 @@
+"""Tests for ownership tagging and stale record garbage collection."""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import main
+
+ZONE = "example.net"
+TAG = "managed by caddy-cloudflare-updater"
+ADDRESSES = {"A": "198.51.100.7"}
+
+def record(name, comment=None, content="198.51.100.7", rec_id=None):
+    return {"id": rec_id or f"id-{name}", "type": "A", "name": name, "content": content, "ttl": 300,
+            "proxied": False, "comment": comment}
+
+class OwnerTagTest(unittest.TestCase):
+    def plan(self, *records, fqdns=("www.example.net",)):
+        existing = {(item["name"], "A"): item for item in records}
+        return main.plan_changes(set(fqdns), ADDRESSES, existing, comment=TAG)
+
+    def test_tag_is_appended_to_an_existing_comment(self):
+        changes = self.plan(record("www.example.net", "web server, ask ops"))
+        self.assertEqual([item["data"]["comment"] for item in changes["update"]], [f"web server, ask ops {TAG}"])
+
+    def test_untagged_record_without_a_comment_gets_the_tag(self):
+        changes = self.plan(record("www.example.net"))
+        self.assertEqual([item["data"]["comment"] for item in changes["update"]], [TAG])
+
+    def test_tag_inside_a_longer_comment_counts_as_ours(self):
+        changes = self.plan(record("www.example.net", f"web server, ask ops {TAG}"))
+        self.assertEqual(changes["update"], [])
+        self.assertEqual(len(changes["unchanged"]), 1)
+
+    def test_content_change_keeps_the_comment(self):
+        changes = self.plan(record("www.example.net", f"ops: {TAG}", content="192.0.2.1"))
+        self.assertEqual([item["data"]["comment"] for item in changes["update"]], [f"ops: {TAG}"])
+
+    def test_orphans_are_found_by_containment(self):
+        records = [record("www.example.net", TAG), record("old.example.net", f"ops: {TAG}"),
+                   record("manual.example.net", "hand-made")]
+        existing, owned = main.collect_existing(records, {"www.example.net"}, {"A"}, TAG)
+        self.assertEqual(set(existing), {("www.example.net", "A")})
+        self.assertEqual(owned, {("old.example.net", "A"): "id-old.example.net"})
+
+class StaleDeleteTest(unittest.TestCase):
+    def hold(self, count, mode, limit="50"):
+        changes = {"create": [], "update": [], "unchanged": [],
+                   "delete": [{"id": f"id-{i}", "name": f"old{i}.{ZONE}", "type": "A"} for i in range(count)]
+                   + [{"id": "conflict", "name": f"www.{ZONE}", "type": "AAAA", "conflict": True}]}
+        with mock.patch.dict(os.environ, {"DELETE_STALE_RECORDS": mode, "MAX_STALE_DELETES": limit}):
+            held = main.hold_stale_deletes(ZONE, changes)
+        return [item["id"] for item in changes["delete"]], held
+
+    def test_deletes_run_when_enabled(self):
+        applied, held = self.hold(3, "true")
+        self.assertEqual(len(applied), 4)
+        self.assertEqual(held, [])
+
+    def test_dry_run_logs_and_keeps_only_conflicts(self):
+        with self.assertLogs(main.logger, "INFO") as logs:
+            applied, held = self.hold(3, "dry-run")
+        self.assertEqual(applied, ["conflict"])
+        self.assertEqual(len(held), 3)
+        self.assertEqual(sum("[dry-run] Would delete" in line for line in logs.output), 3)
+
+    def test_disabled_by_default(self):
+        applied, held = self.hold(3, "false")
+        self.assertEqual(applied, ["conflict"])
+        self.assertEqual(len(held), 3)
+
+    def test_more_than_max_stale_deletes_deletes_none(self):
+        with self.assertLogs(main.logger, "WARNING"):
+            applied, held = self.hold(6, "true", limit="5")
+        self.assertEqual(applied, ["conflict"])
+        self.assertEqual(len(held), 6)
+        self.assertEqual(len(self.hold(6, "true", limit="0")[0]), 7)
+
+    def test_owned_orphans_are_planned_as_stale_deletes(self):
+        existing, owned = main.collect_existing([record("old.example.net", TAG)], {"www.example.net"}, {"A"}, TAG)
+        with mock.patch.dict(os.environ, {"DELETE_STALE_RECORDS": "true"}):
+            changes, _ = main.plan_zone(ZONE, {"www.example.net"}, ADDRESSES, None, existing, owned, TAG)
+        self.assertIn({"id": "id-old.example.net", "name": "old.example.net", "type": "A"}, changes["delete"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Tests for hostname validation and normalization."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import hostnames
+
+class HostnameValidatorTest(unittest.TestCase):
+    def setUp(self):
+        self.validator = hostnames.HostnameValidator(deny_patterns="")
+
+    def test_valid_hostnames(self):
+        for host in ("example.com", "www.example.com", "a-b.c-d.example.org", "*.example.com", "xn--d1acufc.xn--p1ai",
+                     "example.com.", "WWW.Example.COM", "1password.com", f"{'a' * 63}.example.com"):
+            with self.subTest(host=host):
+                self.assertTrue(self.validator.is_valid(host))
+
+    def test_invalid_hostnames(self):
+        for host in ("", ".example.com", "localhost", "com", "-a.example.com", "a-.example.com", "a..example.com",
+                     "a_b.example.com", "example.123", "*.*.example.com", "www.*.example.com", "192.168.1.10",
+                     f"{'a' * 64}.example.com", ".".join(["a" * 63] * 4) + ".com", "site.example.com:443"):
+            with self.subTest(host=host):
+                self.assertFalse(self.validator.is_valid(host))
+
+    def test_normalized_to_lowercase_punycode(self):
+        self.assertEqual(self.validator.normalize("WWW.Example.com."), "www.example.com")
+        self.assertEqual(self.validator.normalize("bücher.example.com"), "xn--bcher-kva.example.com")
+
+    def test_deny_patterns(self):
+        default = hostnames.HostnameValidator()
+        self.assertFalse(default.is_valid("example.org"))
+        self.assertFalse(default.is_valid("server.pem"))
+        self.assertFalse(default.is_valid("localhost.localdomain"))
+        self.assertTrue(default.is_valid("www.example.org"))
+        validator = hostnames.HostnameValidator(deny_patterns="*.internal.example.com, staging-*")
+        self.assertTrue(validator.is_valid("example.org"))
+        self.assertFalse(validator.is_valid("db.internal.example.com"))
+        self.assertFalse(validator.is_valid("staging-api.example.com"))
+
+    def test_public_suffix_list(self):
+        directory = tempfile.mkdtemp(prefix="caddy-psl-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "public_suffix_list.dat")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("// comment\ncom\nuk\nco.uk\n*.ck\n!www.ck\n")
+        validator = hostnames.HostnameValidator(deny_patterns="", public_suffixes=hostnames.PublicSuffixList.load(path))
+        for host, valid in (("example.com", True), ("example.co.uk", True), ("co.uk", False), ("example.dev", False),
+                            ("foo.bar.ck", True), ("bar.ck", False), ("www.ck", True), ("*.example.co.uk", True)):
+            with self.subTest(host=host):
+                self.assertEqual(validator.is_valid(host), valid)
+
+    def test_results_are_memoized(self):
+        self.validator.normalize.cache_clear()
+        for _ in range(3):
+            self.validator.is_valid("www.example.com")
+        info = self.validator.normalize.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Tests for public IP detection: source fallback, quorum and the on-disk cache."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import ipdetect
+
+class FakeSession:
+    """Answers each source URL with the given address, or fails for an exception"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queried = []
+
+    def get(self, url, timeout=None):
+        self.queried.append(url)
+        answer = self.answers[url]
+        if isinstance(answer, Exception):
+            raise answer
+        reply = requests.Response()
+        reply.status_code = 200
+        reply._content = f"{answer}\n".encode()
+        return reply
+
+class PublicIpTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="caddy-ip-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.cache_file = os.path.join(directory, "ip.json")
+        env = mock.patch.dict(os.environ, {"IP_CACHE_FILE": self.cache_file, "IP_SOURCES": "https://a,https://b,https://c",
+                                           "IP_QUORUM": "2", "IP_CACHE_TTL": "300", "IP_TIMEOUT": "2"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def detect(self, answers, force=False, version=4):
+        session = FakeSession(answers)
+        return ipdetect.get_public_ip(session, force=force, version=version), session
+
+    def test_failed_and_wrong_sources_are_outvoted(self):
+        (ip, previous), _ = self.detect({"https://a": requests.ConnectionError("down"),
+                                         "https://b": "198.51.100.7", "https://c": "198.51.100.7"})
+        self.assertEqual((ip, previous), ("198.51.100.7", None))
+
+    def test_wrong_family_is_rejected(self):
+        (ip, _), _ = self.detect({"https://a": "2001:db8::1", "https://b": "198.51.100.7", "https://c": "198.51.100.7"})
+        self.assertEqual(ip, "198.51.100.7")
+
+    def test_without_a_quorum_the_most_reported_address_wins(self):
+        with self.assertLogs(ipdetect.logger, "WARNING"):
+            (ip, _), _ = self.detect({"https://a": requests.ConnectionError("down"),
+                                      "https://b": requests.ConnectionError("down"), "https://c": "198.51.100.7"})
+        self.assertEqual(ip, "198.51.100.7")
+
+    def test_cached_address_is_used_within_the_ttl(self):
+        answers = {"https://a": "198.51.100.7", "https://b": "198.51.100.7", "https://c": "198.51.100.7"}
+        self.detect(answers)
+        (ip, previous), session = self.detect(answers)
+        self.assertEqual((ip, previous), ("198.51.100.7", "198.51.100.7"))
+        self.assertEqual(session.queried, [])
+        # force skips the cache and reports the change
+        changed = dict.fromkeys(answers, "203.0.113.9")
+        (ip, previous), session = self.detect(changed, force=True)
+        self.assertEqual((ip, previous), ("203.0.113.9", "198.51.100.7"))
+        self.assertTrue(session.queried)
+
+    def test_expired_cache_is_refreshed(self):
+        ipdetect.save_cached_ip(self.cache_file, "198.51.100.7", time.time() - 301)
+        (ip, previous), _ = self.detect(dict.fromkeys(("https://a", "https://b", "https://c"), "203.0.113.9"))
+        self.assertEqual((ip, previous), ("203.0.113.9", "198.51.100.7"))
+
+    def test_last_known_address_is_reused_when_every_source_fails(self):
+        down = dict.fromkeys(("https://a", "https://b", "https://c"), requests.ConnectionError("down"))
+        with self.assertLogs(ipdetect.logger, "WARNING"), self.assertRaises(RuntimeError):
+            self.detect(down)
+        ipdetect.save_cached_ip(self.cache_file, "198.51.100.7", time.time() - 3600)
+        with self.assertLogs(ipdetect.logger, "WARNING"):
+            (ip, _), _ = self.detect(down)
+        self.assertEqual(ip, "198.51.100.7")
+
+    def test_families_are_cached_separately(self):
+        with mock.patch.dict(os.environ, {"IP6_SOURCES": "https://a6", "IP_QUORUM": "1"}):
+            (ip6, _), _ = self.detect({"https://a6": "2001:db8::1"}, version=6)
+            (ip4, _), _ = self.detect(dict.fromkeys(("https://a", "https://b", "https://c"), "198.51.100.7"))
+        self.assertEqual((ip4, ip6), ("198.51.100.7", "2001:db8::1"))
+        self.assertEqual(ipdetect.load_cached_ip(self.cache_file, 6)[0], "2001:db8::1")
+        self.assertEqual(ipdetect.load_cached_ip(self.cache_file, 4)[0], "198.51.100.7")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Tests for the metrics textfile carrying totals across cron runs."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import metrics
+
+class TextfileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="caddy-metrics-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, "caddy_updater.prom")
+        self.new_process()
+        self.addCleanup(self.new_process)
+
+    def new_process(self):
+        """Forget every sample, as a new cron run starts"""
+        for metric in metrics._registry:
+            metric.values.clear()
+        metrics._restored.clear()
+
+    def run_once(self, result="success", status="200", duration=0.3):
+        self.new_process()
+        metrics.SYNCS.inc(result=result)
+        metrics.API_REQUESTS.inc(2, method="GET", status=status)
+        metrics.PHASE_SECONDS.observe(duration, phase="total")
+        metrics.write_textfile(self.path)
+
+    def samples(self):
+        return {(name, tuple(sorted(labels.items()))): value for name, labels, value in metrics._read_samples(self.path)}
+
+    def test_counters_add_up_across_runs(self):
+        self.run_once()
+        self.run_once()
+        self.run_once(result="failure", status="error")
+        samples = self.samples()
+        self.assertEqual(samples[("caddy_updater_syncs_total", (("result", "success"),))], 2)
+        self.assertEqual(samples[("caddy_updater_syncs_total", (("result", "failure"),))], 1)
+        self.assertEqual(samples[("caddy_updater_cloudflare_requests_total",
+                                  (("method", "GET"), ("status", "200")))], 4)
+
+    def test_histograms_add_up_across_runs(self):
+        self.run_once(duration=0.3)
+        self.run_once(duration=7)
+        samples = self.samples()
+        phase = (("phase", "total"),)
+        self.assertEqual(samples[("caddy_updater_phase_duration_seconds_count", phase)], 2)
+        self.assertAlmostEqual(samples[("caddy_updater_phase_duration_seconds_sum", phase)], 7.3)
+        self.assertEqual(samples[("caddy_updater_phase_duration_seconds_bucket", (("le", "0.5"),) + phase)], 1)
+        self.assertEqual(samples[("caddy_updater_phase_duration_seconds_bucket", (("le", "10"),) + phase)], 2)
+        self.assertEqual(samples[("caddy_updater_phase_duration_seconds_bucket", (("le", "+Inf"),) + phase)], 2)
+
+    def test_later_writes_of_one_process_do_not_count_twice(self):
+        self.run_once()
+        metrics.SYNCS.inc(result="success")
+        metrics.write_textfile(self.path)
+        metrics.write_textfile(self.path)
+        self.assertEqual(self.samples()[("caddy_updater_syncs_total", (("result", "success"),))], 2)
+
+    def test_last_success_is_kept_by_a_run_that_failed(self):
+        self.new_process()
+        metrics.LAST_SUCCESS.set(1700000000)
+        metrics.write_textfile(self.path)
+        self.run_once(result="failure")
+        self.assertEqual(self.samples()[("caddy_updater_last_success_timestamp_seconds", ())], 1700000000)
+
+    def test_unreadable_file_starts_from_zero(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('caddy_updater_syncs_total{result="success"} 5\ncaddy_updater_syncs_total{result="failure"} x\n')
+        with self.assertLogs(metrics.logger, "WARNING"):
+            self.run_once()
+        self.assertEqual(self.samples()[("caddy_updater_syncs_total", (("result", "success"),))], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests for the client-side token bucket, Retry-After parsing and retry backoff."""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import ratelimit
+
+def response(status, headers=None):
+    reply = requests.Response()
+    reply.status_code = status
+    reply.headers.update(headers or {})
+    reply._content = b"{}"
+    return reply
+
+class TokenBucketTest(unittest.TestCase):
+    def test_bucket_stays_within_the_window_budget(self):
+        with mock.patch.dict(os.environ, {"CF_RATE_LIMIT": "1200", "CF_RATE_WINDOW": "300", "CF_RATE_BURST": "100"}):
+            bucket = ratelimit.TokenBucket.from_env()
+        self.assertEqual(bucket.capacity, 100)
+        self.assertLessEqual(bucket.capacity + bucket.rate * 300, 1200)
+
+    def test_zero_limit_disables_limiting(self):
+        with mock.patch.dict(os.environ, {"CF_RATE_LIMIT": "0"}):
+            bucket = ratelimit.TokenBucket.from_env()
+        start = time.monotonic()
+        for _ in range(100):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_burst_then_refill(self):
+        bucket = ratelimit.TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_pause_holds_every_caller(self):
+        bucket = ratelimit.TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+class BackoffTest(unittest.TestCase):
+    def test_retry_after_header(self):
+        self.assertEqual(ratelimit.retry_after(response(429, {"Retry-After": "3"})), 3.0)
+        self.assertIsNone(ratelimit.retry_after(response(429)))
+        self.assertIsNone(ratelimit.retry_after(response(429, {"Retry-After": "soon"})))
+
+    def test_backoff_grows_and_is_capped(self):
+        self.assertLessEqual(ratelimit.backoff_delay(0), 0.5)
+        self.assertGreaterEqual(ratelimit.backoff_delay(3), 2.0)
+        self.assertLessEqual(ratelimit.backoff_delay(20), 30.0)
+
+if __name__ == "__main__":
+    unittest.main()
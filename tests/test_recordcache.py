@@ -0,0 +1,105 @@
+"""Tests for the on-disk zone record cache and drift detection."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import main
+import metrics
+import recordcache
+
+ZONE = "zone"
+
+def record(name, content="198.51.100.7", record_type="A", **fields):
+    return {"id": f"id-{name}-{record_type}", "type": record_type, "name": name, "content": content,
+            "ttl": 300, "proxied": False, "comment": None, **fields}
+
+class RecordCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="caddy-records-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "records.json")
+        env = mock.patch.dict(os.environ, {"RECORD_CACHE_FILE": self.path, "RECORD_CACHE_TTL": "3600"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_listing_round_trip(self):
+        listing = [record("a.example.net"), record("a.example.net", "2001:db8::1", "AAAA"), record("mx", "x", "MX")]
+        self.assertEqual(recordcache.save_listing(self.path, ZONE, listing, {"A", "AAAA"}), [])
+        records, _ = recordcache.load(self.path, ZONE, {"A"})
+        self.assertEqual(set(records), {("a.example.net", "A"), ("a.example.net", "AAAA")})
+        self.assertEqual(records[("a.example.net", "A")]["id"], "id-a.example.net-A")
+        # A listing of fewer types cannot stand in for more
+        self.assertIsNone(recordcache.load(self.path, ZONE, {"A", "CNAME"}))
+        self.assertIsNone(recordcache.load(self.path, "other", {"A"}))
+
+    def test_expires_after_the_ttl(self):
+        recordcache.save_listing(self.path, ZONE, [record("a.example.net")], {"A"})
+        with mock.patch.dict(os.environ, {"RECORD_CACHE_TTL": "0"}):
+            self.assertIsNone(recordcache.load(self.path, ZONE, {"A"}))
+
+    def test_drift_between_listings(self):
+        recordcache.save_listing(self.path, ZONE, [record("a.example.net"), record("b.example.net"),
+                                                   record("c.example.net"), record("d.example.net")], {"A"})
+        drift = recordcache.save_listing(self.path, ZONE, [
+            record("a.example.net", "203.0.113.9"), record("b.example.net"), record("c.example.net", ttl=60),
+            record("e.example.net"), record("e.example.net", "x", "TXT"),
+        ], {"A"})
+        self.assertEqual(drift, [
+            ("changed", "a.example.net", "A", "198.51.100.7 -> 203.0.113.9"),
+            ("changed", "c.example.net", "A", "198.51.100.7, ttl 300 -> 60"),
+            ("deleted", "d.example.net", "A", "198.51.100.7"),
+            ("created", "e.example.net", "A", "198.51.100.7"),
+        ])
+
+    def test_writes_are_applied_to_the_cached_copy(self):
+        recordcache.save_listing(self.path, ZONE, [record("a.example.net"), record("b.example.net")], {"A"})
+        written = {("a.example.net", "A"): {"type": "A", "name": "a.example.net", "content": "203.0.113.9",
+                                            "ttl": 300, "proxied": False},
+                   ("c.example.net", "A"): {"type": "A", "name": "c.example.net", "content": "203.0.113.9",
+                                            "ttl": 300, "proxied": False}}
+        results = [
+            {"action": "update", "name": "a.example.net", "type": "A", "id": "id-a.example.net-A", "ok": True},
+            {"action": "create", "name": "c.example.net", "type": "A", "id": "new", "ok": True},
+            {"action": "delete", "name": "b.example.net", "type": "A", "id": "id-b.example.net-A", "ok": True},
+        ]
+        recordcache.apply_results(self.path, ZONE, results, written)
+        records, _ = recordcache.load(self.path, ZONE, {"A"})
+        self.assertEqual({key: (data["id"], data["content"]) for key, data in records.items()}, {
+            ("a.example.net", "A"): ("id-a.example.net-A", "203.0.113.9"),
+            ("c.example.net", "A"): ("new", "203.0.113.9"),
+        })
+
+    def test_listing_reports_drift(self):
+        metrics.RECORD_DRIFT.values.clear()
+        self.addCleanup(metrics.RECORD_DRIFT.values.clear)
+        main.existing_from_listing(ZONE, iter([record("a.example.net")]), {"a.example.net"}, {"A"}, None)
+        with self.assertLogs(main.logger, "WARNING"):
+            existing, _ = main.existing_from_listing(ZONE, iter([record("a.example.net", "203.0.113.9")]),
+                                                     {"a.example.net"}, {"A"}, None)
+        self.assertEqual(existing[("a.example.net", "A")]["content"], "203.0.113.9")
+        self.assertEqual(metrics.RECORD_DRIFT.values, {("changed",): 1})
+
+    def test_listing_streams_without_the_cache(self):
+        seen = []
+
+        def collect_existing(records, *args):
+            seen.append(records)
+            return {}, {}
+        listing = iter([record("a.example.net")])
+        with mock.patch.object(main, "collect_existing", collect_existing):
+            with mock.patch.dict(os.environ, {"RECORD_CACHE_FILE": ""}):
+                main.existing_from_listing(ZONE, listing, {"a.example.net"}, {"A"}, None)
+            main.existing_from_listing(ZONE, iter([record("a.example.net")]), {"a.example.net"}, {"A"}, None)
+        self.assertIs(seen[0], listing)
+        self.assertIsInstance(seen[1], list)
+
+if __name__ == "__main__":
+    unittest.main()
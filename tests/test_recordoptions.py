@@ -0,0 +1,94 @@
+"""Tests for resolving per-site record options against a zone."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import main
+import state
+
+ZONE = "example.net"
+ADDRESSES = {"A": "198.51.100.7"}
+TAG = "managed by caddy-cloudflare-updater"
+
+class ApexCnameTest(unittest.TestCase):
+    def options(self, mapping, fqdns):
+        directory = tempfile.mkdtemp(prefix="caddy-options-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "options.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(mapping, f)
+        env = {"RECORD_OPTIONS_FILE": path, "DOMAIN_DENY_PATTERNS": "",
+               "CADDYFILE_PATH": os.path.join(directory, "Caddyfile")}
+        with mock.patch.dict(os.environ, env):
+            return main.get_site_options(set(fqdns), ZONE)
+
+    def test_apex_keeps_address_records(self):
+        for cname in ("@", "origin.example.com", "www.example.net"):
+            with self.subTest(cname=cname), self.assertLogs(main.logger, "WARNING"):
+                _, options = self.options({ZONE: {"cname": cname}}, [ZONE, "www.example.net"])
+                self.assertIsNone(options[ZONE].cname)
+
+    def test_apex_records_are_not_replaced_or_deleted(self):
+        with self.assertLogs(main.logger, "WARNING"):
+            fqdns, options = self.options({"*": {"cname": "origin.example.com"}}, [ZONE, "www.example.net"])
+        self.assertIsNone(options[ZONE].cname)
+        self.assertEqual(options["www.example.net"].cname, "origin.example.com")
+        existing = {(ZONE, "A"): {"id": "apex", "type": "A", "content": ADDRESSES["A"], "ttl": 300,
+                                  "proxied": False}}
+        changes = main.plan_changes(fqdns, ADDRESSES, existing, options=options)
+        self.assertEqual(changes["delete"], [])
+        self.assertEqual([item["id"] for item in changes["update"]], [])
+        self.assertEqual([(item["name"], item["type"]) for item in changes["create"]], [("www.example.net", "CNAME")])
+
+    def test_cname_to_the_apex_still_works_for_other_sites(self):
+        _, options = self.options({"www.example.net": {"cname": "@"}}, ["www.example.net"])
+        self.assertEqual(options["www.example.net"].cname, ZONE)
+        self.assertIsNone(options[ZONE].cname)
+
+    def apex(self, content=ADDRESSES["A"], comment="hand-made"):
+        return {(ZONE, "A"): {"id": "apex", "type": "A", "name": ZONE, "content": content, "ttl": 300,
+                              "proxied": False, "comment": comment}}
+
+    def test_cname_target_is_not_tagged(self):
+        fqdns, options = self.options({"www.example.net": {"cname": "@"}}, ["www.example.net"])
+        self.assertTrue(options[ZONE].target)
+        changes = main.plan_changes(fqdns, ADDRESSES, self.apex(), comment=TAG, options=options)
+        self.assertEqual([item["id"] for item in changes["unchanged"]], ["apex"])
+        self.assertEqual([item["name"] for item in changes["create"]], ["www.example.net"])
+        self.assertEqual([data.get("comment") for data in changes["create"]], [TAG])
+
+    def test_cname_target_update_keeps_its_comment(self):
+        fqdns, options = self.options({"www.example.net": {"cname": "@"}}, ["www.example.net"])
+        changes = main.plan_changes(fqdns, ADDRESSES, self.apex(content="192.0.2.1"), comment=TAG, options=options)
+        self.assertEqual([item["data"]["comment"] for item in changes["update"]], ["hand-made"])
+
+    def test_configured_apex_is_tagged(self):
+        fqdns, options = self.options({"www.example.net": {"cname": "@"}}, [ZONE, "www.example.net"])
+        self.assertFalse(options[ZONE].target)
+        changes = main.plan_changes(fqdns, ADDRESSES, self.apex(), comment=TAG, options=options)
+        self.assertEqual([item["data"]["comment"] for item in changes["update"]], [f"hand-made {TAG}"])
+
+    def test_cname_target_is_not_garbage_collected(self):
+        fqdns, options = self.options({"www.example.net": {"cname": "@"}}, ["www.example.net"])
+        state_file = os.path.join(tempfile.mkdtemp(prefix="caddy-state-"), "state.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(state_file), ignore_errors=True)
+        with mock.patch.dict(os.environ, {"STATE_FILE": state_file, "DELETE_STALE_RECORDS": "true"}):
+            changes = main.plan_changes(fqdns, ADDRESSES, self.apex(), comment=TAG, options=options)
+            applied = {"A": {ZONE: "apex"}, "CNAME": {"www.example.net": "www"}}
+            main.finish_zone("zone", fqdns, ADDRESSES, changes, applied, [], None, options)
+            snapshot = state.load_snapshot(state_file, "zone")
+            self.assertEqual(snapshot["targets"], [ZONE])
+            # The CNAME site is gone; its record is stale but the apex is not
+            changes, _ = main.plan_zone("zone", {"api.example.net"}, ADDRESSES, snapshot, {}, {}, TAG)
+        self.assertEqual([(item["name"], item["type"]) for item in changes["delete"]], [("www.example.net", "CNAME")])
+
+if __name__ == "__main__":
+    unittest.main()
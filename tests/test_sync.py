@@ -0,0 +1,127 @@
+"""End-to-end syncs against the mock Cloudflare API: snapshots, dual-stack and multi-zone."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import main
+import state
+from mock_cloudflare import MockCloudflare, start_server
+
+OLD_IP = "198.51.100.7"
+NEW_IP = "203.0.113.9"
+IPV6 = "2001:db8::7"
+
+class SyncTestCase(unittest.TestCase):
+    """Syncs through main.sync_to_cloudflare() against a fresh mock zone and state file"""
+
+    def setUp(self):
+        self.api = MockCloudflare()
+        self.server, base_url = start_server(self.api)
+        self.addCleanup(self.server.shutdown)
+        self.directory = tempfile.mkdtemp(prefix="caddy-sync-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.state_file = os.path.join(self.directory, "state.json")
+        env = mock.patch.dict(os.environ, {
+            "CF_API_URL": base_url, "CF_API_TOKEN": "mock", "CF_ZONE_ID": self.api.zone, "CF_DOMAIN": self.api.domain,
+            "CF_MULTI_ZONE": "false", "STATE_FILE": self.state_file, "ZONE_CACHE_FILE": "", "RECORD_CACHE_FILE": "",
+            "METRICS_TEXTFILE": "", "DOMAIN_DENY_PATTERNS": "", "CF_RATE_LIMIT": "1000000",
+            "CF_RATE_BURST": "1000000", "DELETE_STALE_RECORDS": "false",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        main._client = None
+        main._synced_zones.clear()
+        self.addCleanup(setattr, main, "_client", None)
+
+    def sync(self, names, ips):
+        self.api.reset_counters()
+        return main.sync_to_cloudflare(set(names), ips)
+
+    def content(self, name, record_type="A"):
+        record = self.api.find_record(f"{name}.{self.api.domain}", record_type)
+        return record and record["content"]
+
+class SnapshotTest(SyncTestCase):
+    def test_unchanged_sync_makes_no_requests(self):
+        summary = self.sync(["a", "b"], OLD_IP)
+        self.assertEqual(summary["created"], 2)
+        summary = self.sync(["a", "b"], OLD_IP)
+        self.assertEqual(self.api.request_count, 0)
+        self.assertEqual((summary["created"], summary["updated"], summary["unchanged"]), (0, 0, 2))
+
+    def test_ip_change_writes_without_listing_the_zone(self):
+        self.sync(["a", "b"], OLD_IP)
+        summary = self.sync(["a", "b"], NEW_IP)
+        self.assertEqual(summary["updated"], 2)
+        self.assertEqual(self.api.requests_by_method.get("GET", 0), 0)
+        self.assertEqual((self.content("a"), self.content("b")), (NEW_IP, NEW_IP))
+
+    def test_new_domain_invalidates_the_snapshot(self):
+        self.sync(["a"], OLD_IP)
+        summary = self.sync(["a", "c"], OLD_IP)
+        self.assertEqual((summary["created"], summary["unchanged"]), (1, 1))
+        self.assertGreater(self.api.requests_by_method.get("GET", 0), 0)
+
+    def test_record_removed_out_of_band_is_recreated(self):
+        self.sync(["a", "b"], OLD_IP)
+        self.api.remove_record(f"a.{self.api.domain}")
+        summary = self.sync(["a", "b"], NEW_IP)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual((self.content("a"), self.content("b")), (NEW_IP, NEW_IP))
+
+    def test_old_snapshot_forces_a_full_reconcile(self):
+        self.sync(["a"], OLD_IP)
+        self.api.edit_record(f"a.{self.api.domain}", content=NEW_IP)
+        snapshot = state.load_snapshot(self.state_file, self.api.zone)
+        state.save_snapshot(self.state_file, self.api.zone, snapshot["ips"], snapshot["domains_hash"],
+                            snapshot["records"], synced_at=time.time() - 7200)
+        with mock.patch.dict(os.environ, {"STATE_MAX_AGE": "3600"}):
+            summary = self.sync(["a"], OLD_IP)
+        self.assertEqual(summary["updated"], 1)
+        self.assertEqual(self.content("a"), OLD_IP)
+
+class DualStackTest(SyncTestCase):
+    def test_plan_covers_both_families(self):
+        changes = main.plan_changes({"a.example.net"}, {"A": OLD_IP, "AAAA": IPV6}, {})
+        self.assertEqual(sorted((data["type"], data["content"]) for data in changes["create"]),
+                         [("A", OLD_IP), ("AAAA", IPV6)])
+
+    def test_one_family_changes_alone(self):
+        summary = self.sync(["a", "b"], {"A": OLD_IP, "AAAA": IPV6})
+        self.assertEqual(summary["created"], 4)
+        summary = self.sync(["a", "b"], {"A": NEW_IP, "AAAA": IPV6})
+        self.assertEqual((summary["updated"], summary["unchanged"]), (2, 2))
+        self.assertEqual((self.content("a"), self.content("a", "AAAA")), (NEW_IP, IPV6))
+
+    def test_undetected_family_is_left_alone(self):
+        self.sync(["a"], {"A": OLD_IP, "AAAA": IPV6})
+        summary = self.sync(["a", "b"], {"A": OLD_IP})
+        self.assertEqual(summary["created"], 1)
+        self.assertEqual(self.content("a", "AAAA"), IPV6)
+        self.assertIsNone(self.content("b", "AAAA"))
+        # The family comes back without losing track of its records
+        summary = self.sync(["a", "b"], {"A": OLD_IP, "AAAA": IPV6})
+        self.assertEqual((summary["created"], summary["unchanged"]), (1, 3))
+
+class MultiZoneTest(SyncTestCase):
+    def test_domains_go_to_their_longest_suffix_zone(self):
+        child = self.api.add_zone(f"dev.{self.api.domain}")
+        with mock.patch.dict(os.environ, {"CF_MULTI_ZONE": "true"}):
+            summary = self.sync([f"www.{self.api.domain}", f"api.dev.{self.api.domain}", "www.unknown.org"], OLD_IP)
+        self.assertEqual(summary["created"], 2)
+        self.assertEqual(self.api.find_record(f"www.{self.api.domain}")["zone_id"], self.api.zone)
+        self.assertEqual(self.api.find_record(f"api.dev.{self.api.domain}")["zone_id"], child)
+        self.assertIsNone(self.api.find_record("www.unknown.org"))
+
+if __name__ == "__main__":
+    unittest.main()
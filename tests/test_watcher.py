@@ -0,0 +1,142 @@
+"""Tests for the Caddyfile watcher: coalescing and the editor save patterns of bench_watcher."""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import bench_watcher
+from watcher import CoalescingScheduler, start_observer
+
+class CoalescingSchedulerTest(unittest.TestCase):
+    def test_requests_during_a_run_fold_into_one_trailing_run(self):
+        runs = []
+        running = threading.Event()
+        release = threading.Event()
+
+        def action():
+            runs.append(time.monotonic())
+            running.set()
+            release.wait(5)
+            return True
+
+        scheduler = CoalescingScheduler(action, name="test-coalescing").start()
+        try:
+            scheduler.submit()
+            self.assertTrue(running.wait(5))
+            last_request = time.monotonic()
+            for _ in range(10):
+                scheduler.submit()
+            release.set()
+            deadline = time.monotonic() + 5
+            while len(runs) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.2)
+        finally:
+            scheduler.stop(5)
+        self.assertEqual(len(runs), 2)
+        self.assertGreaterEqual(runs[1], last_request)
+
+    def test_failed_run_does_not_stop_the_worker(self):
+        results = []
+        done = threading.Event()
+
+        def action():
+            if not results:
+                results.append("raised")
+                raise FileNotFoundError("Caddyfile")
+            results.append("ran")
+            done.set()
+            return True
+
+        scheduler = CoalescingScheduler(action, name="test-failure").start()
+        try:
+            scheduler.submit()
+            deadline = time.monotonic() + 5
+            while not results and time.monotonic() < deadline:
+                time.sleep(0.01)
+            scheduler.submit()
+            self.assertTrue(done.wait(5))
+        finally:
+            scheduler.stop(5)
+        self.assertEqual(results, ["raised", "ran"])
+
+class SavePatternTest(unittest.TestCase):
+    """Every editor save pattern ends in exactly one sync that starts after the last write and reads it"""
+
+    def check(self, pattern):
+        # Saves are 0.05-0.1s apart, well inside the settle time, so they coalesce into one trailing sync
+        synced, final, last_write = bench_watcher.replay(pattern, settle=0.25, sync_time=0.1, edits=2)
+        trailing = [content for started, content in synced if started >= last_write]
+        self.assertEqual(trailing, [final], f"{pattern.__name__}: syncs after the last write read {trailing!r}")
+
+    def test_in_place(self):
+        self.check(bench_watcher.in_place)
+
+    def test_atomic_rename(self):
+        self.check(bench_watcher.atomic_rename)
+
+    def test_vim_backup(self):
+        self.check(bench_watcher.vim_backup)
+
+    def test_delete_recreate(self):
+        self.check(bench_watcher.delete_recreate)
+
+    def test_configmap_swap(self):
+        self.check(bench_watcher.configmap_swap)
+
+    def test_burst(self):
+        self.check(bench_watcher.burst)
+
+class ImportTest(unittest.TestCase):
+    """Edits to imported files outside the Caddyfile's directory request a sync too"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="caddy-watch-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        for name in ("config", "sites", "more"):
+            os.mkdir(os.path.join(self.directory, name))
+        self.caddyfile = os.path.join(self.directory, "config", "Caddyfile")
+        self.write(self.caddyfile, "import ../sites/*\n")
+        self.write(os.path.join(self.directory, "sites", "a"), "a.example.net {\n}\n")
+        self.changes = []
+        self.observer = start_observer(self.caddyfile, self.changes.append)
+        self.addCleanup(self.observer.join, 5)
+        self.addCleanup(self.observer.stop)
+
+    def write(self, path, content):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def wait_for_change(self, path, content):
+        count = len(self.changes)
+        # Distinct mtimes even on coarse filesystem clocks
+        time.sleep(0.05)
+        self.write(path, content)
+        deadline = time.monotonic() + 5
+        while len(self.changes) == count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(len(self.changes), count, f"no sync requested after writing {path}")
+
+    def test_edit_to_an_imported_file(self):
+        self.wait_for_change(os.path.join(self.directory, "sites", "a"), "a.example.net b.example.net {\n}\n")
+
+    def test_new_file_matching_an_import_glob(self):
+        self.wait_for_change(os.path.join(self.directory, "sites", "b"), "b.example.net {\n}\n")
+
+    def test_import_added_by_an_edit(self):
+        more = os.path.join(self.directory, "more", "c")
+        self.write(more, "c.example.net {\n}\n")
+        self.wait_for_change(self.caddyfile, "import ../sites/*\nimport ../more/c\n")
+        self.wait_for_change(more, "c.example.net d.example.net {\n}\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for longest-suffix zone resolution and the zone index cache."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import zones
+
+class ZoneIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = zones.ZoneIndex({"example.co.uk": "parent", "b.example.co.uk": "child", "Example.NET.": "net"})
+
+    def test_longest_suffix_wins(self):
+        self.assertEqual(self.index.resolve("a.b.example.co.uk"), ("b.example.co.uk", "child"))
+        self.assertEqual(self.index.resolve("b.example.co.uk"), ("b.example.co.uk", "child"))
+        self.assertEqual(self.index.resolve("c.example.co.uk"), ("example.co.uk", "parent"))
+
+    def test_names_are_case_and_trailing_dot_insensitive(self):
+        self.assertEqual(self.index.resolve("WWW.example.net."), ("example.net", "net"))
+
+    def test_suffix_must_match_whole_labels(self):
+        self.assertEqual(self.index.resolve("notexample.net"), (None, None))
+        self.assertEqual(self.index.resolve("co.uk"), (None, None))
+
+    def test_group(self):
+        grouped, unmatched = self.index.group({"a.b.example.co.uk", "www.example.co.uk", "example.net", "other.org"})
+        self.assertEqual(grouped, {"child": ("b.example.co.uk", {"a.b.example.co.uk"}),
+                                   "parent": ("example.co.uk", {"www.example.co.uk"}),
+                                   "net": ("example.net", {"example.net"})})
+        self.assertEqual(unmatched, {"other.org"})
+
+class ZoneCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="caddy-zones-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "zones.json")
+
+    def test_round_trip_within_ttl(self):
+        zones.save_index(self.path, zones.ZoneIndex({"example.net": "net"}))
+        index = zones.load_cached_index(self.path, ttl=60)
+        self.assertTrue(index.from_cache)
+        self.assertEqual(index.resolve("www.example.net"), ("example.net", "net"))
+
+    def test_expired_or_unreadable_cache_is_ignored(self):
+        zones.save_index(self.path, zones.ZoneIndex({"example.net": "net"}, fetched_at=time.time() - 120))
+        self.assertIsNone(zones.load_cached_index(self.path, ttl=60))
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("{")
+        with self.assertLogs(zones.logger, "WARNING"):
+            self.assertIsNone(zones.load_cached_index(self.path, ttl=60))
+        self.assertIsNone(zones.load_cached_index(None, ttl=60))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,82 +3,247 @@ import os
 import sys
 import time
 import logging
+import threading
 import subprocess
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+import caddyfile
+import logsetup
+
 # Configure logging
-log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-log_file = os.getenv("LOG_FILE", "./caddy-updater.log")
-logging.basicConfig(
-    level=getattr(logging, log_level),
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(log_file)
-    ]
-)
+logsetup.configure(log_file=os.getenv("LOG_FILE", "./caddy-updater.log"), stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
+def run_sync_subprocess(timeout=300):
+    """Run main.py in a fresh interpreter, returning True on success"""
+    try:
+        # Use the current Python executable and correct path
+        python_exe = sys.executable
+        main_py_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        
+        result = subprocess.run(
+            [python_exe, main_py_path], 
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            timeout=timeout
+        )
+        # The child formats its own lines (and sync id) with the same settings
+        for line in result.stdout.splitlines():
+            logsetup.relay(logger, line)
+        
+        if result.returncode == 0:
+            logger.info("DNS sync completed successfully", extra=logsetup.DETAIL)
+            return True
+        
+        logger.error("DNS sync failed with exit code %s", result.returncode)
+            
+    except subprocess.TimeoutExpired:
+        logger.error("DNS sync timed out after %s seconds", timeout)
+    except Exception as e:
+        logger.error("Failed to run DNS sync: %s", e)
+    return False
+
+class CoalescingScheduler:
+    """Runs ``action`` on one background thread, coalescing requests (trailing edge).
+
+    A request marks a run as pending; the worker waits until no new request
+    has arrived for ``settle`` seconds, then runs the action. Requests that
+    arrive while it runs fold into a single follow-up run, so at most one run
+    is active and at most one is queued, and the last change is always
+    picked up by a run that starts after it.
+    """
+
+    def __init__(self, action=None, settle=0.0, name="sync-worker"):
+        self.action = action
+        self.settle = settle
+        self.last_finished = None
+        self._pending = None
+        self._last_request = 0.0
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, event_time=None):
+        """Request a run; ``event_time`` is the triggering event's monotonic timestamp"""
+        now = time.monotonic()
+        if event_time is None:
+            event_time = now
+        with self._cond:
+            if self._pending is None or event_time < self._pending:
+                self._pending = event_time
+            self._last_request = now
+            self._cond.notify()
+
+    def stop(self, timeout=None):
+        """Let an in-flight run finish, drop any queued one, and stop the worker thread"""
+        with self._cond:
+            self._stopping = True
+            if self._pending is not None:
+                logger.info("Dropping queued sync on shutdown")
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                # Trailing edge: keep waiting while requests are still arriving
+                while not self._stopping and (remaining := self._last_request + self.settle - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+                event_time, self._pending = self._pending, None
+            try:
+                result = self.run()
+            except Exception:
+                # A failed run must not stop the worker, or later changes would never sync
+                logger.exception("Sync failed")
+                result = False
+            self.last_finished = time.monotonic()
+            self.completed(event_time, result)
+
+    def run(self):
+        return self.action()
+
+    def completed(self, event_time, result):
+        """Called after each run with its earliest event time and the action's result"""
+
+def file_signature(path):
+    """Identity of the file ``path`` resolves to; changes on in-place edits, renames and symlink swaps"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.realpath(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
 class CaddyfileChangeHandler(FileSystemEventHandler):
-    def __init__(self, path):
+    """Requests a sync whenever the watched file, or a file it imports, may have changed.
+
+    Every event in a watched directory re-checks the signature of the file
+    and its imports rather than matching event paths, so atomic-rename
+    saves (``on_moved``/``on_created``), delete-and-recreate editors and
+    Kubernetes ConfigMap symlink swaps are all seen. The imports are
+    parsed again after each change, as an edit may add or remove some.
+    """
+
+    def __init__(self, path, on_change):
         self.path = path
-        self.last_sync = 0
-        self.debounce_seconds = 5  # Prevent multiple rapid syncs
+        # Called with the event's monotonic timestamp
+        self.on_change = on_change
+        # Called with this handler when an import brings new directories to watch (set by start_observer)
+        self.on_dependencies = None
+        self._lock = threading.Lock()
+        self.dependencies = self.read_dependencies()
+        self.signature = self.current_signature()
 
-    def on_modified(self, event):
-        if event.src_path == self.path:
-            current_time = time.time()
-            
-            # Debounce rapid file changes
-            if current_time - self.last_sync < self.debounce_seconds:
-                logger.debug(f"Ignoring rapid file change (debounce)")
+    def read_dependencies(self):
+        """Files read and directories globbed by the Caddyfile's imports, itself included"""
+        try:
+            return caddyfile.parse_file(self.path)[1]
+        except (OSError, ValueError):
+            # Watch the file alone until it parses again; the sync reports the error
+            return ()
+
+    def current_signature(self):
+        return (file_signature(self.path),) + caddyfile.files_signature(self.dependencies)
+
+    def directories(self):
+        """Directories whose events can change the signature"""
+        directories = {os.path.dirname(os.path.abspath(self.path))}
+        for path in self.dependencies:
+            directories.add(path if os.path.isdir(path) else os.path.dirname(path))
+        return directories
+
+    def on_any_event(self, event):
+        if event.is_directory and event.event_type == "modified":
+            return
+        event_time = time.monotonic()
+        signature = self.current_signature()
+        with self._lock:
+            if signature[0] is None or signature == self.signature:
                 return
-                
-            logger.info(f"Caddyfile changed: {self.path}")
-            self.last_sync = current_time
-            
-            try:
-                # Use the current Python executable and correct path
-                python_exe = sys.executable
-                main_py_path = os.path.join(os.path.dirname(__file__), "main.py")
-                
-                result = subprocess.run(
-                    [python_exe, main_py_path], 
-                    capture_output=True, 
-                    text=True,
-                    timeout=300  # 5 minute timeout
-                )
-                
-                if result.returncode == 0:
-                    logger.info("DNS sync completed successfully")
-                else:
-                    logger.error(f"DNS sync failed with exit code {result.returncode}")
-                    logger.error(f"Error output: {result.stderr}")
-                    
-            except subprocess.TimeoutExpired:
-                logger.error("DNS sync timed out after 5 minutes")
-            except Exception as e:
-                logger.error(f"Failed to run DNS sync: {e}")
-
-def watch(path):
-    """Watch Caddyfile for changes and trigger DNS sync"""
-    if not os.path.exists(path):
-        logger.error(f"Caddyfile not found at {path}")
+            self.dependencies = self.read_dependencies()
+            self.signature = self.current_signature()
+        if self.on_dependencies is not None:
+            self.on_dependencies(self)
+        logger.info("Caddyfile changed: %s (%s)", self.path, event.event_type)
+        self.on_change(event_time)
+
+class CaddyfileSetChangeHandler(CaddyfileChangeHandler):
+    """Requests a sync when any file of a Caddyfile directory or glob, or a file one imports, changes"""
+
+    def __init__(self, path, on_change):
+        # Re-parses only the files that changed since the last event
+        self.file_set = caddyfile.CaddyfileSet(path)
+        super().__init__(path, on_change)
+
+    def read_dependencies(self):
+        self.file_set.refresh()
+        return tuple(sorted({path for entry in self.file_set.entries.values() for path in entry[0]}))
+
+    def current_signature(self):
+        files = tuple(file_signature(path) for path in caddyfile.expand_file_set(self.path))
+        return (files,) + caddyfile.files_signature(self.dependencies)
+
+def start_observer(path, on_change):
+    """Start a watchdog observer calling ``on_change`` when the file at ``path`` or one it imports changes.
+
+    A directory or glob ``path`` is watched recursively from its root; the
+    directories of imported files outside it are watched as well.
+    """
+    observer = Observer()
+    if caddyfile.is_file_set(path):
+        event_handler = CaddyfileSetChangeHandler(path, on_change)
+        root = os.path.abspath(caddyfile.file_set_root(path))
+        observer.schedule(event_handler, path=root, recursive=True)
+    else:
+        event_handler = CaddyfileChangeHandler(path, on_change)
+        root = None
+    watched = set()
+
+    def watch_dependencies(handler):
+        for directory in sorted(handler.directories() - watched):
+            watched.add(directory)
+            if root is not None and (directory == root or directory.startswith(root + os.sep)):
+                continue
+            if os.path.isdir(directory):
+                observer.schedule(handler, path=directory, recursive=False)
+
+    watch_dependencies(event_handler)
+    event_handler.on_dependencies = watch_dependencies
+    observer.start()
+    logger.info("Watching %s for changes...", path)
+    return observer
+
+def watch(path, on_change=None):
+    """Watch Caddyfile for changes and trigger DNS sync.
+
+    ``on_change`` receives each change's monotonic timestamp; by default
+    changes go through a CoalescingScheduler running subprocess syncs,
+    settling for WATCH_SETTLE_SECONDS after the last event.
+    """
+    if not os.path.exists(caddyfile.file_set_root(path)):
+        logger.error("Caddyfile not found at %s", path)
         sys.exit(1)
+
+    if on_change is None:
+        settle = float(os.getenv("WATCH_SETTLE_SECONDS", "1"))
+        on_change = CoalescingScheduler(run_sync_subprocess, settle=settle).start().submit
         
-    observer = Observer()
-    event_handler = CaddyfileChangeHandler(path)
-    observer.schedule(event_handler, path=os.path.dirname(path), recursive=False)
-    
+    observer = start_observer(path, on_change)
     try:
-        observer.start()
-        logger.info(f"Watching {path} for changes...")
-          # Run initial sync
+        # Run initial sync
         logger.info("Running initial DNS sync...")
-        python_exe = sys.executable
-        main_py_path = os.path.join(os.path.dirname(__file__), "main.py")
-        subprocess.run([python_exe, main_py_path])
+        on_change(time.monotonic())
         
         # Keep watching
         while True:
@@ -88,7 +253,7 @@ def watch(path):
         logger.info("Received interrupt signal, stopping watcher...")
         observer.stop()
     except Exception as e:
-        logger.error(f"Watcher error: {e}")
+        logger.error("Watcher error: %s", e)
         observer.stop()
         sys.exit(1)
     finally:
@@ -0,0 +1,79 @@
+"""
+Hostname to Cloudflare zone resolution for multi-zone syncs.
+
+The zones an API token can access are listed once and cached on disk; each
+hostname is then mapped to the zone with the longest matching suffix, so
+``a.b.example.co.uk`` lands in ``b.example.co.uk`` when the token can see
+both that zone and ``example.co.uk``.
+"""
+
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ZONE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".caddy-updater-zones.json")
+
+class ZoneIndex:
+    """Maps zone names to zone ids and resolves hostnames by longest suffix"""
+
+    def __init__(self, zones, fetched_at=None, from_cache=False):
+        self.zones = {name.lower().rstrip('.'): zone_id for name, zone_id in zones.items()}
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.from_cache = from_cache
+
+    def resolve(self, hostname):
+        """Return (zone_name, zone_id) for the longest zone suffix of hostname, or (None, None)"""
+        labels = hostname.lower().rstrip('.').split('.')
+        # Walk from the full name towards the TLD so the first hit is the longest match
+        for i in range(len(labels)):
+            candidate = '.'.join(labels[i:])
+            zone_id = self.zones.get(candidate)
+            if zone_id:
+                return candidate, zone_id
+        return None, None
+
+    def group(self, hostnames):
+        """Split hostnames into {zone_id: (zone_name, {hostnames})} and a set of unmatched names"""
+        grouped = {}
+        unmatched = set()
+        for hostname in hostnames:
+            zone_name, zone_id = self.resolve(hostname)
+            if zone_id is None:
+                unmatched.add(hostname)
+                continue
+            grouped.setdefault(zone_id, (zone_name, set()))[1].add(hostname)
+        return grouped, unmatched
+
+def get_zone_cache_file():
+    """Return the zone cache path, or None when caching is disabled (ZONE_CACHE_FILE="")"""
+    return os.getenv("ZONE_CACHE_FILE", DEFAULT_ZONE_CACHE_FILE) or None
+
+def load_cached_index(path, ttl):
+    """Load a cached ZoneIndex no older than ``ttl`` seconds, or None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable zone cache %s: %s", path, e)
+        return None
+    fetched_at = cached.get("fetched_at", 0)
+    if time.time() - fetched_at > ttl:
+        return None
+    return ZoneIndex(cached.get("zones") or {}, fetched_at=fetched_at, from_cache=True)
+
+def save_index(path, index):
+    """Atomically write the zone index to the cache file"""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"fetched_at": index.fetched_at, "zones": index.zones}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write zone cache %s: %s", path, e)